@@ -155,17 +155,12 @@ class PoseToPoseGUI(QWidget):
         if not self.simulation:
             self.stop_motors()
 
-    def motor_left(self, speed):
-        sb.setMotor(2, -speed)
-        sb.setMotor(4, -speed)
-
-    def motor_right(self, speed):
-        sb.setMotor(1, -speed)
-        sb.setMotor(3, -speed)
+    def set_motor_speeds(self, left_speed, right_speed):
+        # Left wheels are motors 2/4, right wheels 1/3; one write for all four
+        sb.setMotors(-left_speed, -right_speed, -left_speed, -right_speed)
 
     def stop_motors(self):
-        for m in [1, 2, 3, 4]:
-            sb.setMotor(m, 0)
+        sb.setMotors(0, 0, 0, 0)
 
     def controlLoop(self):
         global x, y, heading, tracking_enabled, current_wp_index
@@ -229,8 +224,7 @@ class PoseToPoseGUI(QWidget):
             left_speed = max(-100, min(100, base_speed - diff))
             right_speed = max(-100, min(100, base_speed + diff))
 
-            self.motor_left(int(left_speed))
-            self.motor_right(int(right_speed))
+            self.set_motor_speeds(int(left_speed), int(right_speed))
 
         trajectory.append((x, y))
         self.updatePlot()
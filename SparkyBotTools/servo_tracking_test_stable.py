@@ -1,4 +1,4 @@
-from sparkybotio import setServoAngle, getServoAngle
+from sparkybotio import ServoTrajectory
 import cv2
 import numpy as np
 
@@ -8,13 +8,19 @@ delay_time =  10
 # Initialize camera
 cap = cv2.VideoCapture(0)
 
-# Function to set pitch servo angle
-def set_pitch_angle(angle):
-    setServoAngle(1, int(angle))
+# The trajectory player streams timed moves to the servo controller on its
+# own thread, so the vision loop only updates the target. max_speed limits
+# the slew rate (pulse units per second) in place of a low-pass filter.
+servo_player = ServoTrajectory(segment_time=0.05, lead=0.01, max_speed=1000)
 
-# Function to set yaw servo angle
-def set_yaw_angle(angle):
-    setServoAngle(2, int(angle))
+# Function to convert a servo angle to a pulse
+def angle_to_pulse(angle):
+    angle = max(0, min(180, angle))
+    return int(angle / 180 * 2000) + 500
+
+# Function to convert a servo pulse to an angle
+def pulse_to_angle(pulse):
+    return (pulse - 500) * 0.09
 
 # Constants for frame dimensions and servo movement range
 FRAME_WIDTH = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -28,13 +34,8 @@ YAW_ANGLE_RANGE = 180    # Maximum angle for yaw servo
 pitch_angle_now = 90
 yaw_angle_now = 90
 
-set_pitch_angle(pitch_angle_now)
-set_yaw_angle(yaw_angle_now)
-
-# Filter alpha value for smoothing
-alpha = 0.05
-filtered_pitch_angle = pitch_angle_now
-filtered_yaw_angle = yaw_angle_now
+servo_player.play([(0.5, {1: angle_to_pulse(pitch_angle_now), 2: angle_to_pulse(yaw_angle_now)})])
+servo_player.wait()
 
 while True:
     # Capture frame-by-frame
@@ -75,18 +76,13 @@ while True:
         print(normalized_error_x, normalized_error_y)
         
         # Convert normalized error values to angles for pitch and yaw servos
-        pitch_angle_now = getServoAngle(1)
-        yaw_angle_now = getServoAngle(2)
+        pitch_angle_now = pulse_to_angle(servo_player.position(1))
+        yaw_angle_now = pulse_to_angle(servo_player.position(2))
         pitch_angle = pitch_angle_now + normalized_error_y * PITCH_ANGLE_RANGE/2
         yaw_angle =  yaw_angle_now + normalized_error_x * YAW_ANGLE_RANGE/2
 
-        # Apply low-pass filter to smooth angles
-        filtered_pitch_angle = alpha * pitch_angle + (1 - alpha) * filtered_pitch_angle
-        filtered_yaw_angle = alpha * yaw_angle + (1 - alpha) * filtered_yaw_angle
-    
-        # Update servo positions
-        #set_pitch_angle(filtered_pitch_angle)
-        #set_yaw_angle(filtered_yaw_angle)
+        # Update servo targets (sent by the player thread, not here)
+        servo_player.follow({1: angle_to_pulse(pitch_angle), 2: angle_to_pulse(yaw_angle)})
             
     # Bitwise-AND mask and original image
     res = cv2.bitwise_and(frame, frame, mask=mask)
@@ -99,5 +95,6 @@ while True:
         break
 
 # Release the camera and close all windows
+servo_player.stop()
 cap.release()
 cv2.destroyAllWindows()
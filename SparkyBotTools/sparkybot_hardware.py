@@ -281,35 +281,33 @@ class MainWindow(QMainWindow):
         # Set the default section size (cell height)
         self.sensor_table_view.verticalHeader().setDefaultSectionSize(40)  # Adjust the cell height as needed
     
+        # Sensors are polled in the background; the timer only reads the history
+        self.sensor_sampler = sparkybotio.startSampler(ir_rate=200, distance_rate=20)
+
         # Timer for updating sensor display
         self.sensor_timer = QTimer(self)
         self.sensor_timer.timeout.connect(self.update_sensor_display)
         self.sensor_timer.start(500)  # Update every 500 milliseconds
 
     def update_sensor_display(self):
-        try:
-            line_data = sparkybotio.readInfrared()
-            distance = sparkybotio.readDistance()
-
-            # Merge all readings from the line tracking sensor into one string
-            line_sensor_readings = ' '.join([str(int(data)) for data in line_data])
-
-            # If model has no columns, set headers
-            if self.sensor_model.columnCount() == 0:
-                self.sensor_model.setColumnCount(2)  # Set column count to 2
-                self.sensor_model.setHorizontalHeaderLabels(["Sensor", "Readings"])
-
-            # Populate data into the table view with two rows
-            sensor_names = ["Line tracking sensor", "Ultrasonic sensor (mm)"]
-            for i, name in enumerate(sensor_names):
-                name_item = QStandardItem(name)
-                value_item = QStandardItem(line_sensor_readings if i < 1 else str(distance))  # Use the merged readings string
-                self.sensor_model.setItem(i, 0, name_item)
-                self.sensor_model.setItem(i, 1, value_item)
-
-        except OSError as e:
-            print("Error reading sensor data:", e)
-
+        # If model has no columns, set headers
+        if self.sensor_model.columnCount() == 0:
+            self.sensor_model.setColumnCount(2)  # Set column count to 2
+            self.sensor_model.setHorizontalHeaderLabels(["Sensor", "Readings"])
+
+        # Each sensor is shown on its own, "-" until it has a reading
+        line_sample = self.sensor_sampler.infrared.latest()
+        distance = self.sensor_sampler.distance.median(0.5)
+        # Merge all readings from the line tracking sensor into one string
+        line_sensor_readings = '-' if line_sample is None else ' '.join([str(int(data)) for data in line_sample[1]])
+        distance_reading = '-' if distance is None else str(int(distance))
+
+        # Populate data into the table view with two rows
+        sensor_names = ["Line tracking sensor", "Ultrasonic sensor (mm)"]
+        readings = [line_sensor_readings, distance_reading]
+        for i, name in enumerate(sensor_names):
+            self.sensor_model.setItem(i, 0, QStandardItem(name))
+            self.sensor_model.setItem(i, 1, QStandardItem(readings[i]))
 
     def hide_sensor_display(self):
         self.sensor_table_view.hide()
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+SparkyBot I/O library.
+
+The functions are split across submodules (motors, servos, sensors,
+buzzer, camera, ...) and re-exported here lazily: `import sparkybotio`
+only loads this file, and a submodule is imported the first time one of
+its names is used, e.g. `from sparkybotio import setMotors` loads the
+motor and I2C bus modules but not NumPy, OpenCV, pyserial or RPi.GPIO.
+"""
+
+import importlib
+
+
+# Public names provided by each submodule
+__SUBMODULES = {
+    'bus': (
+        'SMBusBackend', 'SimRobot', 'BusStats', 'I2CBus', 'getBus',
+        'enableStats', 'disableStats', 'getStats', 'setBackend',
+        'getBackend', 'getSimulator', 'CommandScheduler',
+        'startScheduler', 'stopScheduler', 'getScheduler',
+    ),
+    'motors': (
+        'setMotor', 'setMotors', 'stopMotors', 'getMotor',
+    ),
+    'servos': (
+        'setServoAngle', 'setServoPulse', 'setServosPulse',
+        'getServoAngle', 'getServoPulse',
+    ),
+    'trajectory': (
+        'ServoTrajectory',
+    ),
+    'busservo': (
+        'LOBOT_SERVO_MOVE_TIME_WRITE', 'LOBOT_SERVO_MOVE_TIME_READ',
+        'LOBOT_SERVO_MOVE_TIME_WAIT_WRITE',
+        'LOBOT_SERVO_MOVE_TIME_WAIT_READ', 'LOBOT_SERVO_MOVE_START',
+        'LOBOT_SERVO_MOVE_STOP', 'LOBOT_SERVO_ID_WRITE',
+        'LOBOT_SERVO_ID_READ', 'LOBOT_SERVO_ANGLE_OFFSET_ADJUST',
+        'LOBOT_SERVO_ANGLE_OFFSET_WRITE',
+        'LOBOT_SERVO_ANGLE_OFFSET_READ',
+        'LOBOT_SERVO_ANGLE_LIMIT_WRITE', 'LOBOT_SERVO_ANGLE_LIMIT_READ',
+        'LOBOT_SERVO_VIN_LIMIT_WRITE', 'LOBOT_SERVO_VIN_LIMIT_READ',
+        'LOBOT_SERVO_TEMP_MAX_LIMIT_WRITE',
+        'LOBOT_SERVO_TEMP_MAX_LIMIT_READ', 'LOBOT_SERVO_TEMP_READ',
+        'LOBOT_SERVO_VIN_READ', 'LOBOT_SERVO_POS_READ',
+        'LOBOT_SERVO_OR_MOTOR_MODE_WRITE',
+        'LOBOT_SERVO_OR_MOTOR_MODE_READ',
+        'LOBOT_SERVO_LOAD_OR_UNLOAD_WRITE',
+        'LOBOT_SERVO_LOAD_OR_UNLOAD_READ', 'LOBOT_SERVO_LED_CTRL_WRITE',
+        'LOBOT_SERVO_LED_CTRL_READ', 'LOBOT_SERVO_LED_ERROR_WRITE',
+        'LOBOT_SERVO_LED_ERROR_READ', 'LOBOT_SERVO_BROADCAST_ID',
+        'BUS_SERVO_FIELDS', 'BusServoDriver', 'setBusServoPort',
+        'getBusServoDriver', 'readBusServos', 'setBusServoID',
+        'getBusServoID', 'setBusServoPulse', 'stopBusServo',
+        'setBusServoDeviation', 'saveBusServoDeviation',
+        'getBusServoDeviation', 'setBusServoAngleLimit',
+        'getBusServoAngleLimit', 'setBusServoVinLimit',
+        'getBusServoVinLimit', 'setBusServoMaxTemp',
+        'getBusServoTempLimit', 'getBusServoPulse', 'getBusServoTemp',
+        'getBusServoVin', 'restBusServoPulse', 'unloadBusServo',
+        'getBusServoLoadStatus',
+    ),
+    'sensors': (
+        'readInfrared', 'readDistance', 'getDistanceErrors',
+    ),
+    'sampler': (
+        'RingBuffer', 'SensorSampler', 'startSampler', 'stopSampler',
+        'getSampler',
+    ),
+    'buzzer': (
+        'beep',
+    ),
+    'camera': (
+        'usb_camera_test',
+    ),
+    'gpio': (
+        'getGPIO',
+    ),
+}
+
+__exports = {name: module for module, names in __SUBMODULES.items() for name in names}
+
+__all__ = sorted(__exports)
+
+
+def __getattr__(name):
+    module = __exports.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__exports))
@@ -0,0 +1,525 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+Serial bus servo (LOBOT protocol) driver.
+"""
+
+import os
+import time
+import struct
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from .gpio import getGPIO
+
+
+# Serial bus servo (LOBOT protocol) commands
+LOBOT_SERVO_MOVE_TIME_WRITE = 1
+LOBOT_SERVO_MOVE_TIME_READ = 2
+LOBOT_SERVO_MOVE_TIME_WAIT_WRITE = 7
+LOBOT_SERVO_MOVE_TIME_WAIT_READ = 8
+LOBOT_SERVO_MOVE_START = 11
+LOBOT_SERVO_MOVE_STOP = 12
+LOBOT_SERVO_ID_WRITE = 13
+LOBOT_SERVO_ID_READ = 14
+LOBOT_SERVO_ANGLE_OFFSET_ADJUST = 17
+LOBOT_SERVO_ANGLE_OFFSET_WRITE = 18
+LOBOT_SERVO_ANGLE_OFFSET_READ = 19
+LOBOT_SERVO_ANGLE_LIMIT_WRITE = 20
+LOBOT_SERVO_ANGLE_LIMIT_READ = 21
+LOBOT_SERVO_VIN_LIMIT_WRITE = 22
+LOBOT_SERVO_VIN_LIMIT_READ = 23
+LOBOT_SERVO_TEMP_MAX_LIMIT_WRITE = 24
+LOBOT_SERVO_TEMP_MAX_LIMIT_READ = 25
+LOBOT_SERVO_TEMP_READ = 26
+LOBOT_SERVO_VIN_READ = 27
+LOBOT_SERVO_POS_READ = 28
+LOBOT_SERVO_OR_MOTOR_MODE_WRITE = 29
+LOBOT_SERVO_OR_MOTOR_MODE_READ = 30
+LOBOT_SERVO_LOAD_OR_UNLOAD_WRITE = 31
+LOBOT_SERVO_LOAD_OR_UNLOAD_READ = 32
+LOBOT_SERVO_LED_CTRL_WRITE = 33
+LOBOT_SERVO_LED_CTRL_READ = 34
+LOBOT_SERVO_LED_ERROR_WRITE = 35
+LOBOT_SERVO_LED_ERROR_READ = 36
+LOBOT_SERVO_BROADCAST_ID = 0xFE
+
+# Parameter layout of each command (little endian)
+__BUS_SERVO_WRITE_FORMAT = {
+    LOBOT_SERVO_MOVE_TIME_WRITE: '<HH',
+    LOBOT_SERVO_MOVE_STOP: '',
+    LOBOT_SERVO_ID_WRITE: '<B',
+    LOBOT_SERVO_ANGLE_OFFSET_ADJUST: '<b',
+    LOBOT_SERVO_ANGLE_OFFSET_WRITE: '',
+    LOBOT_SERVO_ANGLE_LIMIT_WRITE: '<HH',
+    LOBOT_SERVO_VIN_LIMIT_WRITE: '<HH',
+    LOBOT_SERVO_TEMP_MAX_LIMIT_WRITE: '<B',
+    LOBOT_SERVO_LOAD_OR_UNLOAD_WRITE: '<B',
+}
+__BUS_SERVO_READ_FORMAT = {
+    LOBOT_SERVO_MOVE_TIME_READ: '<HH',
+    LOBOT_SERVO_ID_READ: '<B',
+    LOBOT_SERVO_ANGLE_OFFSET_READ: '<b',
+    LOBOT_SERVO_ANGLE_LIMIT_READ: '<HH',
+    LOBOT_SERVO_VIN_LIMIT_READ: '<HH',
+    LOBOT_SERVO_TEMP_MAX_LIMIT_READ: '<B',
+    LOBOT_SERVO_TEMP_READ: '<B',
+    LOBOT_SERVO_VIN_READ: '<H',
+    LOBOT_SERVO_POS_READ: '<h',
+    LOBOT_SERVO_LOAD_OR_UNLOAD_READ: '<B',
+}
+# Reply parameter size of each read command, replies of another size are rejected
+BUS_SERVO_REPLY_SIZE = dict((cmd, struct.calcsize(fmt)) for cmd, fmt in __BUS_SERVO_READ_FORMAT.items())
+# Field names accepted by readBusServos()
+BUS_SERVO_FIELDS = {
+    'pos': LOBOT_SERVO_POS_READ,
+    'temp': LOBOT_SERVO_TEMP_READ,
+    'vin': LOBOT_SERVO_VIN_READ,
+    'offset': LOBOT_SERVO_ANGLE_OFFSET_READ,
+    'angle_limit': LOBOT_SERVO_ANGLE_LIMIT_READ,
+    'vin_limit': LOBOT_SERVO_VIN_LIMIT_READ,
+    'temp_limit': LOBOT_SERVO_TEMP_MAX_LIMIT_READ,
+    'load': LOBOT_SERVO_LOAD_OR_UNLOAD_READ,
+    'id': LOBOT_SERVO_ID_READ,
+}
+
+
+# Serial bus servo driver
+class BusServoDriver(object):
+    """
+    LOBOT serial bus servo driver.
+    Packets are 0x55 0x55 id len cmd params checksum, with
+    checksum = ~(id + len + cmd + params) & 0xFF. A reader thread decodes
+    replies and completes the Future of the matching (id, cmd) request,
+    so a read waits only for its own reply or its deadline. A reply that
+    comes in after its request timed out is dropped (late_replies) rather
+    than handed to the next read of the same servo and command.
+    :param port: Serial device path, or an already open serial-like object.
+    :param baudrate: Baud rate (default 115200).
+    :param timeout: Default reply deadline in seconds.
+    :param tx_pin: Optional GPIO pin (BOARD numbering) enabling the transmitter.
+    :param rx_pin: Optional GPIO pin enabling the receiver.
+    """
+    def __init__(self, port='/dev/ttyAMA0', baudrate=115200, timeout=0.05, tx_pin=None, rx_pin=None):
+        if isinstance(port, str):
+            import serial
+            port = serial.Serial(port, baudrate, timeout=0.01)
+        self.ser = port
+        self.timeout = timeout
+        self.tx_pin = tx_pin
+        self.rx_pin = rx_pin
+        self.write_lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.pending = {}
+        self.checksum_errors = 0
+        self.bad_replies = 0
+        self.timeouts = 0
+        self.late_replies = 0
+        self.running = True
+        self.gpio = getGPIO() if tx_pin is not None else None
+        if self.gpio is not None:
+            self.gpio.setup(tx_pin, self.gpio.OUT)
+            if rx_pin is not None:
+                self.gpio.setup(rx_pin, self.gpio.OUT)
+            self._set_direction(False)
+        self.thread = threading.Thread(target=self._reader, name="sparkybotio_bus_servo", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        self.thread.join(0.5)
+        self.ser.close()
+
+    @staticmethod
+    def checksum(body):
+        return (~sum(body)) & 0xFF
+
+    def _set_direction(self, transmit):
+        if self.gpio is not None:
+            self.gpio.output(self.tx_pin, 1 if transmit else 0)
+            if self.rx_pin is not None:
+                self.gpio.output(self.rx_pin, 0 if transmit else 1)
+
+    def packet(self, servo_id, cmd, params=b''):
+        body = bytes([servo_id & 0xFF, len(params) + 3, cmd]) + bytes(params)
+        return b'\x55\x55' + body + bytes([self.checksum(body)])
+
+    def write(self, servo_id, cmd, params=b''):
+        """
+        Send one command without waiting for a reply.
+        :param servo_id: Servo ID, 0xFE for broadcast.
+        :param cmd: LOBOT_SERVO_* command.
+        :param params: Packed parameter bytes.
+        """
+        self.send([self.packet(servo_id, cmd, params)])
+
+    def send(self, packets):
+        with self.write_lock:
+            self._set_direction(True)
+            self.ser.write(b''.join(packets))
+            if self.tx_pin is not None:
+                self.ser.flush()
+                self._set_direction(False)
+
+    def request(self, servo_id, cmd):
+        """
+        Send a read command.
+        :return: concurrent.futures.Future resolved with the reply params.
+        """
+        return self.request_many([(servo_id, cmd)])[0]
+
+    def request_many(self, requests):
+        """
+        Send several read commands in one serial write.
+        :param requests: List of (servo_id, cmd).
+        :return: List of Futures, in the same order.
+        """
+        futures = []
+        with self.pending_lock:
+            for servo_id, cmd in requests:
+                # Broadcast reads are answered with the servo's real ID
+                key = (None if servo_id == LOBOT_SERVO_BROADCAST_ID else servo_id, cmd)
+                future = Future()
+                self.pending.setdefault(key, []).append(future)
+                futures.append(future)
+        self.send([self.packet(servo_id, cmd) for servo_id, cmd in requests])
+        return futures
+
+    def wait(self, future, deadline):
+        try:
+            return future.result(max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            self.timeouts += 1
+            self._discard(future)
+            return None
+
+    def _discard(self, future):
+        # A timed-out request stays queued, cancelled, for one timeout more: its reply may
+        # still come and must not go to the next request for the same servo and command.
+        # Not if a late reply was already dropped ahead of it, that was probably its own.
+        with self.pending_lock:
+            if not getattr(future, 'shadowed', False) and future.cancel():
+                future.late_until = time.monotonic() + self.timeout
+                return
+            for key, futures in list(self.pending.items()):
+                if future in futures:
+                    futures.remove(future)
+                    if not futures:
+                        del self.pending[key]
+
+    def _dispatch(self, servo_id, cmd, params):
+        if not params:
+            # Our own read request, echoed on a half-duplex line without direction control
+            return
+        size = BUS_SERVO_REPLY_SIZE.get(cmd)
+        if size is not None and len(params) != size:
+            # Malformed reply: count it and keep waiting for a good one
+            self.bad_replies += 1
+            return
+        now = time.monotonic()
+        with self.pending_lock:
+            key = (servo_id, cmd) if self.pending.get((servo_id, cmd)) else (None, cmd)
+            futures = self.pending.get(key)
+            future = None
+            while futures:
+                waiter = futures.pop(0)
+                # Running from here on, so a timeout can no longer cancel it
+                if waiter.set_running_or_notify_cancel():
+                    future = waiter
+                    break
+                if now < waiter.late_until:
+                    # The late reply of a timed-out request
+                    self.late_replies += 1
+                    for waiting in futures:
+                        waiting.shadowed = True
+                    break
+            if futures == []:
+                del self.pending[key]
+        if future is not None:
+            future.set_result((servo_id, params))
+
+    def _reader(self):
+        buf = bytearray()
+        while self.running:
+            try:
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except (OSError, TypeError):
+                if not self.running:
+                    return
+                raise
+            if not data:
+                continue
+            buf += data
+            while True:
+                start = buf.find(b'\x55\x55')
+                if start < 0:
+                    # Keep a trailing 0x55 that may start the next header
+                    del buf[:max(0, len(buf) - 1)]
+                    break
+                if start:
+                    del buf[:start]
+                if len(buf) < 4:
+                    break
+                length = buf[3]
+                if length < 3:
+                    del buf[:2]
+                    continue
+                end = length + 3
+                if len(buf) < end:
+                    break
+                if self.checksum(buf[2:end - 1]) != buf[end - 1]:
+                    self.checksum_errors += 1
+                    del buf[:2]
+                    continue
+                self._dispatch(buf[2], buf[4], bytes(buf[5:end - 1]))
+                del buf[:end]
+
+
+__bus_servo = None
+__bus_servo_port = os.environ.get('SPARKYBOT_SERVO_PORT', '/dev/ttyAMA0')
+
+
+# Function to select the bus servo serial port
+def setBusServoPort(port, **kwargs):
+    """
+    Open the bus servo driver on a given port.
+    :param port: Serial device path or serial-like object.
+    :param kwargs: Extra BusServoDriver arguments (baudrate, timeout, tx_pin, rx_pin).
+    :return: BusServoDriver instance.
+    """
+    global __bus_servo
+    if __bus_servo is not None:
+        __bus_servo.close()
+    __bus_servo = BusServoDriver(port, **kwargs)
+    return __bus_servo
+
+
+# Function to get the bus servo driver
+def getBusServoDriver():
+    """
+    Get the bus servo driver, opening the default port on first use
+    (SPARKYBOT_SERVO_PORT, default /dev/ttyAMA0).
+    :return: BusServoDriver instance.
+    """
+    global __bus_servo
+    if __bus_servo is None:
+        __bus_servo = BusServoDriver(__bus_servo_port)
+    return __bus_servo
+
+
+def __bus_servo_write(id, cmd, *args):
+    params = struct.pack(__BUS_SERVO_WRITE_FORMAT[cmd], *args)
+    getBusServoDriver().write(LOBOT_SERVO_BROADCAST_ID if id is None else id, cmd, params)
+
+
+def __bus_servo_read(id, cmd, timeout=None):
+    driver = getBusServoDriver()
+    deadline = time.monotonic() + (driver.timeout if timeout is None else timeout)
+    reply = driver.wait(driver.request(LOBOT_SERVO_BROADCAST_ID if id is None else id, cmd), deadline)
+    if reply is None:
+        return None
+    values = struct.unpack(__BUS_SERVO_READ_FORMAT[cmd], reply[1])
+    return values[0] if len(values) == 1 else values
+
+
+# Function to read several servos at once
+def readBusServos(ids, fields=('pos', 'temp', 'vin'), timeout=None):
+    """
+    Read several fields from several servos. All requests are sent in one
+    serial write and the replies are collected as they arrive, so the call
+    costs one round-trip window instead of one per value.
+    :param ids: Servo IDs.
+    :param fields: Names from BUS_SERVO_FIELDS ('pos', 'temp', 'vin', ...).
+    :param timeout: Deadline for the whole batch in seconds.
+    :return: Dict {id: {field: value}}, value is None if no reply arrived.
+    """
+    driver = getBusServoDriver()
+    requests = [(id, BUS_SERVO_FIELDS[f]) for id in ids for f in fields]
+    deadline = time.monotonic() + (driver.timeout if timeout is None else timeout)
+    futures = driver.request_many(requests)
+    result = dict((id, {}) for id in ids)
+    for (id, cmd), field, future in zip(requests, [f for _ in ids for f in fields], futures):
+        reply = driver.wait(future, deadline)
+        if reply is None:
+            result[id][field] = None
+        else:
+            values = struct.unpack(__BUS_SERVO_READ_FORMAT[cmd], reply[1])
+            result[id][field] = values[0] if len(values) == 1 else values
+    return result
+
+
+# Function to set servo ID
+def setBusServoID(oldid, newid):
+    """
+    Configure servo id number, default is 1.
+    :param oldid: Original id, default is 1.
+    :param newid: New id.
+    """
+    __bus_servo_write(oldid, LOBOT_SERVO_ID_WRITE, newid)
+
+# Function to get servo ID
+def getBusServoID(id=None):
+    """
+    Read servo id.
+    :param id: Default is None (broadcast, only one servo may be connected).
+    :return: Servo id, or None if no servo answers before the deadline.
+    """
+    return __bus_servo_read(id, LOBOT_SERVO_ID_READ)
+
+# Function to set servo pulse
+def setBusServoPulse(id, pulse, use_time):
+    """
+    Drive servo to the specific position.
+    :param id: Servo ID to be driven.
+    :param pulse: Position.
+    :param use_time: Running time.
+    """
+    pulse = 0 if pulse < 0 else pulse
+    pulse = 1000 if pulse > 1000 else pulse
+    use_time = 0 if use_time < 0 else use_time
+    use_time = 30000 if use_time > 30000 else use_time
+    __bus_servo_write(id, LOBOT_SERVO_MOVE_TIME_WRITE, pulse, use_time)
+
+# Function to stop servo
+def stopBusServo(id=None):
+    '''
+    Stop servo running.
+    :param id:
+    '''
+    __bus_servo_write(id, LOBOT_SERVO_MOVE_STOP)
+
+# Function to set servo deviation
+def setBusServoDeviation(id, d=0):
+    """
+    Adjust deviation.
+    :param id: Servo ID.
+    :param d: Deviation.
+    """
+    __bus_servo_write(id, LOBOT_SERVO_ANGLE_OFFSET_ADJUST, d)
+
+# Function to save servo deviation
+def saveBusServoDeviation(id):
+    """
+    Configure deviation, power off protection.
+    :param id: Servo ID.
+    """
+    __bus_servo_write(id, LOBOT_SERVO_ANGLE_OFFSET_WRITE)
+
+# Function to get servo deviation
+def getBusServoDeviation(id):
+    '''
+    Read deviation.
+    :param id: Servo ID.
+    :return: Deviation.
+    '''
+    return __bus_servo_read(id, LOBOT_SERVO_ANGLE_OFFSET_READ)
+
+# Function to set servo angle limit
+def setBusServoAngleLimit(id, low, high):
+    '''
+    Set servo turning range.
+    :param id:
+    :param low:
+    :param high:
+    '''
+    __bus_servo_write(id, LOBOT_SERVO_ANGLE_LIMIT_WRITE, low, high)
+
+# Function to get servo angle limit
+def getBusServoAngleLimit(id):
+    '''
+    Read servo turning range.
+    :param id:
+    :return: Tuple (low-bit, high-bit).
+    '''
+    return __bus_servo_read(id, LOBOT_SERVO_ANGLE_LIMIT_READ)
+
+# Function to set servo voltage limit
+def setBusServoVinLimit(id, low, high):
+    '''
+    Set servo voltage range.
+    :param id:
+    :param low:
+    :param high:
+    '''
+    __bus_servo_write(id, LOBOT_SERVO_VIN_LIMIT_WRITE, low, high)
+
+# Function to get servo voltage limit
+def getBusServoVinLimit(id):
+    '''
+    Read servo turning range.
+    :param id:
+    :return: Tuple (low-bit, high-bit).
+    '''
+    return __bus_servo_read(id, LOBOT_SERVO_VIN_LIMIT_READ)
+
+# Function to set servo maximum temperature
+def setBusServoMaxTemp(id, m_temp):
+    '''
+    Set servo maximum temperature alarm.
+    :param id:
+    :param m_temp:
+    '''
+    __bus_servo_write(id, LOBOT_SERVO_TEMP_MAX_LIMIT_WRITE, m_temp)
+
+# Function to get servo temperature limit
+def getBusServoTempLimit(id):
+    '''
+    Read temperature alarming range.
+    :param id:
+    :return:
+    '''
+    return __bus_servo_read(id, LOBOT_SERVO_TEMP_MAX_LIMIT_READ)
+
+# Function to get servo pulse
+def getBusServoPulse(id):
+    '''
+    Read servo current position.
+    :param id:
+    :return:
+    '''
+    return __bus_servo_read(id, LOBOT_SERVO_POS_READ)
+
+# Function to get servo temperature
+def getBusServoTemp(id):
+    '''
+    Read servo temperature.
+    :param id:
+    :return:
+    '''
+    return __bus_servo_read(id, LOBOT_SERVO_TEMP_READ)
+
+# Function to get servo voltage
+def getBusServoVin(id):
+    '''
+    Read servo voltage.
+    :param id:
+    :return:
+    '''
+    return __bus_servo_read(id, LOBOT_SERVO_VIN_READ)
+
+# Function to reset servo pulse
+def restBusServoPulse(oldid):
+    '''
+    Reset servo pulse.
+    :param oldid:
+    '''
+    setBusServoDeviation(oldid, 0)
+    time.sleep(0.1)
+    __bus_servo_write(oldid, LOBOT_SERVO_MOVE_TIME_WRITE, 500, 100)
+
+# Function to unload servo
+def unloadBusServo(id):
+    '''
+    Power off servo.
+    :param id:
+    '''
+    __bus_servo_write(id, LOBOT_SERVO_LOAD_OR_UNLOAD_WRITE, 0)
+
+# Function to get servo load status
+def getBusServoLoadStatus(id):
+    '''
+    Read whether servo is power off.
+    :param id:
+    :return:
+    '''
+    return __bus_servo_read(id, LOBOT_SERVO_LOAD_OR_UNLOAD_READ)
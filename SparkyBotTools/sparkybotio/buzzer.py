@@ -0,0 +1,24 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+Buzzer control.
+"""
+
+from .bus import getBackend, getSimulator
+from .gpio import getGPIO
+
+
+# Function to beep
+def beep(new_state):
+    '''
+    Set buzzer state.
+    :param new_state: New state of the buzzer (0 or 1).
+    '''
+    GPIO = None if getBackend() == 'sim' else getGPIO()
+    if GPIO is None:
+        sim = getSimulator()
+        if sim is not None:
+            sim.buzzer = new_state
+        return
+    GPIO.setup(31, GPIO.OUT)
+    GPIO.output(31, new_state)
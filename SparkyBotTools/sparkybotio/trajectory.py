@@ -0,0 +1,253 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+MCU-timed multi-servo trajectory player.
+"""
+
+import time
+import threading
+from collections import deque
+import numpy as np
+
+from .servos import setServosPulse, getServoPulse
+
+
+# MCU-timed multi-servo trajectory player
+class ServoTrajectory(object):
+    """
+    Play multi-servo motion as timed setServosPulse commands.
+    Keyframes are split into segments and each segment is one command
+    whose use_time lets the controller interpolate. The next segment is
+    sent `lead` seconds before the current one ends, and servo positions
+    are estimated locally from the commands already sent.
+    :param segment_time: Segment length in seconds for smooth and follow modes.
+    :param lead: How early each segment is sent, in seconds.
+    :param max_speed: Follow-mode speed limit in pulse units per second (None = unlimited).
+    """
+    def __init__(self, segment_time=0.1, lead=0.01, max_speed=None):
+        self.segment_time = segment_time
+        self.lead = lead
+        self.max_speed = max_speed
+        self.cond = threading.Condition()
+        self.moves = {}
+        self.segments = deque()
+        self.follow_target = None
+        self.last_follow = None
+        self.commands_sent = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return self
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name="sparkybotio_trajectory", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Drop queued segments and stop the player thread. Servos finish the
+        move they are already executing.
+        """
+        with self.cond:
+            self.running = False
+            self.segments.clear()
+            self.follow_target = None
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(1.0)
+            self.thread = None
+
+    def busy(self):
+        with self.cond:
+            return bool(self.segments)
+
+    def wait(self, timeout=None):
+        """
+        Block until every queued segment has been sent and has finished.
+        :return: True if done before the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.segments:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            end = max([m[0] + m[3] for m in self.moves.values()] or [0])
+        delay = end - time.monotonic()
+        if deadline is not None:
+            delay = min(delay, deadline - time.monotonic())
+        if delay > 0:
+            time.sleep(delay)
+        return deadline is None or time.monotonic() <= deadline
+
+    def position(self, servo_id, now=None):
+        """
+        Estimated pulse of a servo, assuming it follows the commanded
+        linear move.
+        :return: Pulse, or None if the servo was never commanded.
+        """
+        now = time.monotonic() if now is None else now
+        move = self.moves.get(servo_id)
+        if move is None:
+            # 0 until setServoPulse was called: the servo could be anywhere
+            pulse = getServoPulse(servo_id)
+            return pulse if 500 <= pulse <= 2500 else None
+        t0, start, end, duration = move
+        if duration <= 0 or now >= t0 + duration:
+            return end
+        return float(start + (end - start) * max(0.0, now - t0) / duration)
+
+    def positions(self):
+        now = time.monotonic()
+        return dict((servo_id, self.position(servo_id, now)) for servo_id in self.moves)
+
+    def play(self, keyframes, smooth=False):
+        """
+        Queue a keyframe trajectory.
+        :param keyframes: List of (time_s, {servo_id: pulse}), times relative
+                          to now. Servos missing from a frame hold their value.
+        :param smooth: Fit a cubic through the keyframes and send it as
+                       segment_time pieces instead of straight lines.
+        """
+        keyframes = sorted(keyframes, key=lambda kf: kf[0])
+        ids = sorted(set(i for _, frame in keyframes for i in frame))
+        now = time.monotonic()
+        with self.cond:
+            origin = self.segments[-1][0] + self.segments[-1][1] if self.segments else now
+            current = dict((i, self.position(i, now)) for i in ids)
+            if self.segments:
+                current.update(self.segments[-1][2])
+        for i in ids:
+            if current[i] is None:
+                # Unknown start: go straight to the first keyframe instead of ramping from 0
+                current[i] = next(frame[i] for _, frame in keyframes if i in frame)
+        times = [0.0]
+        table = [[current[i] for i in ids]]
+        for t, frame in keyframes:
+            t = max(0.0, float(t))
+            row = [frame.get(i, table[-1][k]) for k, i in enumerate(ids)]
+            if t == times[-1]:
+                # Keyframes at the same time are merged, the later one wins
+                table[-1] = row
+            else:
+                times.append(t)
+                table.append(row)
+        if keyframes and len(times) == 1:
+            # Everything at time 0: one immediate move
+            times.append(0.0)
+            table.append(table[-1])
+        times = np.array(times)
+        table = np.array(table, dtype=np.float64)
+        if smooth and len(times) > 2:
+            samples = np.append(np.arange(0.0, times[-1], self.segment_time), times[-1])
+            table = self._hermite(times, table, samples)
+            times = samples
+        segments = []
+        for k in range(1, len(times)):
+            duration = times[k] - times[k - 1]
+            if duration <= 0 and k < len(times) - 1:
+                continue
+            targets = dict((i, int(round(table[k][n]))) for n, i in enumerate(ids))
+            segments.append((origin + times[k - 1], duration, targets))
+        with self.cond:
+            self.follow_target = None
+            self.segments.extend(segments)
+            self.cond.notify_all()
+        return self.start()
+
+    def play_function(self, func, duration):
+        """
+        Queue a trajectory given as a function of time.
+        :param func: func(t) -> {servo_id: pulse}, t in seconds from now.
+        :param duration: Length of the trajectory in seconds.
+        """
+        times = np.append(np.arange(self.segment_time, duration, self.segment_time), duration)
+        return self.play([(t, func(t)) for t in times])
+
+    def follow(self, targets):
+        """
+        Stream toward a moving target (e.g. from a vision loop). The latest
+        target is sent once per segment_time; calling this every frame is
+        cheap and does not touch the bus.
+        :param targets: {servo_id: pulse}.
+        """
+        with self.cond:
+            self.segments.clear()
+            self.follow_target = dict(targets)
+            self.cond.notify_all()
+        return self.start()
+
+    @staticmethod
+    def _hermite(times, values, samples):
+        # Cubic Hermite with finite-difference slopes and zero end velocity
+        slopes = np.zeros_like(values)
+        slopes[1:-1] = (values[2:] - values[:-2]) / (times[2:] - times[:-2])[:, None]
+        k = np.clip(np.searchsorted(times, samples, side='right') - 1, 0, len(times) - 2)
+        h = (times[k + 1] - times[k])[:, None]
+        s = (samples[:, None] - times[k][:, None]) / h
+        h00 = 2 * s ** 3 - 3 * s ** 2 + 1
+        h10 = s ** 3 - 2 * s ** 2 + s
+        h01 = -2 * s ** 3 + 3 * s ** 2
+        h11 = s ** 3 - s ** 2
+        return h00 * values[k] + h10 * h * slopes[k] + h01 * values[k + 1] + h11 * h * slopes[k + 1]
+
+    def _command(self, targets, use_time, now):
+        # setServosPulse arguments for a move, recorded in self.moves
+        args = [int(round(use_time * 1000)), len(targets)]
+        for servo_id in sorted(targets):
+            pulse = min(2500, max(500, int(targets[servo_id])))
+            start = self.position(servo_id, now)
+            self.moves[servo_id] = (now, pulse if start is None else start, pulse, use_time)
+            args += [servo_id, pulse]
+        return args
+
+    def _follow_step(self, now):
+        targets = dict(self.follow_target)
+        if self.max_speed is not None:
+            step = self.max_speed * self.segment_time
+            for servo_id, pulse in targets.items():
+                pos = self.position(servo_id, now)
+                # Not slew limited while the position is unknown
+                if pos is not None:
+                    targets[servo_id] = pos + max(-step, min(step, pulse - pos))
+        targets = dict((i, int(round(p))) for i, p in targets.items())
+        if targets == self.last_follow:
+            return None
+        self.last_follow = targets
+        return self._command(targets, self.segment_time + self.lead, now)
+
+    def _run(self):
+        next_follow = 0.0
+        while True:
+            # Pick the next command under the lock, write it to the bus outside
+            with self.cond:
+                if not self.running:
+                    return
+                now = time.monotonic()
+                if self.segments:
+                    start, duration, targets = self.segments[0]
+                    send_at = start - self.lead
+                    if now < send_at:
+                        self.cond.wait(send_at - now)
+                        continue
+                    self.segments.popleft()
+                    # Keep the segment end time fixed even if we are late
+                    args = self._command(targets, max(0.0, start + duration - now), now)
+                    self.last_follow = None
+                    self.cond.notify_all()
+                elif self.follow_target is not None:
+                    if now < next_follow:
+                        self.cond.wait(next_follow - now)
+                        continue
+                    args = self._follow_step(now)
+                    next_follow = now + self.segment_time
+                else:
+                    self.cond.wait()
+                    continue
+            if args is not None:
+                setServosPulse(args)
+                self.commands_sent += 1
@@ -9,8 +9,6 @@ from styles import stylesheet
 import sparkybotio
 import cv2
 
-delay_time = 0.1
-
 class FlaskThread(QThread):
     message_received = pyqtSignal(str)  # Define a signal to pass messages
 
@@ -99,116 +97,40 @@ class FlaskThread(QThread):
         app.run(host='0.0.0.0', port=80, debug=True, use_reloader=False)
 
 # Modify this section
+# setMotors(front_left, front_right, rear_left, rear_right)
 def move_forward():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, -50)
+    sparkybotio.setMotors(-50, -50, -50, -50)
 
 def move_forward_left():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, 0)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, 0)
+    sparkybotio.setMotors(0, -50, -50, 0)
 
 def move_forward_right():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, 0)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, 0)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, -50)
+    sparkybotio.setMotors(-50, 0, 0, -50)
     
 def move_backward():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, 50)
+    sparkybotio.setMotors(50, 50, 50, 50)
 
 def move_backward_left():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, 0)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, 0)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, 50)
+    sparkybotio.setMotors(50, 0, 0, 50)
     
 def move_backward_right():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, 0)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, 0)
+    sparkybotio.setMotors(0, 50, 50, 0)
     
 def move_left():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, 50)
+    sparkybotio.setMotors(50, -50, -50, 50)
 
 def move_right():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, -50)
+    sparkybotio.setMotors(-50, 50, 50, -50)
 
 def turn_ccw():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, 50)
+    sparkybotio.setMotors(50, -50, 50, -50)
     
 def turn_cw():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, -50)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, 50)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, -50)
+    sparkybotio.setMotors(-50, 50, -50, 50)
     
     
 def stop_all():
-    sleep(delay_time)
-    sparkybotio.setMotor(1, 0)
-    sleep(delay_time)
-    sparkybotio.setMotor(2, 0)
-    sleep(delay_time)
-    sparkybotio.setMotor(3, 0)
-    sleep(delay_time)
-    sparkybotio.setMotor(4, 0)
+    sparkybotio.setMotors(0, 0, 0, 0)
 
 class MainWindow(QMainWindow):
     def __init__(self):
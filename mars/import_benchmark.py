@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+Cold-start import benchmark for the MARS GUI and the control methods.
+
+Every target is imported in a fresh Python process, so nothing is shared
+between runs. For each target the script reports the import time measured
+inside the child, the total process wall time (interpreter start-up
+included) and which heavy modules the import pulled in.
+
+Usage (from the mars directory):
+    python3 import_benchmark.py
+    python3 import_benchmark.py --runs 20 --detail 15
+"""
+
+import os
+import sys
+import ast
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONTROL_METHODS_PATH = os.path.join(HERE, "mobile robot control methods")
+
+# Modules worth knowing about when they show up in a cold start
+HEAVY_MODULES = ["numpy", "cv2", "serial", "RPi.GPIO", "smbus2", "matplotlib", "PyQt5"]
+
+# Code run in the child process: time the import and list heavy modules.
+# Only sys and time are imported so the -X importtime log is the target's.
+CHILD = """
+import sys, time
+sys.path[:0] = {paths!r}
+t0 = time.perf_counter()
+{statement}
+t1 = time.perf_counter()
+print(repr({{'import_ms': (t1 - t0) * 1000.0,
+             'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def benchmark_targets():
+    targets = [
+        ("sparkybotio", "import sparkybotio"),
+        ("sparkybotio.setMotors", "from sparkybotio import setMotors"),
+    ]
+    for filename in sorted(os.listdir(CONTROL_METHODS_PATH)):
+        if filename.endswith(".py") and filename != "__init__.py":
+            targets.append((filename[:-3], "import " + filename[:-3]))
+    targets.append(("main.py", "import main"))
+    return targets
+
+
+def run_child(statement, detail=False):
+    code = CHILD.format(paths=[HERE, CONTROL_METHODS_PATH], statement=statement, heavy=HEAVY_MODULES)
+    args = [sys.executable]
+    if detail:
+        args += ["-X", "importtime"]
+    t0 = time.perf_counter()
+    proc = subprocess.run(args + ["-c", code], cwd=HERE, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - t0) * 1000.0
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()
+        return None, (error[-1] if error else "exit code %d" % proc.returncode)
+    result = ast.literal_eval(proc.stdout.strip().splitlines()[-1])
+    result['wall_ms'] = wall_ms
+    result['stderr'] = proc.stderr
+    return result, None
+
+
+def slowest_imports(importtime_log, count):
+    """
+    Parse `python -X importtime` output into the slowest modules.
+    :return: List of (cumulative_us, self_us, module).
+    """
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="fresh processes per target")
+    parser.add_argument("--detail", type=int, default=0, metavar="N",
+                        help="also show the N slowest imports of each target")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    baseline = [run_child("pass")[0]['wall_ms'] for _ in range(args.runs)]
+    print("Interpreter start-up: %.1f ms (median of %d)\n" % (statistics.median(baseline), args.runs))
+    print("%-40s %10s %10s %10s  %s" % ("target", "import ms", "min ms", "wall ms", "heavy modules"))
+
+    results = {}
+    for name, statement in benchmark_targets():
+        runs = []
+        error = None
+        for _ in range(args.runs):
+            result, error = run_child(statement)
+            if error:
+                break
+            runs.append(result)
+        if error:
+            print("%-40s %s" % (name, "failed: " + error))
+            results[name] = {'error': error}
+            continue
+        import_ms = [r['import_ms'] for r in runs]
+        wall_ms = [r['wall_ms'] for r in runs]
+        results[name] = {
+            'import_ms': statistics.median(import_ms),
+            'import_min_ms': min(import_ms),
+            'wall_ms': statistics.median(wall_ms),
+            'heavy': runs[-1]['heavy'],
+        }
+        print("%-40s %10.1f %10.1f %10.1f  %s" % (name, statistics.median(import_ms), min(import_ms),
+                                                 statistics.median(wall_ms), ", ".join(runs[-1]['heavy']) or "-"))
+        if args.detail:
+            result, _ = run_child(statement, detail=True)
+            for cumulative_us, self_us, module in slowest_imports(result['stderr'], args.detail):
+                print("    %8.1f ms  %8.1f ms self  %s" % (cumulative_us / 1000.0, self_us / 1000.0, module))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'python': sys.version, 'runs': args.runs,
+                       'startup_ms': statistics.median(baseline), 'targets': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -176,9 +176,12 @@ class RobotControlGUI(QWidget):
             sensor.begin()
             sensor.resetTracking()
             sensor.calibrateImu()
+            sb.startScheduler()  # Drop repeated motor writes from the 100 ms loop
             self.log("Hardware mode initialized")
         else:
             sensor = None
+            if sb is not None:
+                sb.stopScheduler()
             self.log("Switched to simulation mode")
 
     def addWaypoint(self):
@@ -269,6 +272,8 @@ class RobotControlGUI(QWidget):
                         self.log(f"Failed to reset OTOS sensor: {e}")
             if hasattr(self.current_controller, 'stop_motors'):
                 self.current_controller.stop_motors()
+            if sb is not None and sb.getScheduler() is not None and self.verbose_checkbox.isChecked():
+                print(sb.getScheduler().stats())
         self.log("Stopped tracking. View reset, waypoints preserved.")
 
 
@@ -1,5 +1,5 @@
 import math
-from sparkybotio import setMotor
+from sparkybotio import setMotors
 
 # Constants
 V_MAX = 80          # Max translational speed [mm/s]
@@ -13,8 +13,7 @@ def angle_wrap(a):
 
 def stop_motors():
     """Stop all motors."""
-    for m in [1, 2, 3, 4]:
-        setMotor(m, 0)
+    setMotors(0, 0, 0, 0)
 
 def set_omni_velocity(vx, vy, w=0):
     """
@@ -29,10 +28,7 @@ def set_omni_velocity(vx, vy, w=0):
     fr_speed = vy - vx
     br_speed = vy + vx
 
-    setMotor(4, -int(fl_speed))  # Front Left
-    setMotor(2, -int(bl_speed))  # Back Left
-    setMotor(3, -int(fr_speed))  # Front Right
-    setMotor(1, -int(br_speed))  # Back Right
+    setMotors(-int(fl_speed), -int(fr_speed), -int(bl_speed), -int(br_speed))
 
 def control_step(x, y, heading, waypoint, dt, is_sim, get_hw_pose):
     """
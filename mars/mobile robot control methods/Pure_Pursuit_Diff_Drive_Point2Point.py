@@ -1,5 +1,5 @@
 import math
-from sparkybotio import setMotor
+from sparkybotio import setMotors
 
 # Constants
 L = 140        # Wheelbase in mm
@@ -10,17 +10,12 @@ def angle_wrap(angle):
     """Wrap angle to [-π, π]."""
     return math.atan2(math.sin(angle), math.cos(angle))
 
-def set_left_motor(speed):
-    setMotor(2, -speed)
-    setMotor(4, -speed)
-
-def set_right_motor(speed):
-    setMotor(1, -speed)
-    setMotor(3, -speed)
+def set_motor_speeds(left_speed, right_speed):
+    # Left wheels are motors 2/4, right wheels 1/3; one write for all four
+    setMotors(-left_speed, -right_speed, -left_speed, -right_speed)
 
 def stop_motors():
-    for m in [1, 2, 3, 4]:
-        setMotor(m, 0)
+    setMotors(0, 0, 0, 0)
 
 def control_step(x, y, heading, waypoint, dt, is_sim, get_hw_pose):
     """
@@ -70,8 +65,7 @@ def control_step(x, y, heading, waypoint, dt, is_sim, get_hw_pose):
         heading_new = angle_wrap(heading + w * dt)
         stop_motors()
     else:
-        set_left_motor(left_speed)
-        set_right_motor(right_speed)
+        set_motor_speeds(left_speed, right_speed)
         x_new, y_new, heading_new = get_hw_pose()
 
     # --- Debug info ---
@@ -0,0 +1,617 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+I2C bus session, backends (smbus2 / simulator), transfer statistics and
+the background command scheduler shared by the other sparkybotio modules.
+"""
+
+import os
+import time
+import atexit
+import bisect
+import random
+import threading
+from collections import OrderedDict
+
+
+__i2c = 1
+__i2c_addr = 0x7A
+
+
+# Backend that talks to the real I2C bus
+class SMBusBackend(object):
+    """
+    I2C backend on top of smbus2.
+    :param bus: I2C bus number.
+    """
+    def __init__(self, bus=1):
+        try:
+            from smbus2 import SMBus, i2c_msg
+        except ImportError:
+            raise ImportError("smbus2 is required for the 'smbus' backend")
+        self.i2c_msg = i2c_msg
+        self.bus = SMBus(bus)
+
+    def write(self, addr, buf):
+        self.bus.i2c_rdwr(self.i2c_msg.write(addr, buf))
+
+    def read(self, addr, length):
+        msg = self.i2c_msg.read(addr, length)
+        self.bus.i2c_rdwr(msg)
+        return list(msg)
+
+    def read_byte_data(self, addr, reg):
+        return self.bus.read_byte_data(addr, reg)
+
+    def close(self):
+        self.bus.close()
+
+
+# Register-level model of the devices on the SparkyBot I2C bus
+class SimRobot(object):
+    """
+    Simulated I2C backend.
+    Models the 0x7A motor/servo controller registers, the 0x78 line sensor
+    and the 0x77 ultrasonic sensor, with optional per-transaction latency
+    and error injection so timing runs are repeatable off the robot.
+    The sonar distance is clipped to the width of the read, so with the
+    one-byte read of readDistance it saturates at 255.
+    :param latency: Fixed delay per transaction in seconds.
+    :param jitter: Extra uniform random delay (0 to jitter) per transaction.
+    :param error_rate: Probability (0 to 1) that a transaction fails.
+    :param seed: Random seed for jitter and errors.
+    """
+    MOTOR_ADDR = 0x7A
+    LINE_ADDR = 0x78
+    SONAR_ADDR = 0x77
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.registers = bytearray(256)
+        self.servo_moves = []
+        self.line = 0
+        self.distance = 100
+        self.buzzer = 0
+        self.transactions = 0
+        self.errors = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.start_time = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+
+    def _value(self, source):
+        # Sensor sources are constants or functions of the elapsed time
+        return source(self.elapsed()) if callable(source) else source
+
+    def _transaction(self, addr):
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        with self.lock:
+            self.transactions += 1
+            if addr not in (self.MOTOR_ADDR, self.LINE_ADDR, self.SONAR_ADDR) or \
+                    (self.error_rate and self.rng.random() < self.error_rate):
+                self.errors += 1
+                raise OSError(121, "Remote I/O error (simulated)")
+
+    def write(self, addr, buf):
+        self._transaction(addr)
+        buf = list(buf)
+        with self.lock:
+            self.bytes_written += len(buf)
+            if addr != self.MOTOR_ADDR or not buf:
+                return
+            reg = buf[0]
+            if reg == 40 and len(buf) >= 4:
+                use_time = buf[2] | (buf[3] << 8)
+                moves = [(buf[i], buf[i + 1] | (buf[i + 2] << 8)) for i in range(4, len(buf) - 2, 3)]
+                self.servo_moves.append((self.elapsed(), use_time, moves))
+            else:
+                self.registers[reg:reg + len(buf) - 1] = bytes(buf[1:])
+
+    def read(self, addr, length):
+        self._transaction(addr)
+        with self.lock:
+            self.bytes_read += length
+            if addr == self.SONAR_ADDR:
+                dist = max(0, min(int(self._value(self.distance)), (1 << (8 * length)) - 1))
+                return list(dist.to_bytes(length, 'little'))
+            if addr == self.LINE_ADDR:
+                return [int(self._value(self.line)) & 0xFF] * length
+            return [0] * length
+
+    def read_byte_data(self, addr, reg):
+        self._transaction(addr)
+        with self.lock:
+            self.bytes_read += 1
+            if addr == self.LINE_ADDR:
+                return int(self._value(self.line)) & 0xFF
+            return self.registers[reg] if addr == self.MOTOR_ADDR else 0
+
+    def close(self):
+        pass
+
+    def motor_speeds(self):
+        """
+        Raw signed values of motor registers 31-34.
+        """
+        return [int.from_bytes(self.registers[r:r + 1], 'little', signed=True) for r in range(31, 35)]
+
+    def servo_angles(self):
+        """
+        Values of PWM servo angle registers 21-26.
+        """
+        return list(self.registers[21:27])
+
+
+# Per-transaction latency/error counters for I2CBus
+class BusStats(object):
+    """
+    Fixed-bucket latency histograms and retry/failure/byte counters,
+    keyed by (device address, register). Recording is a few integer
+    updates, cheap enough to leave on in control loops.
+    """
+    # Upper bucket edges in microseconds, the last bucket is open-ended
+    BUCKETS_US = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+
+    def __init__(self):
+        self._edges_ns = [b * 1000 for b in self.BUCKETS_US]
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.entries = {}
+            self.started = time.time()
+
+    def record(self, addr, reg, elapsed_ns, nbytes, retried, failed):
+        with self.lock:
+            entry = self.entries.get((addr, reg))
+            if entry is None:
+                # [count, retries, failures, bytes, total_ns, max_ns, histogram]
+                entry = [0, 0, 0, 0, 0, 0, [0] * (len(self._edges_ns) + 1)]
+                self.entries[(addr, reg)] = entry
+            entry[0] += 1
+            entry[1] += retried
+            entry[2] += failed
+            if not failed:
+                entry[3] += nbytes
+            entry[4] += elapsed_ns
+            if elapsed_ns > entry[5]:
+                entry[5] = elapsed_ns
+            entry[6][bisect.bisect_left(self._edges_ns, elapsed_ns)] += 1
+
+    def _percentile_us(self, hist, count, q):
+        # Upper edge of the bucket holding the q-th sample (None = open bucket)
+        target = q * count
+        seen = 0
+        for i, n in enumerate(hist):
+            seen += n
+            if n and seen >= target:
+                return self.BUCKETS_US[i] if i < len(self.BUCKETS_US) else None
+        return None
+
+    def snapshot(self):
+        """
+        Copy of the counters.
+        :return: Dict with 'since', 'buckets_us' and a 'transfers' list.
+        """
+        # Copy under the lock: record() may add entries from another thread meanwhile
+        with self.lock:
+            entries = [(key, entry[:6] + [list(entry[6])]) for key, entry in self.entries.items()]
+            started = self.started
+        transfers = []
+        for (addr, reg), (count, retries, failures, nbytes, total_ns, max_ns, hist) in sorted(
+                entries, key=lambda kv: (kv[0][0], -1 if kv[0][1] is None else kv[0][1])):
+            transfers.append({
+                'addr': addr,
+                'reg': reg,
+                'count': count,
+                'retries': retries,
+                'failures': failures,
+                'bytes': nbytes,
+                'mean_us': total_ns / count / 1000.0,
+                'max_us': max_ns / 1000.0,
+                'p50_us': self._percentile_us(hist, count, 0.5),
+                'p99_us': self._percentile_us(hist, count, 0.99),
+                'histogram': hist,
+            })
+        return {'since': started, 'buckets_us': list(self.BUCKETS_US), 'transfers': transfers}
+
+    def to_json(self, **kwargs):
+        import json
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def report(self):
+        """
+        Text table of the counters.
+        """
+        lines = ["%-6s %-5s %8s %7s %7s %9s %9s %9s %9s %9s" %
+                 ("addr", "reg", "count", "retry", "fail", "bytes", "mean_us", "p50_us", "p99_us", "max_us")]
+        for t in self.snapshot()['transfers']:
+            lines.append("0x%02X   %-5s %8d %7d %7d %9d %9.1f %9s %9s %9.1f" % (
+                t['addr'], '-' if t['reg'] is None else t['reg'], t['count'], t['retries'], t['failures'],
+                t['bytes'], t['mean_us'], t['p50_us'] or '>%d' % self.BUCKETS_US[-1],
+                t['p99_us'] or '>%d' % self.BUCKETS_US[-1], t['max_us']))
+        return "\n".join(lines)
+
+
+# Persistent I2C bus session shared by every function in this module
+class I2CBus(object):
+    """
+    Long-lived, thread-safe I2C bus session.
+    The backend is opened on first use and stays open until close() is
+    called, so each command only pays for the transfer itself.
+    :param bus: I2C bus number (default 1).
+    :param factory: Callable bus number -> backend, default SMBusBackend.
+    """
+    def __init__(self, bus=1, factory=None):
+        self.bus_num = bus
+        self.factory = SMBusBackend if factory is None else factory
+        self.lock = threading.RLock()
+        self.stats = None
+        self._bus = None
+
+    def open(self):
+        with self.lock:
+            if self._bus is None:
+                self._bus = self.factory(self.bus_num)
+        return self
+
+    def close(self):
+        with self.lock:
+            if self._bus is not None:
+                self._bus.close()
+                self._bus = None
+
+    def is_open(self):
+        return self._bus is not None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _call(self, addr, reg, nbytes, func, *args):
+        # Run one transfer, retrying once on a bus error
+        stats = self.stats
+        if stats is None:
+            try:
+                return func(*args)
+            except OSError:
+                return func(*args)
+        retried = failed = False
+        start = time.perf_counter_ns()
+        try:
+            try:
+                return func(*args)
+            except OSError:
+                retried = True
+                return func(*args)
+        except OSError:
+            failed = True
+            raise
+        finally:
+            stats.record(addr, reg, time.perf_counter_ns() - start, nbytes, retried, failed)
+
+    def write(self, addr, buf):
+        '''
+        Write raw bytes to a device, retrying once on a bus error.
+        :param addr: Device address.
+        :param buf: List of bytes, first byte is the register.
+        '''
+        with self.lock:
+            self.open()
+            self._call(addr, buf[0], len(buf), self._bus.write, addr, buf)
+
+    def read(self, addr, length):
+        '''
+        Read raw bytes from a device, retrying once on a bus error.
+        :param addr: Device address.
+        :param length: Number of bytes to read.
+        :return: List of bytes.
+        '''
+        with self.lock:
+            self.open()
+            return self._call(addr, None, length, self._bus.read, addr, length)
+
+    def read_byte_data(self, addr, reg):
+        with self.lock:
+            self.open()
+            return self._call(addr, reg, 1, self._bus.read_byte_data, addr, reg)
+
+
+__bus = I2CBus(__i2c)
+atexit.register(__bus.close)
+__backend_name = 'smbus'
+__sim = None
+
+
+# Function to get the shared I2C bus session
+def getBus():
+    """
+    Get the I2C bus session used by this module.
+    :return: I2CBus instance.
+    """
+    return __bus
+
+
+# Function to turn on transfer instrumentation
+def enableStats():
+    """
+    Record latency, retries, failures and bytes for every I2C transfer.
+    :return: BusStats instance (the existing one if already enabled).
+    """
+    if __bus.stats is None:
+        __bus.stats = BusStats()
+    return __bus.stats
+
+
+# Function to turn off transfer instrumentation
+def disableStats():
+    __bus.stats = None
+
+
+# Function to get transfer instrumentation
+def getStats():
+    """
+    :return: BusStats instance, or None when instrumentation is off.
+    """
+    return __bus.stats
+
+
+# Function to select the I2C backend
+def setBackend(backend='smbus'):
+    """
+    Select where I2C traffic goes. The default comes from the
+    SPARKYBOT_BACKEND environment variable ('smbus' or 'sim').
+    :param backend: 'smbus' for the real bus, 'sim' for a SimRobot, a
+                    SimRobot instance, or any object with write, read,
+                    read_byte_data and close methods.
+    :return: The backend object for 'sim'/instances, None for 'smbus'.
+    """
+    global __backend_name, __sim
+    if isinstance(backend, str) and backend not in ('smbus', 'sim'):
+        raise ValueError("unknown backend %r, expected 'smbus' or 'sim'" % backend)
+    if backend == 'smbus':
+        factory = SMBusBackend
+        __backend_name = 'smbus'
+        result = None
+    else:
+        if backend == 'sim':
+            backend = __sim if __sim is not None else SimRobot()
+        if isinstance(backend, SimRobot):
+            __sim = backend
+        __backend_name = 'sim' if isinstance(backend, SimRobot) else 'custom'
+        factory = lambda bus: backend
+        result = backend
+    __bus.close()
+    __bus.factory = factory
+    return result
+
+
+# Function to get the I2C backend name
+def getBackend():
+    """
+    :return: 'smbus', 'sim' or 'custom'.
+    """
+    return __backend_name
+
+
+# Function to get the simulated robot
+def getSimulator():
+    """
+    Get the SimRobot used by the 'sim' backend, e.g. to script the line
+    sensor or read back motor registers.
+    :return: SimRobot instance, or None if the simulator was never selected.
+    """
+    return __sim
+
+
+if os.environ.get('SPARKYBOT_BACKEND', 'smbus') != 'smbus':
+    setBackend(os.environ['SPARKYBOT_BACKEND'])
+
+
+# Background writer that drops redundant and superseded commands
+class CommandScheduler(object):
+    """
+    Queue motor/servo writes and send them from a background thread.
+    A register write is dropped when the registers already hold (or are
+    about to hold) the same value, and a pending write is replaced when a
+    newer write covers the same registers, so only the latest value goes
+    out on the bus. Command writes (timed servo moves) are identified by a
+    key and only merged while pending. Priority writes (emergency stop)
+    jump the queue.
+    :param bus: I2CBus used for the transfers.
+    """
+    def __init__(self, bus):
+        self.bus = bus
+        self.cond = threading.Condition()
+        self.pending = OrderedDict()
+        self.target = {}
+        self.thread = None
+        self.running = False
+        self.busy = False
+        self.resetStats()
+
+    def resetStats(self):
+        with self.cond:
+            self.submitted = 0
+            self.issued = 0
+            self.suppressed = 0
+            self.coalesced = 0
+            self.failed = 0
+            self.bytes_sent = 0
+
+    def stats(self):
+        """
+        Get write counters.
+        :return: Dict with submitted, issued, suppressed, coalesced, failed,
+                 bytes_sent and pending counts.
+        """
+        with self.cond:
+            return {
+                'submitted': self.submitted,
+                'issued': self.issued,
+                'suppressed': self.suppressed,
+                'coalesced': self.coalesced,
+                'failed': self.failed,
+                'bytes_sent': self.bytes_sent,
+                'pending': len(self.pending),
+            }
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return self
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name="sparkybotio_scheduler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self.flush(timeout)
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def flush(self, timeout=1.0):
+        """
+        Wait until every queued write has been sent.
+        :param timeout: Max seconds to wait.
+        :return: True if the queue drained in time.
+        """
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.pending or self.busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.running:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def submit(self, addr, buf, key=None, priority=False):
+        """
+        Queue a write.
+        :param addr: Device address.
+        :param buf: Bytes to write, first byte is the register.
+        :param key: Identity of a command-style write (e.g. a servo move).
+                    Default None treats buf as plain register contents.
+        :param priority: Send before anything else and never suppress.
+        :return: True if queued, False if dropped as redundant.
+        """
+        buf = list(buf)
+        regs, values = [], []
+        if key is None:
+            regs = [(addr, buf[0] + i) for i in range(len(buf) - 1)]
+            values = buf[1:]
+            key = ('reg', addr, buf[0], len(values))
+        with self.cond:
+            self.submitted += 1
+            if regs and not priority and all(self.target.get(r) == v for r, v in zip(regs, values)):
+                self.suppressed += 1
+                return False
+            if regs:
+                first, last = buf[0], buf[0] + len(values)
+                covered = [k for k in self.pending if k[0] == 'reg' and k[1] == addr
+                           and k[2] >= first and k[2] + k[3] <= last]
+            else:
+                covered = [key] if key in self.pending else []
+            for k in covered:
+                del self.pending[k]
+                self.coalesced += 1
+            self.pending[key] = (addr, buf, regs)
+            if priority:
+                self.pending.move_to_end(key, last=False)
+            for r, v in zip(regs, values):
+                self.target[r] = v
+            self.cond.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.running and not self.pending:
+                    return
+                key, (addr, buf, regs) = self.pending.popitem(last=False)
+                self.busy = True
+            ok = True
+            try:
+                self.bus.write(addr, buf)
+            except Exception as e:
+                # Any failure, not only bus errors: the thread must survive to clear busy
+                print(e)
+                ok = False
+            with self.cond:
+                self.busy = False
+                if ok:
+                    self.issued += 1
+                    self.bytes_sent += len(buf)
+                else:
+                    self.failed += 1
+                    # Device state is unknown now, so never suppress the next write
+                    queued = set(r for entry in self.pending.values() for r in entry[2])
+                    for r in regs:
+                        if r not in queued:
+                            self.target.pop(r, None)
+                self.cond.notify_all()
+
+
+__scheduler = None
+
+
+# Function to start the background command scheduler
+def startScheduler():
+    """
+    Route motor and servo writes through a CommandScheduler.
+    Setters return immediately and redundant writes are dropped.
+    :return: CommandScheduler instance.
+    """
+    global __scheduler
+    if __scheduler is None:
+        __scheduler = CommandScheduler(__bus)
+        # Drain the queue at exit (runs before the bus is closed), or a final stop is lost
+        atexit.register(stopScheduler)
+    return __scheduler.start()
+
+
+# Function to stop the background command scheduler
+def stopScheduler(timeout=1.0):
+    """
+    Send any queued writes and go back to direct, blocking writes.
+    :param timeout: Max seconds to wait for the queue to drain.
+    """
+    global __scheduler
+    if __scheduler is not None:
+        __scheduler.stop(timeout)
+        __scheduler = None
+        atexit.unregister(stopScheduler)
+
+
+# Function to get the command scheduler
+def getScheduler():
+    """
+    Get the running command scheduler.
+    :return: CommandScheduler instance, or None when writes are direct.
+    """
+    return __scheduler
+
+
+# Write a motor/servo controller register (used by motors and servos)
+def __write(buf, key=None, priority=False):
+    if __scheduler is not None:
+        __scheduler.submit(__i2c_addr, buf, key, priority)
+    else:
+        __bus.write(__i2c_addr, buf)
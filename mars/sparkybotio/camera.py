@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+USB camera test. OpenCV is only imported when the test runs.
+"""
+
+
+#  Function to test USB camera.
+def usb_camera_test(cam_index):
+    import cv2
+
+    cap = cv2.VideoCapture(cam_index)
+
+    if not cap.isOpened():
+        print("Cannot open camera")
+        return
+
+    cv2.namedWindow("USBCameraTest", cv2.WINDOW_AUTOSIZE)
+
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            print("Cannot receive frames. Exiting")
+            break
+        
+        cv2.imshow("USBCameraTest", frame)
+        if cv2.waitKey(1) & 0xFF == 27:
+            break
+
+    cap.release()
+    cv2.destroyAllWindows()
@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+Raspberry Pi GPIO access, set up on first use.
+"""
+
+import threading
+
+
+__gpio = None
+__gpio_lock = threading.Lock()
+__gpio_ready = False
+
+
+# Function to get the configured RPi.GPIO module
+def getGPIO():
+    """
+    Import RPi.GPIO and select BOARD pin numbering the first time it is
+    needed, so importing sparkybotio does not touch the GPIO hardware.
+    :return: RPi.GPIO module, or None when not running on a Raspberry Pi.
+    """
+    global __gpio, __gpio_ready
+    if __gpio_ready:
+        return __gpio
+    with __gpio_lock:
+        if not __gpio_ready:
+            try:
+                import RPi.GPIO as GPIO
+            except ImportError:
+                GPIO = None  # Off the robot; beep() then only drives the simulator
+            if GPIO is not None:
+                GPIO.setwarnings(False)
+                GPIO.setmode(GPIO.BOARD)
+                #In this mode, the pins are identified by their physical pin numbers on the Raspberry Pi board.
+            __gpio = GPIO
+            __gpio_ready = True
+    return __gpio
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+DC motor control.
+"""
+
+from .bus import __write
+
+
+__MOTOR_ADDR = 31
+
+__motor_speed = [0, 0, 0, 0]
+
+
+# Function to set motor speed
+def setMotor(index, speed):
+    """
+    Set motor speed.
+    :param index: Motor index (1 to 4).
+    :param speed: Speed value (-100 to 100).
+    :return: Current motor speed.
+    """
+    if index < 1 or index > 4:
+        raise AttributeError("Invalid motor num: %d" % index)
+    if index == 2 or index == 4:
+        speed = speed
+    else:
+        speed = -speed
+    index -= 1
+    speed = 100 if speed > 100 else speed
+    speed = -100 if speed < -100 else speed
+    reg = __MOTOR_ADDR + index
+    __write([reg, speed.to_bytes(1, 'little', signed=True)[0]])
+    __motor_speed[index] = speed
+    return __motor_speed[index]
+
+# Function to set all four motor speeds at once
+def setMotors(fl, fr, rl, rr):
+    """
+    Set all motor speeds in a single I2C transaction.
+    Motor registers 31-34 are contiguous, so one burst write starting at
+    motor 1 updates every wheel at the same time.
+    :param fl: Front left speed (-100 to 100), motor 4.
+    :param fr: Front right speed (-100 to 100), motor 3.
+    :param rl: Rear left speed (-100 to 100), motor 2.
+    :param rr: Rear right speed (-100 to 100), motor 1.
+    :return: Current motor speeds [m1, m2, m3, m4].
+    """
+    speeds = [rr, rl, fr, fl]
+    buf = [__MOTOR_ADDR]
+    for index, speed in enumerate(speeds):
+        speed = int(speed)
+        if index == 0 or index == 2:
+            speed = -speed
+        speed = 100 if speed > 100 else speed
+        speed = -100 if speed < -100 else speed
+        speeds[index] = speed
+        buf.append(speed.to_bytes(1, 'little', signed=True)[0])
+    __write(buf)
+    __motor_speed[:] = speeds
+    return list(__motor_speed)
+
+# Function to stop all motors
+def stopMotors():
+    """
+    Stop all motors. With the scheduler running this write is sent ahead
+    of anything already queued.
+    """
+    __write([__MOTOR_ADDR, 0, 0, 0, 0], priority=True)
+    __motor_speed[:] = [0, 0, 0, 0]
+
+# Function to get motor speed
+def getMotor(index):
+    """
+    Get motor speed.
+    :param index: Motor index (1 to 4).
+    :return: Current motor speed.
+    """
+    if index < 1 or index > 4:
+        raise AttributeError("Invalid motor num: %d" % index)
+    index -= 1
+    return __motor_speed[index]
@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+Background sensor sampling into NumPy ring buffers.
+"""
+
+import time
+import threading
+import numpy as np
+
+from .sensors import readInfrared, readDistance
+
+
+# Preallocated ring buffer of timestamped samples
+class RingBuffer(object):
+    """
+    Fixed-size history of (monotonic_ts, value) samples.
+    Every sample is stored twice, capacity slots apart, so the newest n
+    samples are always one contiguous slice and window() can return views
+    instead of copies. Views are overwritten as new samples arrive; copy
+    them if they must outlive the next few pushes.
+    :param capacity: Number of samples kept.
+    :param shape: Shape of one value, () for scalars.
+    :param dtype: Value dtype.
+    """
+    def __init__(self, capacity, shape=(), dtype=np.float64):
+        self.capacity = int(capacity)
+        self.ts = np.zeros(2 * self.capacity, dtype=np.float64)
+        self.values = np.zeros((2 * self.capacity,) + tuple(shape), dtype=dtype)
+        self.count = 0
+
+    def push(self, ts, value):
+        i = self.count % self.capacity
+        j = i + self.capacity
+        self.ts[i] = self.ts[j] = ts
+        self.values[i] = self.values[j] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def last(self, n):
+        """
+        Newest n samples, oldest first.
+        :param n: Number of samples.
+        :return: (ts, values) views.
+        """
+        n = min(int(n), len(self))
+        end = (self.count - 1) % self.capacity + self.capacity + 1 if self.count else 0
+        return self.ts[end - n:end], self.values[end - n:end]
+
+    def latest(self):
+        """
+        Newest sample without blocking.
+        :return: (ts, value), or None before the first sample.
+        """
+        if not self.count:
+            return None
+        i = (self.count - 1) % self.capacity
+        return self.ts[i], self.values[i]
+
+    def window(self, seconds, now=None):
+        """
+        Samples taken in the last `seconds`.
+        :param seconds: Window length.
+        :param now: Reference time, default time.monotonic().
+        :return: (ts, values) views.
+        """
+        now = time.monotonic() if now is None else now
+        ts, values = self.last(len(self))
+        start = np.searchsorted(ts, now - seconds, side='left')
+        return ts[start:], values[start:]
+
+    def median(self, seconds):
+        """
+        Median of the window, None if it is empty.
+        """
+        values = self.window(seconds)[1]
+        if not len(values):
+            return None
+        return np.median(values, axis=0)
+
+    def ema(self, seconds, alpha=0.2):
+        """
+        Exponential moving average over the window, seeded with its oldest
+        sample. None if the window is empty.
+        :param alpha: Weight of the newest sample (0 to 1).
+        """
+        values = self.window(seconds)[1]
+        n = len(values)
+        if not n:
+            return None
+        weights = alpha * (1 - alpha) ** np.arange(n - 1, -1, -1, dtype=np.float64)
+        weights[0] = (1 - alpha) ** (n - 1)
+        return np.tensordot(weights, values.astype(np.float64), axes=1)
+
+
+# Background poller for the line tracking and ultrasonic sensors
+class SensorSampler(object):
+    """
+    Poll the line sensor and the ultrasonic sensor on a thread and keep
+    their recent history in RingBuffers, so callers never wait on I2C.
+    :param ir_rate: Line sensor poll rate in Hz (0 disables it).
+    :param distance_rate: Ultrasonic poll rate in Hz (0 disables it).
+    :param seconds: History length kept for each sensor.
+    """
+    def __init__(self, ir_rate=200, distance_rate=20, seconds=5.0):
+        self.ir_rate = ir_rate
+        self.distance_rate = distance_rate
+        self.infrared = RingBuffer(max(1, int(ir_rate * seconds)), (4,), bool)
+        self.distance = RingBuffer(max(1, int(distance_rate * seconds)))
+        self.errors = 0
+        self._stop = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self._stop.clear()
+            self.thread = threading.Thread(target=self._run, name="sparkybotio_sampler", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _poll_infrared(self):
+        try:
+            self.infrared.push(time.monotonic(), readInfrared())
+        except OSError:
+            self.errors += 1
+
+    def _poll_distance(self):
+        dist = readDistance()
+        if dist == 99999:
+            self.errors += 1
+        else:
+            self.distance.push(time.monotonic(), dist)
+
+    def _run(self):
+        tasks = []
+        if self.ir_rate > 0:
+            tasks.append([time.monotonic(), 1.0 / self.ir_rate, self._poll_infrared])
+        if self.distance_rate > 0:
+            tasks.append([time.monotonic(), 1.0 / self.distance_rate, self._poll_distance])
+        if not tasks:
+            return
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for task in tasks:
+                if now >= task[0]:
+                    task[2]()
+                    task[0] += task[1]
+                    # Skip missed slots instead of bursting to catch up
+                    if task[0] < now:
+                        task[0] = now + task[1]
+            self._stop.wait(max(0.0, min(t[0] for t in tasks) - time.monotonic()))
+
+
+__sampler = None
+
+
+# Function to start the background sensor sampler
+def startSampler(ir_rate=200, distance_rate=20, seconds=5.0):
+    """
+    Start polling the line and ultrasonic sensors in the background.
+    :param ir_rate: Line sensor poll rate in Hz.
+    :param distance_rate: Ultrasonic poll rate in Hz.
+    :param seconds: History length kept for each sensor.
+    :return: SensorSampler instance (already running if one was started).
+    """
+    global __sampler
+    if __sampler is None:
+        __sampler = SensorSampler(ir_rate, distance_rate, seconds)
+    return __sampler.start()
+
+
+# Function to stop the background sensor sampler
+def stopSampler():
+    global __sampler
+    if __sampler is not None:
+        __sampler.stop()
+        __sampler = None
+
+
+# Function to get the background sensor sampler
+def getSampler():
+    """
+    Get the running sensor sampler.
+    :return: SensorSampler instance, or None.
+    """
+    return __sampler
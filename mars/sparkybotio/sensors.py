@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+Line tracking and ultrasonic sensors.
+"""
+
+from .bus import getBus
+
+
+__ADC_BAT_ADDR = 0
+# Failed ultrasonic reads since import, see getDistanceErrors()
+__distance_errors = 0
+
+
+# Function to test the infrared line sensor
+def readInfrared():
+    register=0x01
+    address=0x78
+    value = getBus().read_byte_data(address, register)
+    return [True if value & v > 0 else False for v in [0x01, 0x02, 0x04, 0x08]]
+    
+# Function to read the ultrasonic sensor, 99999 when the bus transfer fails
+def readDistance():
+    global __distance_errors
+    i2c_addr = 0x77
+    dist = 99999
+    bus = getBus()
+    try:
+        with bus.lock:
+            bus.write(i2c_addr, [0,])
+            read = bus.read(i2c_addr, 1)
+        dist = int.from_bytes(bytes(read), byteorder='little', signed=False)
+        if dist > 5000:
+            dist = 5000
+    except OSError:
+        # Counted rather than printed: the sampler polls this continuously
+        __distance_errors += 1
+    return dist
+
+
+# Function to get the ultrasonic read failures
+def getDistanceErrors():
+    """
+    :return: Number of readDistance() calls that failed on the bus (and returned 99999).
+    """
+    return __distance_errors
+
+
+# Function to get battery level
+#
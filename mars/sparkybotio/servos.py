@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# coding=utf8
+"""
+PWM servo control.
+"""
+
+from .bus import __write
+
+
+__SERVO_ADDR = 21
+__SERVO_ADDR_CMD = 40
+
+__servo_angle = [0, 0, 0, 0, 0, 0]
+__servo_pulse = [0, 0, 0, 0, 0, 0]
+
+
+# Function to set PWM servo angle
+def setServoAngle(index, angle):
+    """
+    Set PWM servo angle.
+    :param index: Servo index (1 to 6).
+    :param angle: Angle value (0 to 180).
+    :return: Current servo angle.
+    """
+    if index < 1 or index > 6:
+        raise AttributeError("Invalid Servo ID: %d" % index)
+    index -= 1
+    angle = 180 if angle > 180 else angle
+    angle = 0 if angle < 0 else angle
+    reg = __SERVO_ADDR + index
+    __write([reg, angle])
+    __servo_angle[index] = angle
+    __servo_pulse[index] = int(((200 * angle) / 9) + 500)
+    return __servo_angle[index]
+
+
+# Function to set PWM servo pulse
+def setServoPulse(servo_id, pulse=1500, use_time=1000):
+    """
+    Set PWM servo pulse.
+    :param servo_id: Servo index (1 to 6).
+    :param pulse: Pulse value (500 to 2500).
+    :param use_time: Time value (0 to 30000).
+    :return: Current servo pulse.
+    """
+    if servo_id < 1 or servo_id > 6:
+        raise AttributeError("Invalid Servo ID: %d" % servo_id)
+    index = servo_id - 1
+    pulse = 500 if pulse < 500 else pulse
+    pulse = 2500 if pulse > 2500 else pulse
+    use_time = 0 if use_time < 0 else use_time
+    use_time = 30000 if use_time > 30000 else use_time
+    buf = [__SERVO_ADDR_CMD, 1] + list(use_time.to_bytes(2, 'little')) + [servo_id, ] + list(pulse.to_bytes(2, 'little'))
+    __write(buf, key=('servo', servo_id))
+    __servo_pulse[index] = pulse
+    __servo_angle[index] = int((pulse - 500) * 0.09)
+
+
+# Function to set PWM servos pulse
+def setServosPulse(args):
+    '''
+    Set PWM servos pulse.
+    :param args: List of arguments [time, number, id1, pos1, id2, pos2, ...]
+    '''
+    arglen = len(args)
+    servos = args[2:arglen:2]
+    pulses = args[3:arglen:2]
+    use_time = args[0]
+    use_time = 0 if use_time < 0 else use_time
+    use_time = 30000 if use_time > 30000 else use_time
+    servo_number = args[1]
+    buf = [__SERVO_ADDR_CMD, servo_number] + list(use_time.to_bytes(2, 'little'))
+    dat = zip(servos, pulses)
+    for (s, p) in dat:
+        buf.append(s)
+        p = 500 if p < 500 else p
+        p = 2500 if p > 2500 else p
+        buf += list(p.to_bytes(2, 'little'))
+        __servo_pulse[s - 1] = p
+        __servo_angle[s - 1] = int((p - 500) * 0.09)
+    __write(buf, key=('servos', tuple(servos)))
+
+# Function to get PWM servo angle
+def getServoAngle(servo_id):
+    '''
+    Get PWM servo angle.
+    :param servo_id: Servo index (1 to 6).
+    :return: Current servo angle.
+    '''
+    if servo_id < 1 or servo_id > 6:
+        raise AttributeError("Invalid Servo ID: %d" % servo_id)
+    index = servo_id - 1
+    return __servo_angle[index]
+
+# Function to get PWM servo pulse
+def getServoPulse(servo_id):
+    '''
+    Get PWM servo pulse.
+    :param servo_id: Servo index (1 to 6).
+    :return: Current servo pulse.
+    '''
+    if servo_id < 1 or servo_id > 6:
+        raise AttributeError("Invalid Servo ID: %d" % servo_id)
+    index = servo_id - 1
+    return __servo_pulse[index]
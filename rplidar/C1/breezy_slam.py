@@ -1,14 +1,16 @@
 import os
 os.environ["QT_QPA_PLATFORM"] = "xcb"
 
-import subprocess
-import re
 import numpy as np
 from breezyslam.algorithms import RMHC_SLAM
 from breezyslam.sensors import RPLidarA1
 import matplotlib.pyplot as plt
 from collections import deque
 
+from ultra_simple_reader import UltraSimpleReader
+from lidar_shm import open_scans
+from scan_log import ScanReplay
+
 ULTRA_SIMPLE_PATH = './ultra_simple'
 PORT = '/dev/ttyUSB0'
 BAUD = '460800'
@@ -18,14 +20,12 @@ MAX_DISTANCE = 6000
 MAP_SIZE_PIXELS = 500
 MAP_SIZE_METERS = 6
 MAX_POINTS = 5000
-MIN_SCAN_VALID = 200  # Tune as needed
-
-pattern = re.compile(r'theta:\s*([0-9.]+)\s+Dist:\s*([0-9.]+)')
+MIN_SCAN_VALID = 200  # Min points with a return per revolution, tune as needed
+REPLAY = None  # Path of a scan_log.py recording to run on instead of the lidar
 
 lidar_model = RPLidarA1()
 slam = RMHC_SLAM(lidar_model, MAP_SIZE_PIXELS, MAP_SIZE_METERS)
 mapbytes = bytearray(MAP_SIZE_PIXELS * MAP_SIZE_PIXELS)
-scan = [0] * SCAN_SIZE
 
 plt.ion()
 fig, ax = plt.subplots(figsize=(6, 6))
@@ -34,34 +34,23 @@ robot_pos, = ax.plot([], [], 'ro')
 ax.set_title("SLAM Map")
 ax.set_aspect('equal')
 
-proc = subprocess.Popen(
-    [ULTRA_SIMPLE_PATH, '--channel', '--serial', PORT, BAUD],
-    stdout=subprocess.PIPE,
-    stderr=subprocess.STDOUT,
-    text=True
-)
+# Revolutions from a recording, from lidar_daemon.py, or from our own ultra_simple
+if REPLAY:
+    lidar = ScanReplay(REPLAY)
+else:
+    lidar = open_scans(make_reader=lambda: UltraSimpleReader(ULTRA_SIMPLE_PATH, PORT, BAUD))
 
 pose_history = deque(maxlen=MAX_POINTS)
 origin = None
-unique_angle_set = set()
 print("Starting Lidar... Press Ctrl+C to stop.")
 
 try:
-    for line in proc.stdout:
-        match = pattern.search(line)
-        if match:
-            try:
-                angle = int(float(match.group(1)))
-                distance = int(float(match.group(2)))
-            except ValueError:
-                continue
-            if 0 <= angle < SCAN_SIZE:
-                scan[angle] = distance if 0 < distance < MAX_DISTANCE else 0
-                unique_angle_set.add(angle)
-        # Only update after enough unique angles
-        if len(unique_angle_set) >= MIN_SCAN_VALID:
+    for revolution in lidar.iter_scans(every=False):
+        # Only update with revolutions that saw enough of the room
+        if np.count_nonzero(revolution.valid(MAX_DISTANCE)) >= MIN_SCAN_VALID:
+            scan = revolution.resample(SCAN_SIZE, max_distance=MAX_DISTANCE)
             #print("Scan snippet (first 20):", scan[:20])
-            slam.update(scan)
+            slam.update(scan.tolist())
             x_mm, y_mm, theta_deg = slam.getpos()
 
             if origin is None:
@@ -85,15 +74,11 @@ try:
             ax.set_xlim(0, MAP_SIZE_PIXELS)
             ax.set_ylim(0, MAP_SIZE_PIXELS)
             plt.pause(0.001)
-
-            scan = [0] * SCAN_SIZE
-            unique_angle_set = set()
 except KeyboardInterrupt:
     print("Stopped by user.")
 
 finally:
-    proc.terminate()
-    proc.wait()
+    lidar.close()
     plt.ioff()
     plt.show()
 
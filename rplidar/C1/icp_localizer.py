@@ -0,0 +1,287 @@
+"""
+Point-to-line ICP localization against a known room model.
+
+The room is a set of wall segments (by default the 3600 x 4000 mm
+rectangle of the localization_fitting scripts, bottom-left corner at the
+origin). Every revolution is registered against it with all its points:
+
+    localizer = ICPLocalizer(LineMap.rectangle(3600, 4000))
+    for scan in lidar.iter_scans(every=False):
+        pose, covariance = localizer.update(scan.xy(6000))
+        # pose: x, y (mm), theta (rad) of the lidar in the room; None if lost
+
+The walls are sampled every few mm into a KD-tree, each sample carrying its
+wall's normal, so correspondences are one tree query for the whole scan and
+the residual is the distance to the wall line. Each Gauss-Newton step is a
+3x3 solve over all points with Huber weights; points farther than the
+correspondence gate from any wall (furniture, people, doors) are ignored.
+The previous pose plus the last motion is the starting guess, and the
+first revolution (or one after losing track) is placed by a coarse search
+over the room. In a symmetric room that search cannot tell a pose from its
+mirror image; pass initial_pose (--start) to start from a known pose.
+
+Usage:
+    python3 icp_localizer.py                          # live, 3600 x 4000 mm room
+    python3 icp_localizer.py --height 4200 --no-plot
+    python3 icp_localizer.py --start 500 500 90      # known start pose: x, y (mm), heading (deg)
+    python3 icp_localizer.py --replay run1.npz        # recorded with scan_log.py
+    python3 icp_localizer.py --map room.txt           # walls: "x1 y1 x2 y2" per line
+"""
+
+import time
+import argparse
+import numpy as np
+from scipy.spatial import cKDTree
+
+from pose_graph import compose, relative_pose, wrap_angle
+
+MAX_DISTANCE = 6000
+
+
+class LineMap:
+    """Wall segments (mm) sampled into a KD-tree of points with their wall normals."""
+
+    def __init__(self, segments, resolution: float = 10.0):
+        """
+        :param segments: (k, 2, 2) array of wall end points, or anything that reshapes to it.
+        :param resolution: Sample spacing along the walls (mm).
+        """
+        self.segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+        points, normals = [], []
+        for a, b in self.segments:
+            length = np.hypot(*(b - a))
+            if not length:
+                continue
+            count = int(np.ceil(length / resolution)) + 1
+            points.append(a + np.linspace(0, 1, count)[:, None] * (b - a))
+            normals.append(np.tile([-(b - a)[1] / length, (b - a)[0] / length], (count, 1)))
+        self.points = np.concatenate(points)
+        self.normals = np.concatenate(normals)
+        self.tree = cKDTree(self.points)
+        self.lower, self.upper = self.points.min(axis=0), self.points.max(axis=0)
+
+    @classmethod
+    def rectangle(cls, width: float, height: float, **kwargs):
+        """Rectangular room with its bottom-left corner at (0, 0)."""
+        corners = np.array([[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float64)
+        return cls(np.stack((corners, np.roll(corners, -1, axis=0)), axis=1), **kwargs)
+
+    @classmethod
+    def load(cls, path: str, **kwargs):
+        """Read walls from a text file, one "x1 y1 x2 y2" (mm) per line, '#' starts a comment."""
+        rows = []
+        with open(path) as f:
+            for line in f:
+                fields = line.split('#', 1)[0].split()
+                if fields:
+                    rows.append([float(v) for v in fields[:4]])
+        return cls(np.array(rows), **kwargs)
+
+
+def transform(xy: np.ndarray, pose) -> np.ndarray:
+    """Points from the lidar frame into the map frame."""
+    c, s = np.cos(pose[2]), np.sin(pose[2])
+    return xy @ np.array([[c, s], [-s, c]]) + pose[:2]
+
+
+class ICPLocalizer:
+    """Track the lidar pose in a LineMap, one revolution at a time."""
+
+    def __init__(self, line_map: LineMap, max_iterations: int = 20, max_correspondence: float = 300.0,
+                 min_correspondence: float = 50.0, huber: float = 20.0, min_inliers: float = 0.3,
+                 min_points: int = 30, initial_pose=None):
+        """
+        :param max_correspondence: Initial gate (mm): points farther from every wall are outliers.
+        :param min_correspondence: The gate shrinks towards 3 sigma of the residuals, not below this.
+        :param huber: Residual (mm) above which points are down-weighted.
+        :param min_inliers: Fraction of scan points that must end up on a wall to accept the pose.
+        :param initial_pose: Approximate start pose (x, y, theta) for the first revolution, instead
+                             of the search of initialize(), which is ambiguous in a symmetric room.
+        """
+        self.map = line_map
+        self.max_iterations = max_iterations
+        self.max_correspondence = max_correspondence
+        self.min_correspondence = min_correspondence
+        self.huber = huber
+        self.min_inliers = min_inliers
+        self.min_points = min_points
+        self.pose = None
+        self.initial_pose = None if initial_pose is None else np.array(initial_pose, dtype=np.float64)
+        self.motion = np.zeros(3)
+        # Diagnostics of the last registration
+        self.rms = None
+        self.inliers = 0.0
+        self.iterations = 0
+
+    def register(self, xy: np.ndarray, pose) -> tuple:
+        """
+        Refine pose (x, y, theta) so the scan points xy (lidar frame, mm) lie on the walls.
+        :return: (pose, covariance) or (None, None) if too few points match the map.
+        """
+        pose = np.array(pose, dtype=np.float64)
+        gate = self.max_correspondence
+        H = None
+        for iteration in range(self.max_iterations):
+            world = transform(xy, pose)
+            distance, nearest = self.map.tree.query(world, distance_upper_bound=gate)
+            ok = np.isfinite(distance)
+            if np.count_nonzero(ok) < self.min_points:
+                return None, None
+            p, normal = xy[ok], self.map.normals[nearest[ok]]
+            r = np.einsum('ij,ij->i', normal, world[ok] - self.map.points[nearest[ok]])
+            a = np.abs(r)
+            w = np.where(a <= self.huber, 1.0, self.huber / np.maximum(a, 1e-9))
+            # d(world)/d(theta) = dR/dtheta @ p
+            c, s = np.cos(pose[2]), np.sin(pose[2])
+            J = np.column_stack((normal[:, 0], normal[:, 1],
+                                 normal[:, 0] * (-s * p[:, 0] - c * p[:, 1]) + normal[:, 1] * (c * p[:, 0] - s * p[:, 1])))
+            H = J.T @ (J * w[:, None])
+            try:
+                step = -np.linalg.solve(H, J.T @ (w * r))
+            except np.linalg.LinAlgError:
+                return None, None
+            pose += step
+            pose[2] = wrap_angle(pose[2])
+            # Tighten the gate as the residuals shrink
+            sigma = 1.4826 * np.median(a)
+            gate = max(self.min_correspondence, min(gate, 3 * sigma))
+            if np.hypot(step[0], step[1]) < 0.1 and abs(step[2]) < 1e-4:
+                break
+        self.iterations = iteration + 1
+        self.inliers = np.count_nonzero(ok) / len(xy)
+        self.rms = float(np.sqrt(np.average(r * r, weights=w)))
+        if self.inliers < self.min_inliers:
+            return None, None
+        dof = max(np.count_nonzero(ok) - 3, 1)
+        covariance = np.linalg.inv(H) * float(np.sum(w * r * r)) / dof
+        return pose, covariance
+
+    def initialize(self, xy: np.ndarray, step: float = 250.0, heading_step: float = np.radians(10),
+                   points: int = 100, candidates: int = 5) -> tuple:
+        """
+        Find the pose without a guess: score a grid of positions and headings over the map,
+        then run ICP from the best few. In a symmetric room the mirrored pose fits as well:
+        in a width x height rectangle (x, y, theta) and (width - x, height - y, theta + pi)
+        score the same and either can win. Tracking keeps whichever was picked, so the
+        ambiguity has to be broken from outside: an initial_pose hint, or a map with an
+        asymmetric feature (a door recess, a pillar) among its segments.
+        :return: (pose, covariance) or (None, None).
+        """
+        sample = xy[np.linspace(0, len(xy) - 1, min(points, len(xy))).astype(int)]
+        gx = np.arange(self.map.lower[0] + step / 2, self.map.upper[0], step)
+        gy = np.arange(self.map.lower[1] + step / 2, self.map.upper[1], step)
+        headings = np.arange(0, 2 * np.pi, heading_step)
+        scores = np.empty((len(headings), len(gx) * len(gy)))
+        positions = np.stack(np.meshgrid(gx, gy), axis=-1).reshape(-1, 2)
+        for k, theta in enumerate(headings):
+            c, s = np.cos(theta), np.sin(theta)
+            rotated = sample @ np.array([[c, s], [-s, c]])
+            world = rotated[None, :, :] + positions[:, None, :]
+            distance, _ = self.map.tree.query(world.reshape(-1, 2), distance_upper_bound=self.max_correspondence)
+            scores[k] = np.minimum(distance, self.max_correspondence).reshape(len(positions), -1).mean(axis=1)
+        best = None
+        for flat in np.argsort(scores, axis=None)[:candidates]:
+            k, m = np.unravel_index(flat, scores.shape)
+            pose, covariance = self.register(xy, (positions[m][0], positions[m][1], headings[k]))
+            if pose is not None and (best is None or self.rms < best[2]):
+                best = (pose, covariance, self.rms)
+        if best is None:
+            return None, None
+        return best[0], best[1]
+
+    def update(self, xy: np.ndarray) -> tuple:
+        """
+        Localize one revolution (points in the lidar frame, mm), starting from the last pose
+        moved by the last motion.
+        :return: (pose, covariance), (None, None) while lost.
+        """
+        if len(xy) < self.min_points:
+            return None, None
+        if self.pose is None:
+            pose = None
+            if self.initial_pose is not None:
+                pose, covariance = self.register(xy, self.initial_pose)
+                self.initial_pose = None
+            if pose is None:
+                pose, covariance = self.initialize(xy)
+            self.motion = np.zeros(3)
+        else:
+            pose, covariance = self.register(xy, compose(self.pose, self.motion))
+            if pose is not None:
+                self.motion = relative_pose(self.pose, pose)
+        self.pose = pose
+        return pose, covariance
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Localize the lidar in a known room with point-to-line ICP")
+    parser.add_argument("--width", type=float, default=3600, help="rectangular room width (mm)")
+    parser.add_argument("--height", type=float, default=4000, help="rectangular room height (mm)")
+    parser.add_argument("--map", help="wall file instead of the rectangle, \"x1 y1 x2 y2\" per line")
+    parser.add_argument("--start", type=float, nargs=3, metavar=("X", "Y", "DEG"),
+                        help="start pose in the room, x y (mm) and heading (deg); needed in a symmetric room")
+    parser.add_argument("--replay", help="scan_log.py recording instead of the lidar")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 0 for as fast as possible")
+    parser.add_argument("--no-plot", action="store_true")
+    args = parser.parse_args()
+
+    line_map = LineMap.load(args.map) if args.map else LineMap.rectangle(args.width, args.height)
+    start = None if args.start is None else (args.start[0], args.start[1], np.radians(args.start[2]))
+    localizer = ICPLocalizer(line_map, initial_pose=start)
+    if args.replay:
+        from scan_log import ScanReplay
+        lidar = ScanReplay(args.replay, speed=args.speed or None)
+    else:
+        from lidar_shm import open_scans
+        lidar = open_scans()
+
+    if not args.no_plot:
+        import matplotlib.pyplot as plt
+        plt.ion()
+        fig, ax = plt.subplots(figsize=(6, 6))
+        ax.set_aspect('equal')
+        for a, b in line_map.segments:
+            ax.plot([a[0], b[0]], [a[1], b[1]], 'g-', linewidth=2)
+        margin = 500
+        ax.set_xlim(line_map.lower[0] - margin, line_map.upper[0] + margin)
+        ax.set_ylim(line_map.lower[1] - margin, line_map.upper[1] + margin)
+        ax.set_xlabel('X (mm)')
+        ax.set_ylabel('Y (mm)')
+        scan_plot, = ax.plot([], [], 'ro', markersize=2)
+        heading_plot, = ax.plot([], [], 'b-', linewidth=2)
+        lidar_plot, = ax.plot([], [], 'mo', markersize=8)
+
+    print("Localizing. Ctrl+C to stop.")
+    total, count = 0.0, 0
+    try:
+        for scan in lidar.iter_scans(every=False):
+            xy = scan.xy(MAX_DISTANCE)
+            t0 = time.perf_counter()
+            pose, covariance = localizer.update(xy)
+            total += time.perf_counter() - t0
+            count += 1
+            if pose is None:
+                print("Lost (%d points)" % len(xy))
+                continue
+            sigma = np.sqrt(np.diag(covariance))
+            print("Pose: (%.0f, %.0f) mm, %.1f° | sigma %.1f mm %.1f mm %.2f° | %d it, %.0f%% inliers, rms %.1f mm" % (
+                pose[0], pose[1], np.degrees(pose[2]), sigma[0], sigma[1], np.degrees(sigma[2]),
+                localizer.iterations, 100 * localizer.inliers, localizer.rms))
+            if not args.no_plot:
+                world = transform(xy, pose)
+                scan_plot.set_data(world[:, 0], world[:, 1])
+                lidar_plot.set_data([pose[0]], [pose[1]])
+                heading_plot.set_data([pose[0], pose[0] + 500 * np.cos(pose[2])],
+                                      [pose[1], pose[1] + 500 * np.sin(pose[2])])
+                fig.canvas.draw_idle()
+                fig.canvas.flush_events()
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        lidar.close()
+    if count:
+        print("%d revolutions, %.2f ms per revolution" % (count, 1000 * total / count))
+
+
+if __name__ == "__main__":
+    main()
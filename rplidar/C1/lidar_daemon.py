@@ -0,0 +1,88 @@
+"""
+Lidar acquisition daemon.
+
+Owns the lidar, cuts its measurements into revolutions and publishes them
+in shared memory (see lidar_shm.py), so SLAM, localization, plotting and
+obstacle monitoring can all run at the same time on one lidar.
+
+Usage:
+    python3 lidar_daemon.py                      # ./ultra_simple on /dev/ttyUSB0
+    python3 lidar_daemon.py --driver native      # rplidar_driver, no ultra_simple
+    python3 lidar_daemon.py --driver native --express
+    python3 lidar_daemon.py --record run1.npz    # also save every revolution (scan_log.py)
+
+Consumers:
+    from lidar_shm import open_scans
+    lidar = open_scans()      # the daemon's ring, or the lidar itself if no daemon runs
+    for scan in lidar.iter_scans():
+        ...
+"""
+
+import time
+import signal
+import argparse
+
+from lidar_shm import ScanRing, SHM_NAME
+from scan_assembler import ScanAssembler
+from scan_log import ScanRecorder
+
+ULTRA_SIMPLE_PATH = './ultra_simple'
+PORT = '/dev/ttyUSB0'
+BAUD = '460800'
+
+
+def open_lidar(args):
+    """:return: (batch iterable, close function)"""
+    if args.driver == 'native':
+        from rplidar_driver import RPLidarDriver
+        lidar = RPLidarDriver(args.port, int(args.baud))
+        return lidar.iter_measurements(express=args.express), lidar.disconnect
+    from ultra_simple_reader import UltraSimpleReader
+    lidar = UltraSimpleReader(args.ultra_simple, args.port, args.baud)
+    return lidar, lidar.close
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish lidar revolutions in shared memory")
+    parser.add_argument("--driver", choices=["ultra_simple", "native"], default="ultra_simple")
+    parser.add_argument("--express", action="store_true", help="express scan (native driver)")
+    parser.add_argument("--ultra-simple", default=ULTRA_SIMPLE_PATH, help="path to the ultra_simple binary")
+    parser.add_argument("--port", default=PORT)
+    parser.add_argument("--baud", default=BAUD)
+    parser.add_argument("--name", default=SHM_NAME, help="shared memory name")
+    parser.add_argument("--slots", type=int, default=16, help="revolutions kept in the ring")
+    parser.add_argument("--capacity", type=int, default=4096, help="max points per revolution")
+    parser.add_argument("--record", help="also write every revolution to this recording")
+    args = parser.parse_args()
+
+    # Stop cleanly on SIGTERM too, so the ring gets unlinked
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    ring = ScanRing.create(args.name, args.slots, args.capacity)
+    assembler = ScanAssembler()
+    recorder = ScanRecorder(args.record) if args.record else None
+    batches, close = open_lidar(args)
+    print("Publishing lidar scans in /dev/shm/%s. Ctrl+C to stop." % args.name)
+
+    last_report = time.time()
+    try:
+        for batch in batches:
+            for scan in assembler.push(*batch):
+                ring.publish(scan)
+                if recorder:
+                    recorder.write(scan)
+            ring.heartbeat()
+            if time.time() - last_report > 10:
+                print("%d revolutions published, %d dropped" % (ring.published, assembler.dropped))
+                last_report = time.time()
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        close()
+        ring.close()
+        if recorder:
+            recorder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Shared-memory fan-out of lidar revolutions.
+
+lidar_daemon.py owns the lidar and publishes every revolution into a ring
+of fixed-size slots in POSIX shared memory. Any number of processes can
+read it at the same time, without locks and without copying the points:
+
+    with ScanRing.attach() as lidar:
+        for scan in lidar.iter_scans():           # every revolution, in order
+            slam.update(scan.resample(360, max_distance=6000).tolist())
+
+        scan = lidar.latest()                     # or just the newest one
+
+Scans are scan_assembler.Scan objects whose points are views into the
+ring. A slot is rewritten `slots` revolutions later, so a consumer should
+finish with a scan well within that time, 1.6 s with the defaults at 10 Hz.
+Nothing checks a view after it is handed out: a consumer that falls behind
+reads the newer revolution (or half of it) without noticing. Pass
+copy=True to get the points copied out of the slot instead, checked
+against concurrent writes.
+
+close() gives every Scan still alive its own copy of the points before
+unmapping the ring. Arrays sliced out of scan.points earlier still view
+the ring and must not be used after close().
+
+Layout: a header of int64 fields followed by the slots. Each slot starts
+with its own header, then `capacity` SCAN_DTYPE points. Writing uses a
+sequence lock: the slot sequence number is odd while the daemon writes and
+becomes 2 * (seq + 1) when revolution `seq` is complete, after which the
+ring's published counter is raised. Readers check the slot sequence before
+and after reading a slot and skip revolutions that changed underneath.
+"""
+
+import os
+import time
+import weakref
+import threading
+from collections import deque
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+from scan_assembler import Scan, ScanAssembler, SCAN_DTYPE
+
+SHM_NAME = 'sparky_lidar'
+MAGIC = 0x5350_4C49_4452_0001  # "SPLIDR" + layout version
+
+# Ring header fields (int64)
+H_MAGIC, H_SLOTS, H_CAPACITY, H_PUBLISHED, H_PID, H_HEARTBEAT = range(6)
+HEADER_FIELDS = 8
+# Slot header fields (int64)
+S_SEQ, S_COUNT, S_INDEX = range(3)
+SLOT_FIELDS = 4
+
+
+def _slot_size(capacity: int) -> int:
+    size = SLOT_FIELDS * 8 + capacity * SCAN_DTYPE.itemsize
+    return (size + 63) // 64 * 64
+
+
+class ScanRing:
+    """Ring of revolutions in shared memory; create() for the daemon, attach() for consumers."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=shm.buf)
+        if self.header[H_MAGIC] != MAGIC:
+            raise ValueError("%s is not a lidar scan ring" % shm.name)
+        self.slots = int(self.header[H_SLOTS])
+        self.capacity = int(self.header[H_CAPACITY])
+        stride = _slot_size(self.capacity)
+        base = HEADER_FIELDS * 8
+        self.slot_headers = [np.ndarray(SLOT_FIELDS, dtype=np.int64, buffer=shm.buf, offset=base + i * stride)
+                             for i in range(self.slots)]
+        self.slot_points = [np.ndarray(self.capacity, dtype=SCAN_DTYPE, buffer=shm.buf,
+                                       offset=base + i * stride + SLOT_FIELDS * 8)
+                            for i in range(self.slots)]
+        # Scans handed out that view the ring, detached by close()
+        self.views = weakref.WeakSet()
+        # Next revolution iter_scans() hands out, and how many it had to skip
+        self.next_seq = None
+        self.missed = 0
+
+    @classmethod
+    def create(cls, name: str = SHM_NAME, slots: int = 16, capacity: int = 4096):
+        """
+        Create the ring (daemon side). A ring left behind by a dead daemon is replaced.
+        :param slots: Revolutions kept; also how long a consumer may hold on to a scan.
+        :param capacity: Points per slot, longer revolutions are truncated (C1: ~500 at 10 Hz).
+        """
+        size = HEADER_FIELDS * 8 + slots * _slot_size(capacity)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            pid = int(np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=stale.buf)[H_PID]) if stale.size >= 64 else 0
+            if pid and pid != os.getpid() and _alive(pid):
+                stale.close()
+                raise RuntimeError("lidar daemon already running (pid %d)" % pid)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[H_SLOTS], header[H_CAPACITY], header[H_PID] = slots, capacity, os.getpid()
+        header[H_HEARTBEAT] = time.monotonic_ns()
+        header[H_MAGIC] = MAGIC
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str = SHM_NAME):
+        """Open the ring of a running daemon (consumer side). Raises FileNotFoundError if there is none."""
+        shm = shared_memory.SharedMemory(name=name)
+        # Python < 3.13 registers attached segments too and would unlink the ring when we exit
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return cls(shm, owner=False)
+
+    # Daemon side
+
+    def publish(self, scan: Scan):
+        """Write one revolution into the next slot."""
+        seq = int(self.header[H_PUBLISHED])
+        i = seq % self.slots
+        slot = self.slot_headers[i]
+        n = min(len(scan.points), self.capacity)
+        slot[S_SEQ] = 2 * seq + 1
+        self.slot_points[i][:n] = scan.points[:n]
+        slot[S_COUNT], slot[S_INDEX] = n, scan.index
+        slot[S_SEQ] = 2 * seq + 2
+        self.header[H_PUBLISHED] = seq + 1
+        self.header[H_HEARTBEAT] = time.monotonic_ns()
+
+    def heartbeat(self):
+        """Mark the daemon alive while no revolutions come in (lidar spinning up)."""
+        self.header[H_HEARTBEAT] = time.monotonic_ns()
+
+    # Consumer side
+
+    @property
+    def published(self) -> int:
+        """Number of revolutions published so far."""
+        return int(self.header[H_PUBLISHED])
+
+    def alive(self, timeout: float = 2.0) -> bool:
+        """True if the daemon published or sent a heartbeat within timeout seconds."""
+        return time.monotonic_ns() - int(self.header[H_HEARTBEAT]) < timeout * 1e9
+
+    def get(self, seq: int, copy: bool = False):
+        """
+        Revolution seq, or None if it is not (or no longer) in the ring.
+        :param copy: Copy the points out of the slot, so a revolution overwritten while
+                     it was read is detected. False: a Scan viewing the ring, unchecked once
+                     returned (see the module docstring).
+        """
+        if not 0 <= seq < self.published:
+            return None
+        slot = self.slot_headers[seq % self.slots]
+        if slot[S_SEQ] != 2 * seq + 2:
+            return None
+        count, index = int(slot[S_COUNT]), int(slot[S_INDEX])
+        points = self.slot_points[seq % self.slots][:count]
+        if copy:
+            points = points.copy()
+        if slot[S_SEQ] != 2 * seq + 2:
+            return None
+        scan = Scan(points, index)
+        if not copy:
+            self.views.add(scan)
+        return scan
+
+    def latest(self, copy: bool = False):
+        """Newest revolution, None before the first one."""
+        seq = self.published - 1
+        while seq >= 0:
+            scan = self.get(seq, copy)
+            if scan is not None:
+                return scan
+            # Overwritten while we looked: the next one is complete by now
+            seq = self.published - 1
+        return None
+
+    def wait(self, timeout: float = None, poll: float = 0.002, copy: bool = False):
+        """Block until a revolution newer than the last one returned by wait()/iter_scans(); None on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.next_seq is None:
+            self.next_seq = self.published
+        while self.published <= self.next_seq:
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            time.sleep(poll)
+        seq = self.published - 1
+        self.next_seq = seq + 1
+        scan = self.get(seq, copy)
+        return scan if scan is not None else self.latest(copy)
+
+    def iter_scans(self, every: bool = True, timeout: float = None, poll: float = 0.002, copy: bool = False):
+        """
+        Yield revolutions as the daemon publishes them, starting with the next one.
+        :param every: Yield every revolution; a consumer that falls more than a ring
+                      behind skips ahead (counted in self.missed). False: newest only.
+        :param timeout: Stop after this long without a revolution (None: wait forever).
+        :param copy: Yield copies instead of views, as for get().
+        """
+        if self.next_seq is None:
+            self.next_seq = self.published
+        while True:
+            if not every:
+                scan = self.wait(timeout, poll, copy)
+                if scan is None:
+                    return
+                yield scan
+                continue
+            waited = time.monotonic()
+            while self.published <= self.next_seq:
+                if timeout is not None and time.monotonic() - waited > timeout:
+                    return
+                time.sleep(poll)
+            oldest = self.published - self.slots + 1
+            if self.next_seq < oldest:
+                self.missed += oldest - self.next_seq
+                self.next_seq = oldest
+            scan = self.get(self.next_seq, copy)
+            self.next_seq += 1
+            if scan is None:
+                self.missed += 1
+                continue
+            yield scan
+
+    def close(self):
+        # Unmapping under a live view would crash its next read: detach the scans still around
+        for scan in list(self.views):
+            scan.points = scan.points.copy()
+        self.views = weakref.WeakSet()
+        self.header = self.slot_headers = self.slot_points = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class LocalScans:
+    """
+    Run the lidar in this process, with the same iter_scans()/close() as a ScanRing.
+    A reader thread assembles the revolutions, so a slow consumer can skip to the newest.
+    """
+
+    def __init__(self, reader=None, slots: int = 16):
+        """
+        :param reader: Batch source (UltraSimpleReader, RPLidarDriver.iter_measurements()), UltraSimpleReader() by default.
+        :param slots: Revolutions kept for a consumer that falls behind, as in a ScanRing.
+        """
+        if reader is None:
+            from ultra_simple_reader import UltraSimpleReader
+            reader = UltraSimpleReader()
+        self.reader = reader
+        self.assembler = ScanAssembler()
+        self.cond = threading.Condition()
+        self.scans = deque()
+        self.slots = slots
+        self.done = False
+        self.thread = None
+        self.missed = 0
+
+    def __read(self):
+        try:
+            for scan in self.assembler.iter_scans(self.reader):
+                with self.cond:
+                    if len(self.scans) >= self.slots:
+                        self.scans.popleft()
+                        self.missed += 1
+                    self.scans.append(scan)
+                    self.cond.notify_all()
+        finally:
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+
+    def iter_scans(self, every: bool = True, timeout: float = None):
+        """Yield revolutions as they are assembled, with the same every/timeout as ScanRing.iter_scans()."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.__read, name="lidar_reader", daemon=True)
+            self.thread.start()
+        while True:
+            with self.cond:
+                if not self.cond.wait_for(lambda: self.scans or self.done, timeout) or not self.scans:
+                    return
+                if every:
+                    scan = self.scans.popleft()
+                else:
+                    scan = self.scans.pop()
+                    self.missed += len(self.scans)
+                    self.scans.clear()
+            yield scan
+
+    def close(self):
+        close = getattr(self.reader, 'close', None)
+        if close:
+            close()
+        if self.thread is not None:
+            self.thread.join(1.0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_scans(name: str = SHM_NAME, make_reader=None):
+    """
+    Scans from lidar_daemon.py if it is running, else from a lidar opened in this process.
+    :param make_reader: Called for the fallback's batch source, UltraSimpleReader() by default.
+    """
+    try:
+        ring = ScanRing.attach(name)
+    except (FileNotFoundError, ValueError):
+        ring = None
+    if ring is not None:
+        if ring.alive():
+            return ring
+        ring.close()
+    return LocalScans(make_reader() if make_reader else None)
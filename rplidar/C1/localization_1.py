@@ -1,12 +1,12 @@
-import subprocess
-import re
+import sys
 import numpy as np
 from breezyslam.algorithms import RMHC_SLAM
 from breezyslam.sensors import RPLidarA1
-import math
-import time
 import matplotlib.pyplot as plt
 import os
+from ultra_simple_reader import UltraSimpleReader
+from lidar_shm import open_scans
+from scan_log import ScanReplay
 os.environ["QT_QPA_PLATFORM"] = "xcb"
 
 # ==== CONFIGURATION ====
@@ -20,14 +20,10 @@ MAX_DISTANCE = 6000  # Maximum distance in mm for valid data
 MAP_SIZE_PIXELS = 500
 MAP_SIZE_METERS = 10
 
-# ==== LIDAR PARSER ====
-pattern = re.compile(r'theta:\s*([0-9.]+)\s+Dist:\s*([0-9.]+)')
-
 # ==== SLAM OBJECTS ====
 lidar_model = RPLidarA1()
 slam = RMHC_SLAM(lidar_model, MAP_SIZE_PIXELS, MAP_SIZE_METERS)
 mapbytes = bytearray(MAP_SIZE_PIXELS * MAP_SIZE_PIXELS)
-scan = [0] * SCAN_SIZE
 
 # ==== MATPLOTLIB SETUP ====
 plt.ion()
@@ -37,33 +33,25 @@ img = ax.imshow(np.zeros((MAP_SIZE_PIXELS, MAP_SIZE_PIXELS)), cmap='gray', origi
 robot_pos, = ax.plot([], [], 'ro')  # Robot position (red dot)
 ax.set_title("SLAM Map")
 
-# ==== RUN LIDAR SUBPROCESS ====
-proc = subprocess.Popen(
-    [ULTRA_SIMPLE_PATH, '--channel', '--serial', PORT, BAUD],
-    stdout=subprocess.PIPE,
-    stderr=subprocess.STDOUT,
-    text=True
-)
+# ==== LIDAR: a recording (argument), lidar_daemon.py, or our own subprocess ====
+if len(sys.argv) > 1:
+    lidar = ScanReplay(sys.argv[1])
+else:
+    lidar = open_scans(make_reader=lambda: UltraSimpleReader(ULTRA_SIMPLE_PATH, PORT, BAUD))
 
-last_update = time.time()
+last_update = 0
 pose_history = []
 
 print("Starting Lidar... Press Ctrl+C to stop.")
 
 try:
-    for line in proc.stdout:
-        match = pattern.search(line)
-        if match:
-            angle = int(float(match.group(1)))
-            distance = int(float(match.group(2)))
-
-            if 0 <= angle < SCAN_SIZE:
-                scan[angle] = distance if 0 < distance < MAX_DISTANCE else 0
+    for revolution in lidar.iter_scans(every=False):
+        scan = revolution.resample(SCAN_SIZE, max_distance=MAX_DISTANCE)
 
         # Feed a scan every ~0.2s
-        if time.time() - last_update > 0.2:
-            if any(scan):
-                slam.update(scan)
+        if revolution.t_end - last_update > 0.2e9:
+            if scan.any():
+                slam.update(scan.tolist())
                 x_mm, y_mm, theta_deg = slam.getpos()
                 print(f"Pose: x={x_mm/1000:.2f} m, y={y_mm/1000:.2f} m, θ={theta_deg:.1f}°")
                 pose_history.append((x_mm, y_mm))
@@ -80,14 +68,12 @@ try:
                 ax.set_ylim(0, MAP_SIZE_PIXELS)
                 plt.pause(0.001)
 
-            scan = [0] * SCAN_SIZE  # Reset scan for next set
-            last_update = time.time()
+            last_update = revolution.t_end
 
 except KeyboardInterrupt:
     print("Stopped by user.")
 
 finally:
-    proc.terminate()
-    proc.wait()
+    lidar.close()
     plt.ioff()
     plt.show()
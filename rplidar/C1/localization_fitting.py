@@ -1,15 +1,17 @@
-import subprocess
-import re
+import sys
 import matplotlib.pyplot as plt
 import numpy as np
 import cv2
-import math
 import time
 import logging
 import os
 from typing import Optional, Tuple
 from sklearn.cluster import KMeans
 
+from ultra_simple_reader import UltraSimpleReader
+from lidar_shm import open_scans
+from scan_log import ScanReplay
+
 # Configure logging for debugging and performance monitoring
 logging.basicConfig(
     level=logging.INFO,
@@ -60,19 +62,17 @@ def validate_environment() -> bool:
         return False
     return True
 
-def start_lidar_process() -> Optional[subprocess.Popen]:
-    """Start the LIDAR subprocess with error handling."""
-    try:
-        return subprocess.Popen(
-            [CONFIG['ULTRA_SIMPLE_PATH'], '--channel', '--serial', CONFIG['PORT'], CONFIG['BAUD']],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1
-        )
-    except subprocess.SubprocessError as e:
-        logger.error(f"Failed to start LIDAR process: {e}")
-        return None
+def open_lidar(replay: Optional[str] = None):
+    """Revolutions from a recording, from lidar_daemon.py, or from our own LIDAR subprocess."""
+    if replay:
+        return ScanReplay(replay)
+    return open_scans(make_reader=start_lidar_reader)
+
+def start_lidar_reader() -> UltraSimpleReader:
+    # Only needed when no lidar_daemon.py is running
+    if not validate_environment():
+        raise RuntimeError("Environment validation failed.")
+    return UltraSimpleReader(CONFIG['ULTRA_SIMPLE_PATH'], CONFIG['PORT'], CONFIG['BAUD'])
 
 def remove_outliers(points: np.ndarray) -> np.ndarray:
     """Remove outliers using IQR method to clean point cloud."""
@@ -168,9 +168,12 @@ def fit_fixed_rectangle(points: np.ndarray,
         logger.error(f"Rectangle fitting failed: {e}")
         return None, prev_angle
 
-def main():
+def main(replay: Optional[str] = None):
     """Run LIDAR visualization with real-time plotting."""
-    if not validate_environment():
+    try:
+        lidar = open_lidar(replay)
+    except (RuntimeError, OSError) as e:
+        logger.error(f"Failed to start LIDAR: {e}")
         return
 
     # Initialize plot
@@ -186,75 +189,39 @@ def main():
     rect_plot, = ax.plot([], [], 'g-', linewidth=2, label='Fitted Rectangle')
     ax.legend()
 
-    proc = start_lidar_process()
-    if not proc:
-        return
-
-    # Pre-allocate arrays for efficiency
-    points = np.zeros((CONFIG['MAX_POINTS'], 2), dtype=np.float32)
-    point_count = 0
-    last_update = time.time()
+    # Scan time (ns) of the last update
+    last_update = 0
     prev_angle: Optional[float] = None
 
     logger.info("Starting LIDAR visualization. Press Ctrl+C to stop.")
-    pattern = re.compile(r'theta:\s*([0-9.]+)\s+Dist:\s*([0-9.]+)')
 
     try:
-        while True:
-            try:
-                line = proc.stdout.readline().strip()
-                if not line and proc.poll() is not None:
-                    logger.error("LIDAR process terminated unexpectedly")
-                    break
-
-                match = pattern.search(line)
-                if match:
-                    try:
-                        angle = float(match.group(1))
-                        distance = float(match.group(2))
-                        if 0 < distance < CONFIG['MAX_DISTANCE'] and point_count < CONFIG['MAX_POINTS']:
-                            theta = math.radians(angle)
-                            points[point_count] = [distance * math.cos(theta), distance * math.sin(theta)]
-                            point_count += 1
-                    except ValueError as e:
-                        logger.warning(f"Invalid data format: {line}, error: {e}")
-                        continue
-
-                # Update plot periodically
-                if time.time() - last_update > CONFIG['UPDATE_INTERVAL'] and point_count > 0:
-                    start_time = time.time()
-                    active_points = points[:point_count]
-                    scan_plot.set_data(active_points[:, 0], active_points[:, 1])
-
-                    box, prev_angle = fit_fixed_rectangle(active_points, prev_angle=prev_angle)
-                    rect_plot.set_data(box[:, 0], box[:, 1]) if box is not None else rect_plot.set_data([], [])
-
-                    try:
-                        fig.canvas.draw_idle()
-                        fig.canvas.flush_events()
-                    except Exception as e:
-                        logger.error(f"Plotting error: {e}")
-
-                    point_count = 0  # Reset point count
-                    logger.debug(f"Plot update time: {time.time()-start_time:.3f}s")
-                    last_update = time.time()
-
-            except subprocess.SubprocessError as e:
-                logger.error(f"Subprocess error: {e}")
-                break
+        for revolution in lidar.iter_scans(every=False):
+            # Update plot periodically, with the newest revolution
+            if revolution.t_end - last_update > CONFIG['UPDATE_INTERVAL'] * 1e9:
+                start_time = time.time()
+                active_points = revolution.xy(CONFIG['MAX_DISTANCE'])[:CONFIG['MAX_POINTS']].astype(np.float32)
+                scan_plot.set_data(active_points[:, 0], active_points[:, 1])
+
+                box, prev_angle = fit_fixed_rectangle(active_points, prev_angle=prev_angle)
+                rect_plot.set_data(box[:, 0], box[:, 1]) if box is not None else rect_plot.set_data([], [])
+
+                try:
+                    fig.canvas.draw_idle()
+                    fig.canvas.flush_events()
+                except Exception as e:
+                    logger.error(f"Plotting error: {e}")
+
+                logger.debug(f"Plot update time: {time.time()-start_time:.3f}s")
+                last_update = revolution.t_end
 
     except KeyboardInterrupt:
         logger.info("Visualization stopped by user")
     finally:
-        if proc:
-            try:
-                proc.terminate()
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                logger.warning("LIDAR process did not terminate gracefully, forcing kill")
-                proc.kill()
-            except Exception as e:
-                logger.error(f"Error terminating process: {e}")
+        try:
+            lidar.close()
+        except Exception as e:
+            logger.error(f"Error closing LIDAR: {e}")
 
         plt.ioff()
         try:
@@ -263,6 +230,7 @@ def main():
             logger.error(f"Error displaying final plot: {e}")
         logger.info("LIDAR visualization terminated")
 
+# Example usage: python3 localization_fitting.py [recording.npz]
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
 
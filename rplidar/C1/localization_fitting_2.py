@@ -1,5 +1,4 @@
-import subprocess
-import re
+import sys
 import matplotlib.pyplot as plt
 import numpy as np
 import cv2
@@ -10,6 +9,10 @@ import os
 from typing import Optional, Tuple
 from sklearn.cluster import KMeans
 
+from ultra_simple_reader import UltraSimpleReader
+from lidar_shm import open_scans
+from scan_log import ScanReplay
+
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("LIDAR")
@@ -36,15 +39,17 @@ def validate_environment() -> bool:
            os.access(CONFIG['ULTRA_SIMPLE_PATH'], os.X_OK) and \
            os.path.exists(CONFIG['PORT'])
 
-def start_lidar_process() -> Optional[subprocess.Popen]:
-    try:
-        return subprocess.Popen(
-            [CONFIG['ULTRA_SIMPLE_PATH'], '--channel', '--serial', CONFIG['PORT'], CONFIG['BAUD']],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1
-        )
-    except subprocess.SubprocessError as e:
-        logger.error(f"Failed to start LIDAR process: {e}")
-        return None
+def open_lidar(replay: Optional[str] = None):
+    # Revolutions from a recording, from lidar_daemon.py, or from our own LIDAR subprocess
+    if replay:
+        return ScanReplay(replay)
+    return open_scans(make_reader=start_lidar_reader)
+
+def start_lidar_reader() -> UltraSimpleReader:
+    # Only needed when no lidar_daemon.py is running
+    if not validate_environment():
+        raise RuntimeError("Environment validation failed.")
+    return UltraSimpleReader(CONFIG['ULTRA_SIMPLE_PATH'], CONFIG['PORT'], CONFIG['BAUD'])
 
 def remove_outliers(points: np.ndarray) -> np.ndarray:
     if len(points) < CONFIG['MIN_POINTS']:
@@ -127,13 +132,11 @@ def update_heading_text(ax, text_obj, angle: float):
     return text_obj
 
 # Main
-def main():
-    if not validate_environment():
-        logger.error("Environment validation failed.")
-        return
-
-    proc = start_lidar_process()
-    if not proc:
+def main(replay: Optional[str] = None):
+    try:
+        lidar = open_lidar(replay)
+    except (RuntimeError, OSError) as e:
+        logger.error(f"Failed to start LIDAR: {e}")
         return
 
     plt.ion()
@@ -150,35 +153,16 @@ def main():
     heading_text = None
     ax.legend()
 
-    pattern = re.compile(r'theta:\s*([0-9.]+)\s+Dist:\s*([0-9.]+)')
-    points = np.zeros((CONFIG['MAX_POINTS'], 2), dtype=np.float32)
-    point_count = 0
-    last_update = time.time()
+    # Scan time (ns) of the last update
+    last_update = 0
     prev_angle = 0.0
 
     logger.info("📡 Starting LIDAR visualization...")
 
     try:
-        while True:
-            line = proc.stdout.readline().strip()
-            if not line and proc.poll() is not None:
-                logger.error("LIDAR process terminated unexpectedly.")
-                break
-
-            match = pattern.search(line)
-            if match:
-                try:
-                    angle = float(match.group(1))
-                    distance = float(match.group(2))
-                    if 0 < distance < CONFIG['MAX_DISTANCE'] and point_count < CONFIG['MAX_POINTS']:
-                        theta = math.radians(angle)
-                        points[point_count] = [distance * math.cos(theta), distance * math.sin(theta)]
-                        point_count += 1
-                except ValueError:
-                    continue
-
-            if time.time() - last_update > CONFIG['UPDATE_INTERVAL'] and point_count > 0:
-                active = points[:point_count]
+        for revolution in lidar.iter_scans(every=False):
+            if revolution.t_end - last_update > CONFIG['UPDATE_INTERVAL'] * 1e9:
+                active = revolution.xy(CONFIG['MAX_DISTANCE'])[:CONFIG['MAX_POINTS']].astype(np.float32)
                 scan_plot.set_data(active[:, 0], active[:, 1])
 
                 box, prev_angle, center = fit_fixed_rectangle(active, prev_angle)
@@ -191,23 +175,18 @@ def main():
 
                 fig.canvas.draw_idle()
                 fig.canvas.flush_events()
-                point_count = 0
-                last_update = time.time()
+                last_update = revolution.t_end
 
     except KeyboardInterrupt:
         logger.info("🛑 Stopped by user.")
     finally:
-        if proc:
-            try:
-                proc.terminate()
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                proc.kill()
+        lidar.close()
 
         plt.ioff()
         plt.show()
         logger.info("✅ Visualization complete.")
 
+# Example usage: python3 localization_fitting_2.py [recording.npz]
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
 
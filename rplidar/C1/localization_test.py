@@ -1,13 +1,20 @@
 import os
-import re
+import sys
 import time
 import math
 import numpy as np
-import subprocess
 from breezyslam.algorithms import RMHC_SLAM
 from breezyslam.sensors import RPLidarA1
 
-def run_slam(show_map=False, verbose=True, update_rate=0.2, loop_distance_thresh=0.8):
+from ultra_simple_reader import UltraSimpleReader
+from lidar_shm import open_scans
+from scan_log import ScanReplay
+from loop_closure import find_loop_closures
+from pose_graph import PoseGraph, same_place_information
+
+
+def run_slam(show_map=False, verbose=True, update_rate=0.2, loop_distance_thresh=0.8, loop_max_heading=None,
+             replay=None, replay_speed=1.0):
     if show_map:
         import matplotlib.pyplot as plt
         plt.ion()
@@ -21,36 +28,31 @@ def run_slam(show_map=False, verbose=True, update_rate=0.2, loop_distance_thresh
     PORT, BAUD = '/dev/ttyUSB0', '460800'
     ULTRA_SIMPLE_PATH = './ultra_simple'
     MAP_PIXELS, MAP_METERS = 500, 10
-    POSE_LOG, OPT_POSE_LOG, G2O_EXEC = 'graph.g2o', 'graph_optimized.g2o', 'g2o'
+    POSE_LOG, OPT_POSE_LOG = 'graph.g2o', 'graph_optimized.g2o'
 
-    slam = RMHC_SLAM(RPLidarA1(), MAP_PIXELS, MAP_METERS)
-    scan = [0] * 360
+    lidar_model = RPLidarA1()
+    slam = RMHC_SLAM(lidar_model, MAP_PIXELS, MAP_METERS)
     pose_history = []
     origin_estimates = []
 
-    proc = subprocess.Popen(
-        [ULTRA_SIMPLE_PATH, '--channel', '--serial', PORT, BAUD],
-        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
-    )
+    # Revolutions from a recording, from lidar_daemon.py, or from our own LIDAR subprocess
+    if replay:
+        lidar = ScanReplay(replay, speed=replay_speed)
+    else:
+        lidar = open_scans(make_reader=lambda: UltraSimpleReader(ULTRA_SIMPLE_PATH, PORT, BAUD))
     if verbose:
         print("Lidar started. Ctrl+C to stop.")
 
-    pattern = re.compile(r'theta:\s*([0-9.]+)\s+Dist:\s*([0-9.]+)')
     skip_first, origin_set, pose_locked = True, False, False
     prev_x = prev_y = prev_theta = None
-    last_update = time.time()
+    # Scan time (ns) of the last update, so replays at any speed update alike
+    last_update = 0
 
     try:
-        for line in proc.stdout:
-            match = pattern.search(line)
-            if match:
-                angle = int(float(match[1]))
-                dist = int(float(match[2]))
-                if 0 <= angle < 360:
-                    scan[angle] = dist if 0 < dist < 6000 else 0
-
-            if time.time() - last_update > update_rate and any(scan):
-                slam.update(scan)
+        for revolution in lidar.iter_scans(every=False):
+            scan = revolution.resample(lidar_model.scan_size, max_distance=6000)
+            if revolution.t_end - last_update > update_rate * 1e9 and scan.any():
+                slam.update(scan.tolist())
                 x, y, theta = slam.getpos()
 
                 if not origin_set:
@@ -64,8 +66,7 @@ def run_slam(show_map=False, verbose=True, update_rate=0.2, loop_distance_thresh
                             origin_set = True
                             if verbose:
                                 print("Calibration done")
-                    scan = [0] * 360
-                    last_update = time.time()
+                    last_update = revolution.t_end
                     continue
 
                 rx = x - origin_x
@@ -80,8 +81,7 @@ def run_slam(show_map=False, verbose=True, update_rate=0.2, loop_distance_thresh
                     if pose_locked and (dx > 500 or dy > 500 or dtheta > 60):
                         if verbose:
                             print("Jump detected. Skipping.")
-                        scan = [0] * 360
-                        last_update = time.time()
+                        last_update = revolution.t_end
                         continue
                 else:
                     pose_locked = True
@@ -97,15 +97,13 @@ def run_slam(show_map=False, verbose=True, update_rate=0.2, loop_distance_thresh
                     robot_pos.set_data(px, py)
                     plt.pause(0.001)
 
-                scan = [0] * 360
-                last_update = time.time()
+                last_update = revolution.t_end
 
     except KeyboardInterrupt:
         if verbose:
             print("Stopped.")
     finally:
-        proc.terminate()
-        proc.wait()
+        lidar.close()
         if show_map:
             plt.ioff()
             plt.show()
@@ -114,54 +112,40 @@ def run_slam(show_map=False, verbose=True, update_rate=0.2, loop_distance_thresh
         print(f"Total poses: {len(pose_history)}")
         print("Writing graph file...")
 
-    with open(POSE_LOG, 'w') as f:
-        for i, (x, y, th) in enumerate(pose_history):
-            f.write(f"VERTEX_SE2 {i} {x / 1000:.4f} {y / 1000:.4f} {th:.6f}\n")
-
-        for i in range(1, len(pose_history)):
-            dx = (pose_history[i][0] - pose_history[i - 1][0]) / 1000.0
-            dy = (pose_history[i][1] - pose_history[i - 1][1]) / 1000.0
-            dth = pose_history[i][2] - pose_history[i - 1][2]
-            f.write(f"EDGE_SE2 {i - 1} {i} {dx:.4f} {dy:.4f} {dth:.6f} 1000 0 0 1000 0 1000\n")
-
-        # Robust loop closure logic with FULL debug (log distances to an explicit path)
-        loop_count = 0
-        min_pose_gap = 5
-        log_path = '/home/bo/Desktop/rplidar/C1/loop_distances.log'
-        with open(log_path, 'w') as flog:
-            flog.write('i,j,dist\n')
-            for i, (x1, y1, th1) in enumerate(pose_history[:-min_pose_gap]):
-                for j in range(i + min_pose_gap, len(pose_history)):
-                    x2, y2, th2 = pose_history[j]
-                    dist = math.hypot(x2 - x1, y2 - y1) / 1000.0
-                    flog.write(f'{i},{j},{dist:.4f}\n')
-                    if verbose:
-                        print(f"Testing loop i={i} j={j} dist={dist:.3f}")
-                    if dist < loop_distance_thresh:
-                        dx = (x2 - x1) / 1000.0
-                        dy = (y2 - y1) / 1000.0
-                        dth = th2 - th1
-                        f.write(f"EDGE_SE2 {i} {j} {dx:.4f} {dy:.4f} {dth:.6f} 5000 0 0 5000 0 5000\n")
-                        loop_count += 1
-                        if verbose:
-                            print(f"🔁 Loop closure edge added: {i} ↔ {j} | Δx={dx:.2f}m, Δy={dy:.2f}m, Δθ={math.degrees(dth):.1f}°")
-        f.write("FIX 0\n")
+    # Pose graph in meters: odometry edges between consecutive poses
+    graph = PoseGraph()
+    for x, y, th in pose_history:
+        graph.add_vertex((x / 1000, y / 1000, th))
+    for i in range(1, len(graph)):
+        graph.add_edge(i - 1, i)
+
+    # Loop closures: pose pairs within loop_distance_thresh from a KD-tree, one per revisit
+    loop_count = 0
+    min_pose_gap = 5
+    t0 = time.perf_counter()
+    loops = find_loop_closures(pose_history, loop_distance_thresh * 1000, min_gap=min_pose_gap,
+                               max_heading=loop_max_heading)
+    # "Same place" edges: the candidates are only known to be within the search gates of each other
+    loop_information = same_place_information(loop_distance_thresh, loop_max_heading)
+    for i, j in loops:
+        graph.add_edge(i, j, (0.0, 0.0, 0.0), loop_information)
+        loop_count += 1
         if verbose:
-            print(f"🔗 Total loop closures added: {loop_count}")
-        print(f"Loop distances log written to: {log_path}")
+            gap = np.hypot(*(graph.poses[j, :2] - graph.poses[i, :2]))
+            print(f"🔁 Loop closure edge added: {i} ↔ {j} | {gap:.2f}m apart")
+    if verbose:
+        print(f"🔗 Total loop closures added: {loop_count} ({(time.perf_counter() - t0) * 1000:.1f} ms search)")
+    graph.write_g2o(POSE_LOG)
 
     if verbose:
         print(f"Optimizing {POSE_LOG}...")
-    subprocess.run([G2O_EXEC, "-o", OPT_POSE_LOG, POSE_LOG])
+    chi2 = graph.optimize()
+    graph.write_g2o(OPT_POSE_LOG)
     if verbose:
-        print(f"✅ Saved optimized graph to {OPT_POSE_LOG}")
+        print(f"✅ Saved optimized graph to {OPT_POSE_LOG} (chi2 {chi2:.3g})")
 
     if show_map:
-        with open(OPT_POSE_LOG, "r") as f:
-            opt = [(float(x), float(y)) for l in f if l.startswith("VERTEX_SE2")
-                   for _, _, x, y, _ in [l.strip().split()]]
-        opt_x = [x * MAP_PIXELS / MAP_METERS for x, _ in opt]
-        opt_y = [y * MAP_PIXELS / MAP_METERS for _, y in opt]
+        opt_x, opt_y = (graph.poses[:, :2] * MAP_PIXELS / MAP_METERS).T
 
         fig2, ax2 = plt.subplots(figsize=(6, 6))
         ax2.plot(opt_x, opt_y, 'g-', label='Optimized Path')
@@ -172,5 +156,6 @@ def run_slam(show_map=False, verbose=True, update_rate=0.2, loop_distance_thresh
         ax2.legend()
         plt.show()
 
+# Example usage: python3 localization_test.py [recording.npz]
 if __name__ == "__main__":
-    run_slam(show_map=False, verbose=True)
+    run_slam(show_map=False, verbose=True, replay=sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,85 @@
+"""
+Loop-closure candidate search over a pose history with a KD-tree.
+
+Instead of testing every pair of poses, the positions go into a
+scipy.spatial.cKDTree and only pairs within the loop-closure radius are
+looked at:
+
+    pairs = find_loop_closures(poses, radius=250, min_gap=10)
+    for i, j in pairs:
+        ...    # add an EDGE_SE2 i j
+
+poses is an (n, 3) array of x, y, theta (radians), in any length unit as
+long as the distances passed in use the same one.
+
+To keep one visit from turning into hundreds of edges, only keyframes take
+part: the first pose after every `spacing` of path length, so a robot
+standing still contributes one pose. Each keyframe is then linked only to
+the closest keyframe of every earlier pass through its neighbourhood.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def wrap_angle(angle):
+    """Angle(s) in radians wrapped to [-pi, pi)."""
+    return (np.asarray(angle) + np.pi) % (2 * np.pi) - np.pi
+
+
+def keyframes(poses, spacing: float) -> np.ndarray:
+    """Indices of the first pose and the first after every `spacing` of path length."""
+    xy = np.asarray(poses, dtype=np.float64).reshape(-1, 3)[:, :2]
+    travelled = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))))
+    step = np.floor(travelled / spacing)
+    first = np.ones(len(step), dtype=bool)
+    first[1:] = step[1:] != step[:-1]
+    return np.flatnonzero(first)
+
+
+def find_loop_closures(poses, radius: float, min_gap: int = 10, min_travel: float = None,
+                       max_heading: float = None, spacing: float = None) -> np.ndarray:
+    """
+    Pairs of poses (i < j) close enough to be the same place visited twice.
+    :param radius: Max distance between the two positions.
+    :param min_gap: Min index difference j - i, so neighbours in time don't count.
+    :param min_travel: Min path length driven from i to j (default 2 * radius), so
+                       wandering about one spot isn't taken for a loop.
+    :param max_heading: Max heading difference (radians), None to accept any.
+    :param spacing: Keyframe spacing along the path (default radius / 2), 0 for every pose.
+    :return: (m, 2) int array of pose indices (i, j), sorted by j then i.
+    """
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+    if min_travel is None:
+        min_travel = 2 * radius
+    if spacing is None:
+        spacing = radius / 2
+    if len(poses) <= min_gap:
+        return np.zeros((0, 2), dtype=np.int64)
+    xy = poses[:, :2]
+    travelled = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))))
+    keys = keyframes(poses, spacing) if spacing > 0 else np.arange(len(poses))
+
+    # Pairs of keyframe numbers (a < b) within radius, then the gates on the poses
+    pairs = cKDTree(xy[keys]).query_pairs(radius, output_type='ndarray')
+    a, b = pairs[:, 0], pairs[:, 1]
+    i, j = keys[a], keys[b]
+    keep = (j - i >= min_gap) & (travelled[j] - travelled[i] >= min_travel)
+    if max_heading is not None:
+        keep &= np.abs(wrap_angle(poses[j, 2] - poses[i, 2])) <= max_heading
+    a, b, i, j = a[keep], b[keep], i[keep], j[keep]
+    if not len(a):
+        return np.zeros((0, 2), dtype=np.int64)
+
+    # A pass: consecutive keyframes a matched by the same b. Keep the closest of each.
+    order = np.lexsort((a, b))
+    a, b, i, j = a[order], b[order], i[order], j[order]
+    new_pass = np.ones(len(a), dtype=bool)
+    new_pass[1:] = (b[1:] != b[:-1]) | (a[1:] != a[:-1] + 1)
+    pass_id = np.cumsum(new_pass)
+    distance = np.hypot(*(xy[j] - xy[i]).T)
+    order = np.lexsort((distance, pass_id))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pass_id[order][1:] != pass_id[order][:-1]
+    best = np.sort(order[first])
+    return np.column_stack((i[best], j[best]))
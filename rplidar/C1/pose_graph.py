@@ -0,0 +1,293 @@
+"""
+SE(2) pose-graph optimization in Python, instead of the external g2o binary.
+
+Vertices are poses (x, y, theta); an edge i -> j is a measurement of pose j
+in the frame of pose i with a 3x3 information matrix, exactly like g2o's
+VERTEX_SE2 / EDGE_SE2, so graphs are read and written in the .g2o format
+and results can be checked against g2o:
+
+    graph = PoseGraph.read_g2o('graph.g2o')
+    graph.optimize()
+    graph.write_g2o('graph_optimized.g2o')
+
+All edges are linearized at once with NumPy into a sparse Jacobian, and
+each Gauss-Newton / Levenberg-Marquardt step solves the sparse normal
+equations with SciPy (SuperLU). For online use, add vertices and edges as
+they come and call update(); it only re-optimizes after a loop closure.
+
+A loop edge must carry a measurement of its own (a scan match, or the
+"same place" constraint of same_place_information()): one computed from the
+current poses has zero error and moves nothing.
+
+Usage:
+    python3 pose_graph.py graph.g2o -o graph_optimized.g2o [--compare g2o_result.g2o]
+"""
+
+import argparse
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+
+# Information matrices of the edges slam.py writes ("1000 0 0 1000 0 1000")
+ODOMETRY_INFO = np.diag([1000.0, 1000.0, 1000.0])
+LOOP_INFO = np.diag([1000.0, 1000.0, 1000.0])
+
+
+def same_place_information(radius: float, max_heading: float = None) -> np.ndarray:
+    """
+    Information of a "same place" loop edge, measurement (0, 0, 0), between two poses that
+    were found within radius (and max_heading radians) of each other: one sigma is the gate.
+    Without a heading gate their heading difference is left free.
+    """
+    return np.diag([radius ** -2, radius ** -2, 0.0 if max_heading is None else max_heading ** -2])
+
+
+def wrap_angle(angle):
+    """Angle(s) in radians wrapped to [-pi, pi)."""
+    return (np.asarray(angle) + np.pi) % (2 * np.pi) - np.pi
+
+
+def relative_pose(a, b) -> np.ndarray:
+    """Pose b in the frame of pose a, i.e. the measurement of an edge a -> b."""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    c, s = np.cos(a[..., 2]), np.sin(a[..., 2])
+    dx, dy = b[..., 0] - a[..., 0], b[..., 1] - a[..., 1]
+    return np.stack((c * dx + s * dy, -s * dx + c * dy, wrap_angle(b[..., 2] - a[..., 2])), axis=-1)
+
+
+def compose(a, z) -> np.ndarray:
+    """Pose a moved by z (in the frame of a); inverse of relative_pose()."""
+    a, z = np.asarray(a, dtype=np.float64), np.asarray(z, dtype=np.float64)
+    c, s = np.cos(a[..., 2]), np.sin(a[..., 2])
+    return np.stack((a[..., 0] + c * z[..., 0] - s * z[..., 1], a[..., 1] + s * z[..., 0] + c * z[..., 1],
+                     wrap_angle(a[..., 2] + z[..., 2])), axis=-1)
+
+
+class PoseGraph:
+    """SE(2) pose graph with vertices (n, 3) and edges i -> j with measurement and information."""
+
+    def __init__(self):
+        self.poses = np.zeros((0, 3))
+        self.ids = []
+        self.fixed = set()
+        self.edge_i, self.edge_j = [], []
+        self.measurements, self.information = [], []
+        # update() re-optimizes only after a loop closure was added
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.poses)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_i)
+
+    def add_vertex(self, pose, vertex_id: int = None, fixed: bool = False) -> int:
+        """Add a pose; vertex_id is only kept for writing .g2o files. :return: its index."""
+        index = len(self.poses)
+        self.poses = np.vstack((self.poses, np.asarray(pose, dtype=np.float64).reshape(1, 3)))
+        self.ids.append(index if vertex_id is None else vertex_id)
+        if fixed:
+            self.fixed.add(index)
+        return index
+
+    def add_edge(self, i: int, j: int, measurement=None, information=None, loop: bool = None):
+        """
+        Add a constraint: pose j seen from pose i.
+        :param measurement: (dx, dy, dtheta), default: as the current poses are (odometry only).
+        :param information: 3x3 information matrix, default ODOMETRY_INFO / LOOP_INFO.
+        :param loop: Whether this closes a loop (default: j isn't i + 1), which makes update() optimize.
+        """
+        if loop is None:
+            loop = j != i + 1
+        if measurement is None:
+            if loop:
+                raise ValueError("a loop edge needs a measurement that does not come from the current poses")
+            measurement = relative_pose(self.poses[i], self.poses[j])
+        if information is None:
+            information = LOOP_INFO if loop else ODOMETRY_INFO
+        self.edge_i.append(i)
+        self.edge_j.append(j)
+        self.measurements.append(np.asarray(measurement, dtype=np.float64))
+        self.information.append(np.asarray(information, dtype=np.float64).reshape(3, 3))
+        if loop:
+            self.dirty = True
+
+    def append(self, measurement, information=None) -> int:
+        """
+        Add the next pose by odometry: a vertex at the last pose moved by measurement,
+        and the edge between them. Starts the graph at measurement if it is empty.
+        :return: Index of the new vertex.
+        """
+        if not len(self.poses):
+            return self.add_vertex(measurement)
+        j = self.add_vertex(compose(self.poses[-1], measurement))
+        self.add_edge(j - 1, j, measurement, information, loop=False)
+        return j
+
+    def update(self, **kwargs) -> bool:
+        """Re-optimize if a loop closure was added since the last optimization. :return: True if it did."""
+        if not self.dirty:
+            return False
+        self.optimize(**kwargs)
+        return True
+
+    def errors(self, poses: np.ndarray = None):
+        """
+        Residuals and Jacobian blocks of all edges at poses (default: the current ones).
+        :return: (e (m, 3), A (m, 3, 3) = de/dx_i, B (m, 3, 3) = de/dx_j)
+        """
+        poses = self.poses if poses is None else poses
+        I, J = np.asarray(self.edge_i), np.asarray(self.edge_j)
+        z = np.array(self.measurements).reshape(-1, 3)
+        xi, xj = poses[I], poses[J]
+        ci, si = np.cos(xi[:, 2]), np.sin(xi[:, 2])
+        cz, sz = np.cos(z[:, 2]), np.sin(z[:, 2])
+        dx, dy = xj[:, 0] - xi[:, 0], xj[:, 1] - xi[:, 1]
+        # Translation of j in the frame of i, then compared in the frame of the measurement
+        px, py = ci * dx + si * dy - z[:, 0], -si * dx + ci * dy - z[:, 1]
+        e = np.column_stack((cz * px + sz * py, -sz * px + cz * py, wrap_angle(xj[:, 2] - xi[:, 2] - z[:, 2])))
+
+        c, s = np.cos(xi[:, 2] + z[:, 2]), np.sin(xi[:, 2] + z[:, 2])
+        qx, qy = -si * dx + ci * dy, -ci * dx - si * dy
+        B = np.zeros((len(I), 3, 3))
+        B[:, 0, 0], B[:, 0, 1], B[:, 1, 0], B[:, 1, 1], B[:, 2, 2] = c, s, -s, c, 1
+        A = -B
+        A[:, 0, 2] = cz * qx + sz * qy
+        A[:, 1, 2] = -sz * qx + cz * qy
+        return e, A, B
+
+    def chi2(self, poses: np.ndarray = None) -> float:
+        """Sum of the squared, information-weighted edge errors."""
+        if not self.edge_count:
+            return 0.0
+        e = self.errors(poses)[0]
+        return float(np.einsum('mi,mij,mj->', e, np.array(self.information), e))
+
+    def __linearize(self):
+        """:return: (H, b, chi2) of the normal equations over all vertices, H sparse."""
+        e, A, B = self.errors()
+        omega = np.array(self.information)
+        m, n = len(e), len(self.poses)
+        I, J = np.asarray(self.edge_i), np.asarray(self.edge_j)
+        # Jacobian (3m x 3n): block row k holds A_k at column block i and B_k at column block j
+        rows = np.broadcast_to((3 * np.arange(m))[:, None, None] + np.arange(3)[None, :, None], (m, 3, 3)).ravel()
+        cols_i = np.broadcast_to(3 * I[:, None, None] + np.arange(3)[None, None, :], (m, 3, 3)).ravel()
+        cols_j = np.broadcast_to(3 * J[:, None, None] + np.arange(3)[None, None, :], (m, 3, 3)).ravel()
+        jac = sparse.csr_matrix((np.concatenate((A.ravel(), B.ravel())),
+                                 (np.concatenate((rows, rows)), np.concatenate((cols_i, cols_j)))),
+                                shape=(3 * m, 3 * n))
+        weight = sparse.bsr_matrix((omega, np.arange(m), np.arange(m + 1)), shape=(3 * m, 3 * m))
+        weighted = weight @ jac
+        H = (jac.T @ weighted).tocsc()
+        b = jac.T @ (weight @ e.ravel())
+        chi2 = float(e.ravel() @ (weight @ e.ravel()))
+        return H, b, chi2
+
+    def optimize(self, iterations: int = 20, method: str = 'lm', tolerance: float = 1e-6,
+                 verbose: bool = False) -> float:
+        """
+        Optimize all free vertices (vertex 0 is held fixed if none is).
+        :param method: 'lm' (Levenberg-Marquardt) or 'gn' (Gauss-Newton).
+        :param tolerance: Stop when chi2 improves by less than this fraction.
+        :return: Final chi2.
+        """
+        self.dirty = False
+        n = len(self.poses)
+        if not self.edge_count or not n:
+            return 0.0
+        fixed = self.fixed or {0}
+        free = np.setdiff1d(np.arange(3 * n), [3 * v + k for v in fixed for k in range(3)])
+        lam = 1e-4 if method == 'lm' else 0.0
+        H, b, chi2 = self.__linearize()
+        for iteration in range(iterations):
+            Hf = H[free][:, free]
+            bf = b[free]
+            diagonal = Hf.diagonal()
+            while True:
+                damped = Hf + sparse.diags(lam * (diagonal + 1e-9)) if lam else Hf
+                step = spsolve(damped.tocsc(), -bf)
+                poses = self.poses.copy()
+                poses.ravel()[free] += step
+                poses[:, 2] = wrap_angle(poses[:, 2])
+                new_chi2 = self.chi2(poses)
+                if method != 'lm' or new_chi2 <= chi2 or lam > 1e8:
+                    break
+                lam *= 10
+            if method == 'lm' and not new_chi2 <= chi2:
+                # No damping helps any more: at a minimum
+                break
+            self.poses = poses
+            improvement = (chi2 - new_chi2) / max(chi2, 1e-12)
+            if verbose:
+                print("iteration %d: chi2 %.6g, lambda %.1e" % (iteration, new_chi2, lam))
+            if method == 'lm':
+                lam = max(lam / 10, 1e-9)
+            H, b, chi2 = self.__linearize()
+            if abs(improvement) < tolerance:
+                break
+        return chi2
+
+    @classmethod
+    def read_g2o(cls, path: str):
+        """Read VERTEX_SE2, EDGE_SE2 and FIX lines of a .g2o file."""
+        graph = cls()
+        index = {}
+        edges, fixed = [], []
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if not fields:
+                    continue
+                if fields[0] == 'VERTEX_SE2':
+                    index[int(fields[1])] = graph.add_vertex([float(v) for v in fields[2:5]], int(fields[1]))
+                elif fields[0] == 'EDGE_SE2':
+                    edges.append(fields[1:])
+                elif fields[0] == 'FIX':
+                    fixed += [int(v) for v in fields[1:]]
+        for fields in edges:
+            i, j = index[int(fields[0])], index[int(fields[1])]
+            i11, i12, i13, i22, i23, i33 = (float(v) for v in fields[5:11])
+            info = [[i11, i12, i13], [i12, i22, i23], [i13, i23, i33]]
+            graph.add_edge(i, j, [float(v) for v in fields[2:5]], info)
+        graph.fixed = {index[v] for v in fixed if v in index}
+        graph.dirty = False
+        return graph
+
+    def write_g2o(self, path: str):
+        """Write the graph with the current poses as a .g2o file."""
+        with open(path, 'w') as f:
+            for vid, (x, y, th) in zip(self.ids, self.poses):
+                f.write(f"VERTEX_SE2 {vid} {x:.6f} {y:.6f} {th:.6f}\n")
+            for i, j, z, info in zip(self.edge_i, self.edge_j, self.measurements, self.information):
+                f.write(f"EDGE_SE2 {self.ids[i]} {self.ids[j]} {z[0]:.6f} {z[1]:.6f} {z[2]:.6f} "
+                        f"{info[0, 0]:g} {info[0, 1]:g} {info[0, 2]:g} {info[1, 1]:g} {info[1, 2]:g} {info[2, 2]:g}\n")
+            for v in sorted(self.fixed or ({0} if self.ids else set())):
+                f.write(f"FIX {self.ids[v]}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize a .g2o SE(2) pose graph")
+    parser.add_argument("graph", help="input .g2o file")
+    parser.add_argument("-o", "--output", help="write the optimized graph here")
+    parser.add_argument("-i", "--iterations", type=int, default=20)
+    parser.add_argument("--method", choices=["lm", "gn"], default="lm")
+    parser.add_argument("--compare", help="another optimized .g2o (e.g. from g2o) to compare poses with")
+    args = parser.parse_args()
+
+    graph = PoseGraph.read_g2o(args.graph)
+    print("%d vertices, %d edges, initial chi2 %.6g" % (len(graph), graph.edge_count, graph.chi2()))
+    chi2 = graph.optimize(args.iterations, args.method, verbose=True)
+    print("final chi2 %.6g" % chi2)
+    if args.output:
+        graph.write_g2o(args.output)
+    if args.compare:
+        other = PoseGraph.read_g2o(args.compare)
+        position = np.hypot(*(graph.poses[:, :2] - other.poses[:, :2]).T)
+        heading = np.abs(wrap_angle(graph.poses[:, 2] - other.poses[:, 2]))
+        print("vs %s: chi2 %.6g, position diff max %.4g mean %.4g, heading diff max %.4g rad" % (
+            args.compare, graph.chi2(other.poses), position.max(), position.mean(), heading.max()))
+
+
+if __name__ == "__main__":
+    main()
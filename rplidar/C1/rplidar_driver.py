@@ -0,0 +1,319 @@
+"""
+Native RPLidar serial driver (C1 at 460800 baud, A1 at 115200).
+
+Talks the RPLidar protocol directly instead of running ./ultra_simple and
+parsing its text output. Measurements are decoded in bulk with NumPy: every
+serial read becomes arrays of angle (degrees), distance (mm), quality and
+start-of-revolution flags.
+
+    lidar = RPLidarDriver('/dev/ttyUSB0', 460800)
+    print(lidar.get_info(), lidar.get_health())
+    for angle, dist, quality, start in lidar.iter_measurements():
+        ...
+    lidar.stop()
+    lidar.disconnect()
+
+Both the standard scan (5 byte nodes) and the express scan (84 byte
+capsules, legacy or dense format) are supported. The decoders work on plain
+bytes, so they can also be fed from a recording.
+"""
+
+import time
+import struct
+import numpy as np
+import serial
+
+SYNC_BYTE = 0xA5
+SYNC_BYTE2 = 0x5A
+
+CMD_STOP = 0x25
+CMD_RESET = 0x40
+CMD_SCAN = 0x20
+CMD_FORCE_SCAN = 0x21
+CMD_EXPRESS_SCAN = 0x82
+CMD_GET_INFO = 0x50
+CMD_GET_HEALTH = 0x52
+CMD_GET_SAMPLERATE = 0x59
+
+ANS_TYPE_MEASUREMENT = 0x81
+ANS_TYPE_CAPSULE = 0x82
+ANS_TYPE_DENSE_CAPSULE = 0x85
+ANS_TYPE_DEVINFO = 0x04
+ANS_TYPE_DEVHEALTH = 0x06
+ANS_TYPE_SAMPLERATE = 0x15
+
+NODE_SIZE = 5
+CAPSULE_SIZE = 84
+HEALTH_STATUS = {0: 'Good', 1: 'Warning', 2: 'Error'}
+
+EMPTY = (np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=bool))
+
+
+class RPLidarError(Exception):
+    """Protocol or communication error."""
+
+
+def _node_ok(nodes: np.ndarray) -> np.ndarray:
+    """Check bits of standard nodes: start bit != its inverse, and the C bit set."""
+    b0, b1 = nodes[:, 0], nodes[:, 1]
+    return ((b0 & 1) != ((b0 >> 1) & 1)) & ((b1 & 1) == 1)
+
+
+def decode_nodes(buf) -> tuple:
+    """
+    Decode standard scan nodes from the start of buf.
+    Bytes that fail the node check bits are skipped until the stream lines up again.
+    :return: ((angle, distance, quality, start), bytes consumed)
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    pos, parts = 0, []
+    while len(data) - pos >= NODE_SIZE:
+        n = (len(data) - pos) // NODE_SIZE
+        nodes = data[pos:pos + n * NODE_SIZE].reshape(n, NODE_SIZE)
+        ok = _node_ok(nodes)
+        good = n if ok.all() else int(np.argmin(ok))
+        if good < min(n, 3):
+            # A short run before a bad node is more likely a false match than data
+            good = 0
+        if good:
+            parts.append(nodes[:good])
+            pos += good * NODE_SIZE
+        else:
+            # Out of step: drop one byte and look again
+            pos += 1
+    if not parts:
+        return EMPTY, pos
+    nodes = parts[0] if len(parts) == 1 else np.concatenate(parts)
+    quality = nodes[:, 0] >> 2
+    start = (nodes[:, 0] & 1).astype(bool)
+    angle = ((nodes[:, 1] >> 1).astype(np.uint16) | (nodes[:, 2].astype(np.uint16) << 7)) / 64.0
+    distance = (nodes[:, 3].astype(np.uint16) | (nodes[:, 4].astype(np.uint16) << 8)) / 4.0
+    return (angle, distance, quality, start), pos
+
+
+class CapsuleDecoder:
+    """
+    Bulk decoder of express scan capsules.
+
+    Capsule k carries a start angle and the distances measured between that
+    angle and the start angle of capsule k + 1, so the points of a capsule
+    are only produced once the next one has arrived.
+    """
+
+    def __init__(self, dense: bool = False):
+        self.dense = dense
+        self.prev = None
+        self.errors = 0
+
+    def reset(self):
+        self.prev = None
+
+    def __valid(self, caps: np.ndarray) -> np.ndarray:
+        sync = ((caps[:, 0] >> 4) == 0xA) & ((caps[:, 1] >> 4) == 0x5)
+        checksum = (caps[:, 0] & 0xF) | ((caps[:, 1] & 0xF) << 4)
+        return sync & (np.bitwise_xor.reduce(caps[:, 2:], axis=1) == checksum)
+
+    def decode(self, buf) -> tuple:
+        """
+        Decode every whole capsule at the start of buf.
+        :return: ((angle, distance, quality, start), bytes consumed)
+        """
+        data = np.frombuffer(buf, dtype=np.uint8)
+        pos, caps = 0, []
+        while len(data) - pos >= CAPSULE_SIZE:
+            n = (len(data) - pos) // CAPSULE_SIZE
+            block = data[pos:pos + n * CAPSULE_SIZE].reshape(n, CAPSULE_SIZE)
+            ok = self.__valid(block)
+            good = n if ok.all() else int(np.argmin(ok))
+            if good:
+                caps.append(block[:good])
+                pos += good * CAPSULE_SIZE
+            if good < n:
+                # Bad capsule: its angle span is unknown, start over from the next sync
+                self.errors += 1
+                self.prev = None
+                caps.append(None)
+                pos += 1
+                while len(data) - pos >= 2 and not ((data[pos] >> 4) == 0xA and (data[pos + 1] >> 4) == 0x5):
+                    pos += 1
+        parts = []
+        for block in caps:
+            if block is None:
+                self.prev = None
+                continue
+            if self.prev is not None:
+                block = np.vstack((self.prev, block))
+            if len(block) > 1:
+                parts.append(self.__points(block))
+            self.prev = block[-1:].copy()
+        if not parts:
+            return EMPTY, pos
+        return tuple(np.concatenate(p) for p in zip(*parts)), pos
+
+    def __points(self, caps: np.ndarray) -> tuple:
+        """Points of caps[:-1], using each next capsule's start angle as the end of the span."""
+        start_q8 = ((caps[:, 2].astype(np.int64) | (caps[:, 3].astype(np.int64) << 8)) & 0x7FFF) << 2
+        diff_q8 = np.diff(start_q8)
+        diff_q8[diff_q8 < 0] += 360 << 8
+        body = caps[:-1, 4:]
+        if self.dense:
+            count = 40
+            dist = (body[:, 0::2].astype(np.int64) | (body[:, 1::2].astype(np.int64) << 8))
+            inc_q16 = (diff_q8 << 8) // count
+            steps = np.arange(count)
+            angle_q16 = (start_q8[:-1, None] << 8) + inc_q16[:, None] * steps
+            angle_q6 = angle_q16 >> 10
+            distance = dist.astype(np.float64)
+        else:
+            count = 32
+            cabins = body.reshape(-1, 16, 5).astype(np.int64)
+            d1 = cabins[:, :, 0] | (cabins[:, :, 1] << 8)
+            d2 = cabins[:, :, 2] | (cabins[:, :, 3] << 8)
+            off1 = (cabins[:, :, 4] & 0xF) | ((d1 & 0x3) << 4)
+            off2 = (cabins[:, :, 4] >> 4) | ((d2 & 0x3) << 4)
+            dist_q2 = np.stack((d1 & 0xFFFC, d2 & 0xFFFC), axis=2).reshape(-1, count)
+            offset_q3 = np.stack((off1, off2), axis=2).reshape(-1, count)
+            inc_q16 = diff_q8 << 3
+            steps = np.arange(count)
+            angle_q16 = (start_q8[:-1, None] << 8) + inc_q16[:, None] * steps
+            angle_q6 = (angle_q16 - (offset_q3 << 13)) >> 10
+            distance = dist_q2 / 4.0
+        # The first point past 360 degrees starts a new revolution
+        start = ((angle_q16 % (360 << 16)) < inc_q16[:, None]).ravel()
+        angle = (angle_q6 % (360 << 6)).ravel() / 64.0
+        distance = distance.ravel()
+        quality = np.where(distance > 0, 0x2F, 0).astype(np.uint8)
+        return angle, distance, quality, start
+
+
+class RPLidarDriver:
+    """RPLidar on a serial port."""
+
+    def __init__(self, port: str = '/dev/ttyUSB0', baudrate: int = 460800, timeout: float = 1.0,
+                 read_size: int = 500):
+        """
+        :param read_size: Minimum bytes per serial read while scanning (about 100 points).
+        """
+        self.ser = serial.Serial(port, baudrate, timeout=timeout)
+        self.read_size = read_size
+        self.scanning = None
+        self.__decoder = None
+        self.stats = {'bytes': 0, 'points': 0, 'skipped_bytes': 0}
+        self.start_motor()
+
+    def start_motor(self):
+        """A-series motors spin while DTR is low; the C1 ignores it."""
+        self.ser.dtr = False
+
+    def stop_motor(self):
+        self.ser.dtr = True
+
+    def __command(self, cmd: int, payload: bytes = b''):
+        if payload:
+            frame = bytes([SYNC_BYTE, cmd, len(payload)]) + payload
+            checksum = 0
+            for b in frame:
+                checksum ^= b
+            frame += bytes([checksum])
+        else:
+            frame = bytes([SYNC_BYTE, cmd])
+        self.ser.write(frame)
+
+    def __descriptor(self) -> tuple:
+        """Read a response descriptor. :return: (data length, send mode, data type)"""
+        desc = self.ser.read(7)
+        if len(desc) != 7 or desc[0] != SYNC_BYTE or desc[1] != SYNC_BYTE2:
+            raise RPLidarError("Bad response descriptor: %s" % desc.hex())
+        size_mode, = struct.unpack('<I', desc[2:6])
+        return size_mode & 0x3FFFFFFF, size_mode >> 30, desc[6]
+
+    def __response(self, cmd: int, expected_type: int) -> bytes:
+        self.ser.reset_input_buffer()
+        self.__command(cmd)
+        size, _, data_type = self.__descriptor()
+        if data_type != expected_type:
+            raise RPLidarError("Unexpected response type 0x%02X" % data_type)
+        data = self.ser.read(size)
+        if len(data) != size:
+            raise RPLidarError("Response too short")
+        return data
+
+    def get_info(self) -> dict:
+        data = self.__response(CMD_GET_INFO, ANS_TYPE_DEVINFO)
+        return {
+            'model': data[0],
+            'firmware': (data[2], data[1]),
+            'hardware': data[3],
+            'serialnumber': data[4:20].hex().upper(),
+        }
+
+    def get_health(self) -> tuple:
+        """:return: (status string, error code)"""
+        data = self.__response(CMD_GET_HEALTH, ANS_TYPE_DEVHEALTH)
+        return HEALTH_STATUS.get(data[0], 'Unknown'), data[1] | (data[2] << 8)
+
+    def start_scan(self, force: bool = False):
+        """Start the standard scan (the C1's only mode, 5 byte nodes)."""
+        self.stop()
+        self.__command(CMD_FORCE_SCAN if force else CMD_SCAN)
+        size, mode, data_type = self.__descriptor()
+        if data_type != ANS_TYPE_MEASUREMENT or size != NODE_SIZE:
+            raise RPLidarError("Unexpected scan response type 0x%02X" % data_type)
+        self.scanning = 'standard'
+        self.__decoder = None
+
+    def start_express_scan(self, mode: int = 0):
+        """Start the express scan; the device answers with legacy or dense capsules."""
+        self.stop()
+        self.__command(CMD_EXPRESS_SCAN, bytes([mode, 0, 0, 0, 0]))
+        size, _, data_type = self.__descriptor()
+        if data_type not in (ANS_TYPE_CAPSULE, ANS_TYPE_DENSE_CAPSULE) or size != CAPSULE_SIZE:
+            raise RPLidarError("Unexpected express scan response type 0x%02X" % data_type)
+        self.scanning = 'express'
+        self.__decoder = CapsuleDecoder(dense=data_type == ANS_TYPE_DENSE_CAPSULE)
+
+    def stop(self):
+        if self.scanning is not None:
+            self.__command(CMD_STOP)
+            time.sleep(0.002)
+            self.scanning = None
+        self.ser.reset_input_buffer()
+
+    def reset(self):
+        self.__command(CMD_RESET)
+        time.sleep(0.5)
+        self.ser.reset_input_buffer()
+        self.scanning = None
+
+    def iter_measurements(self, express: bool = False, mode: int = 0):
+        """
+        Start scanning if needed and yield one batch of measurements per serial read.
+        :return: Iterator of (angle deg, distance mm, quality, start flag) arrays;
+                 distance 0 means no return.
+        """
+        if self.scanning is None:
+            if express:
+                self.start_express_scan(mode)
+            else:
+                self.start_scan()
+        buf = bytearray()
+        while True:
+            data = self.ser.read(max(self.ser.in_waiting, self.read_size))
+            if not data:
+                raise RPLidarError("No data from the lidar")
+            self.stats['bytes'] += len(data)
+            buf += data
+            if self.__decoder is None:
+                points, used = decode_nodes(buf)
+                self.stats['skipped_bytes'] += used - len(points[0]) * NODE_SIZE
+            else:
+                points, used = self.__decoder.decode(buf)
+            del buf[:used]
+            if len(points[0]):
+                self.stats['points'] += len(points[0])
+                yield points
+
+    def disconnect(self):
+        self.stop()
+        self.stop_motor()
+        self.ser.close()
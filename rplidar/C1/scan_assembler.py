@@ -0,0 +1,168 @@
+"""
+Revolution-aware scan assembly.
+
+Measurement batches from UltraSimpleReader or RPLidarDriver are cut into
+whole revolutions, using the start flag or, without one, the angle wrapping
+from ~360 back to ~0 degrees. Every revolution comes out as a Scan with all
+its points at native resolution and a timestamp per point, for de-skewing
+while the robot moves:
+
+    assembler = ScanAssembler()
+    for scan in assembler.iter_scans(UltraSimpleReader()):
+        slam.update(scan.resample(360, max_distance=6000).tolist())
+
+Point timestamps are time.monotonic_ns() values spread evenly between the
+arrival of the previous batch and the batch that carried the point. That
+tracks the sampling closely with RPLidarDriver; ultra_simple prints each
+revolution in one burst, so there only t_start/t_end are meaningful.
+"""
+
+import time
+import numpy as np
+
+SCAN_DTYPE = np.dtype([('t', 'i8'), ('angle', 'f8'), ('distance', 'f8'), ('quality', 'u1')])
+
+# Nominal C1 sample rate, used to date the points of the very first batch
+SAMPLE_RATE = 5000
+
+
+class Scan:
+    """One revolution: points (SCAN_DTYPE, in measurement order) and its sequence number."""
+
+    def __init__(self, points: np.ndarray, index: int):
+        self.points = points
+        self.index = index
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def t_start(self) -> int:
+        return int(self.points['t'][0])
+
+    @property
+    def t_end(self) -> int:
+        return int(self.points['t'][-1])
+
+    def valid(self, max_distance: float = None) -> np.ndarray:
+        """Mask of points with a return (and closer than max_distance)."""
+        distance = self.points['distance']
+        mask = distance > 0
+        if max_distance is not None:
+            mask &= distance < max_distance
+        return mask
+
+    def resample(self, scan_size: int = 360, max_distance: float = None) -> np.ndarray:
+        """
+        Distances (mm, int) on scan_size evenly spaced angles, e.g. for BreezySLAM.
+        Each slot holds the nearest return whose angle falls in it; empty slots are 0.
+        """
+        mask = self.valid(max_distance)
+        angle = self.points['angle'][mask]
+        distance = self.points['distance'][mask]
+        slot = (angle * (scan_size / 360.0)).astype(np.int64) % scan_size
+        # Nearest first within each slot, then keep the first of every slot
+        order = np.lexsort((distance, slot))
+        slot, distance = slot[order], distance[order]
+        first = np.ones(len(slot), dtype=bool)
+        first[1:] = slot[1:] != slot[:-1]
+        out = np.zeros(scan_size, dtype=np.int64)
+        out[slot[first]] = distance[first].astype(np.int64)
+        return out
+
+    def xy(self, max_distance: float = None) -> np.ndarray:
+        """(n, 2) points in mm in the lidar frame, x along 0 degrees, clockwise angles."""
+        mask = self.valid(max_distance)
+        rad = np.radians(self.points['angle'][mask])
+        distance = self.points['distance'][mask]
+        return np.column_stack((distance * np.cos(rad), -distance * np.sin(rad)))
+
+
+class ScanAssembler:
+    """Collect measurement batches and emit complete revolutions."""
+
+    def __init__(self, min_points: int = 100, wrap_threshold: float = 180.0, max_points: int = 20000):
+        """
+        :param min_points: Revolutions with fewer points are dropped (e.g. after data loss).
+        :param wrap_threshold: An angle drop larger than this (degrees) ends a revolution.
+        :param max_points: Points kept for an unfinished revolution before it is dropped.
+        """
+        self.min_points = min_points
+        self.wrap_threshold = wrap_threshold
+        self.max_points = max_points
+        self.pending = []
+        self.pending_points = 0
+        self.last_angle = None
+        self.last_t = None
+        self.scans = 0
+        self.dropped = 0
+        # The revolution in progress at start-up is incomplete
+        self.synced = False
+
+    def push(self, angle, distance, quality=None, start=None, t_ns: int = None) -> list:
+        """
+        Add one batch of measurements received at t_ns (time.monotonic_ns(), now by default).
+        :return: List of the revolutions completed by this batch (possibly empty).
+        """
+        if t_ns is None:
+            t_ns = time.monotonic_ns()
+        n = len(angle)
+        if not n:
+            return []
+        angle = np.asarray(angle, dtype=np.float64)
+        points = np.empty(n, dtype=SCAN_DTYPE)
+        points['angle'] = angle
+        points['distance'] = distance
+        points['quality'] = 0 if quality is None else quality
+        first_t = self.last_t if self.last_t is not None else t_ns - n * 1000000000 // SAMPLE_RATE
+        points['t'] = first_t + (np.arange(1, n + 1) * (t_ns - first_t)) // n
+        self.last_t = t_ns
+
+        # Revolution boundaries: start flags and angle wrap-arounds
+        previous = np.empty(n)
+        previous[0] = angle[0] if self.last_angle is None else self.last_angle
+        previous[1:] = angle[:-1]
+        boundary = previous - angle > self.wrap_threshold
+        if start is not None:
+            boundary |= np.asarray(start, dtype=bool)
+        self.last_angle = angle[-1]
+
+        scans = []
+        begin = 0
+        for cut in np.flatnonzero(boundary):
+            self.__append(points[begin:cut])
+            scan = self.__finish()
+            if scan is not None:
+                scans.append(scan)
+            begin = cut
+        self.__append(points[begin:])
+        if self.pending_points > self.max_points:
+            # No boundary for far too long: start over
+            self.pending, self.pending_points = [], 0
+            self.dropped += 1
+        return scans
+
+    def iter_scans(self, batches):
+        """Yield the revolutions of an iterable of (angle, distance, quality, start) batches."""
+        for batch in batches:
+            yield from self.push(*batch)
+
+    def __append(self, points: np.ndarray):
+        if len(points):
+            self.pending.append(points)
+            self.pending_points += len(points)
+
+    def __finish(self):
+        pending = self.pending
+        self.pending, self.pending_points = [], 0
+        if not self.synced:
+            self.synced = True
+            return None
+        count = sum(len(p) for p in pending)
+        if count < self.min_points:
+            if count:
+                self.dropped += 1
+            return None
+        scan = Scan(pending[0].copy() if len(pending) == 1 else np.concatenate(pending), self.scans)
+        self.scans += 1
+        return scan
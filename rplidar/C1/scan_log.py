@@ -0,0 +1,222 @@
+"""
+Record assembled lidar revolutions and replay them later.
+
+A recording is a zip file of compressed NumPy arrays (readable with
+np.load). Revolutions are stored in chunks of `chunk_scans`, each chunk as
+one points_NNNNN.npy with all their points (scan_assembler.SCAN_DTYPE). On
+close an index.npy with every revolution's chunk, offset, size and time is
+added, so a replay can seek to any revolution or time and only
+decompresses the chunk it needs.
+
+    with ScanRecorder('run1.npz') as rec:
+        for scan in lidar.iter_scans():
+            rec.write(scan)
+
+    replay = ScanReplay('run1.npz', speed=1.0)    # None: as fast as possible
+    for scan in replay.iter_scans():              # like ScanRing / LocalScans
+        ...
+
+Usage:
+    python3 scan_log.py record run1.npz --seconds 60   # from lidar_daemon.py or the lidar
+    python3 scan_log.py info run1.npz                   # contents and replay throughput
+"""
+
+import time
+import zipfile
+import argparse
+import numpy as np
+
+from scan_assembler import Scan
+
+INDEX_DTYPE = np.dtype([('chunk', 'i4'), ('start', 'i4'), ('count', 'i4'), ('index', 'i8'),
+                        ('t_start', 'i8'), ('t_end', 'i8')])
+
+
+class ScanRecorder:
+    """Write revolutions (scan_assembler.Scan) to a recording."""
+
+    def __init__(self, path: str, chunk_scans: int = 50, compresslevel: int = 6):
+        """
+        :param chunk_scans: Revolutions per compressed chunk (C1 at 10 Hz: 5 s).
+        :param compresslevel: zlib level, 1 is fastest.
+        """
+        self.zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+        self.chunk_scans = chunk_scans
+        self.pending = []
+        self.index = []
+        self.chunks = 0
+
+    def write(self, scan: Scan):
+        # Copy: scans from a ScanRing view shared memory that will be reused
+        self.pending.append((scan.points.copy(), scan.index))
+        if len(self.pending) >= self.chunk_scans:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered revolutions as one chunk."""
+        if not self.pending:
+            return
+        start = 0
+        for points, index in self.pending:
+            t = points['t']
+            self.index.append((self.chunks, start, len(points), index, t[0], t[-1]))
+            start += len(points)
+        self.__save('points_%05d.npy' % self.chunks, np.concatenate([p for p, _ in self.pending]))
+        self.chunks += 1
+        self.pending = []
+
+    def __save(self, name: str, array: np.ndarray):
+        with self.zip.open(name, 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, array, allow_pickle=False)
+
+    def close(self):
+        self.flush()
+        self.__save('index.npy', np.array(self.index, dtype=INDEX_DTYPE))
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ScanReplay:
+    """Read a recording; iter_scans() replays it like a live ScanRing."""
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        """
+        :param speed: Playback speed relative to the recording, None for as fast as possible.
+        :param loop: Start over at the end instead of stopping.
+        """
+        self.zip = zipfile.ZipFile(path, 'r')
+        self.speed = speed
+        self.loop = loop
+        self.index = self.__load('index.npy')
+        self.position = 0
+        self.chunk_id = None
+        self.chunk = None
+
+    def __load(self, name: str) -> np.ndarray:
+        with self.zip.open(name) as f:
+            return np.lib.format.read_array(f, allow_pickle=False)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def duration(self) -> float:
+        """Recorded time in seconds."""
+        if not len(self.index):
+            return 0.0
+        return (self.index['t_end'][-1] - self.index['t_start'][0]) / 1e9
+
+    def __getitem__(self, i: int) -> Scan:
+        entry = self.index[i]
+        if entry['chunk'] != self.chunk_id:
+            # Revolutions are read in order, so keep the last decompressed chunk
+            self.chunk = self.__load('points_%05d.npy' % entry['chunk'])
+            self.chunk_id = entry['chunk']
+        return Scan(self.chunk[entry['start']:entry['start'] + entry['count']], int(entry['index']))
+
+    def seek(self, scan: int = None, seconds: float = None):
+        """Continue iter_scans() at revolution `scan`, or at `seconds` into the recording."""
+        if seconds is not None:
+            t = self.index['t_start'][0] + int(seconds * 1e9) if len(self.index) else 0
+            scan = int(np.searchsorted(self.index['t_end'], t))
+        self.position = min(max(scan, 0), len(self.index))
+
+    def iter_scans(self, every: bool = True, timeout: float = None):
+        """
+        Yield the revolutions from the current position, each at the time its last
+        point was recorded (scaled by speed). A slow consumer with every=False skips
+        the revolutions it missed, like a ScanRing reader.
+        """
+        wall0 = t0 = None
+        while True:
+            while self.position < len(self.index):
+                i = self.position
+                if self.speed:
+                    t_end = self.index['t_end'][i]
+                    if t0 is None:
+                        wall0, t0 = time.monotonic_ns(), t_end
+                    due = wall0 + (t_end - t0) / self.speed
+                    now = time.monotonic_ns()
+                    if not every:
+                        # Jump to the newest revolution that is already due
+                        late = np.searchsorted(self.index['t_end'], t0 + (now - wall0) * self.speed, 'right') - 1
+                        i = max(i, min(int(late), len(self.index) - 1))
+                        due = wall0 + (self.index['t_end'][i] - t0) / self.speed
+                    if due > now:
+                        time.sleep((due - now) / 1e9)
+                self.position = i + 1
+                yield self[i]
+            if not self.loop or not len(self.index):
+                return
+            self.position = 0
+            wall0 = t0 = None
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record(path: str, seconds: float = None, chunk_scans: int = 50):
+    from lidar_shm import open_scans
+    lidar = open_scans()
+    print("Recording to %s. Ctrl+C to stop." % path)
+    count = 0
+    started = time.time()
+    try:
+        with ScanRecorder(path, chunk_scans) as rec:
+            for scan in lidar.iter_scans():
+                rec.write(scan)
+                count += 1
+                if seconds is not None and time.time() - started > seconds:
+                    break
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        lidar.close()
+    print("%d revolutions recorded" % count)
+
+
+def info(path: str):
+    with ScanReplay(path, speed=None) as replay:
+        points = int(replay.index['count'].sum())
+        print("%s: %d revolutions, %d points, %.1f s" % (path, len(replay), points, replay.duration))
+        if not len(replay):
+            return
+        print("%.1f revolutions/s, %.0f points/revolution" % (
+            len(replay) / max(replay.duration, 1e-9), points / len(replay)))
+        wall0 = time.perf_counter()
+        for scan in replay.iter_scans():
+            scan.resample(360)
+        wall = time.perf_counter() - wall0
+        print("Replay + resample: %.0f revolutions/s, %.0f points/s" % (len(replay) / wall, points / wall))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and inspect lidar scan recordings")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("record", help="record revolutions from lidar_daemon.py or the lidar")
+    p.add_argument("path")
+    p.add_argument("--seconds", type=float, help="stop after this long")
+    p.add_argument("--chunk", type=int, default=50, help="revolutions per compressed chunk")
+    p = sub.add_parser("info", help="show a recording and time its replay")
+    p.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.path, args.seconds, args.chunk)
+    else:
+        info(args.path)
+
+
+if __name__ == "__main__":
+    main()
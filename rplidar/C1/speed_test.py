@@ -1,7 +1,29 @@
-import subprocess
+"""
+Lidar read benchmark: ./ultra_simple + regex (old), ./ultra_simple + chunk
+parser (chunked) and rplidar_driver (new).
+
+For each path it reports points per second and the CPU it costs, the
+ultra_simple process included for the old and chunked paths.
+
+Usage:
+    python3 speed_test.py                        # all paths on the lidar, 10 s each
+    python3 speed_test.py --path new --seconds 30
+    python3 speed_test.py --path new --express
+    python3 speed_test.py --record scan.log      # save ultra_simple output
+    python3 speed_test.py --log scan.log         # text parsers on a saved log
+    python3 speed_test.py --synthetic            # parsing only, no lidar needed
+"""
+
+import os
 import re
 import time
-import math
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+from rplidar_driver import RPLidarDriver, decode_nodes
+from ultra_simple_reader import UltraSimpleReader, iter_log
 
 # Path to ultra_simple binary and serial port config
 ULTRA_SIMPLE_PATH = './ultra_simple'
@@ -10,35 +32,176 @@ BAUD = '460800'
 
 pattern = re.compile(r'theta:\s*([0-9.]+)\s+Dist:\s*([0-9.]+)')
 
-proc = subprocess.Popen(
-    [ULTRA_SIMPLE_PATH, '--channel', '--serial', PORT, BAUD],
-    stdout=subprocess.PIPE,
-    stderr=subprocess.STDOUT,
-    text=True
-)
-
-print("Reading LIDAR data as fast as possible (no plot). Ctrl+C to stop.")
-
-count = 0
-start_time = time.time()
-
-try:
-    for line in proc.stdout:
-        match = pattern.search(line)
-        if match:
-            angle = float(match.group(1))
-            distance = float(match.group(2))
-            # Example filter
-            if 0 < distance < 4000:
+
+def process_cpu(pid: int) -> float:
+    """User + system CPU seconds used so far by a running process (Linux)."""
+    with open('/proc/%d/stat' % pid) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def report(name: str, points: int, wall: float, cpu: float):
+    print("%-28s %9d points %9.0f pts/s %7.1f%% CPU %8.2f us/point" % (
+        name, points, points / wall, 100.0 * cpu / wall, 1e6 * cpu / max(points, 1)))
+
+
+def run_old(seconds: float):
+    proc = subprocess.Popen(
+        [ULTRA_SIMPLE_PATH, '--channel', '--serial', PORT, BAUD],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True
+    )
+    count = 0
+    started = False
+    try:
+        for line in proc.stdout:
+            match = pattern.search(line)
+            if not match:
+                continue
+            if not started:
+                # Start timing at the first measurement, after the lidar spun up
+                started = True
+                cpu0 = time.process_time() + process_cpu(proc.pid)
+                wall0 = time.perf_counter()
+            if 0 < float(match.group(2)):
                 count += 1
+            if time.perf_counter() - wall0 > seconds:
+                break
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() + process_cpu(proc.pid) - cpu0
+    finally:
+        proc.terminate()
+        proc.wait()
+    report("ultra_simple + regex", count, wall, cpu)
+
+
+def run_new(seconds: float, express: bool):
+    lidar = RPLidarDriver(PORT, int(BAUD))
+    count = 0
+    try:
+        measurements = lidar.iter_measurements(express=express)
+        next(measurements)
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        for angle, distance, quality, start in measurements:
+            count += int(np.count_nonzero(distance > 0))
+            if time.perf_counter() - wall0 > seconds:
+                break
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() - cpu0
+    finally:
+        lidar.disconnect()
+    report("rplidar_driver (%s)" % ("express" if express else "standard"), count, wall, cpu)
+
+
+def run_chunked(seconds: float, record: str = None):
+    count = 0
+    with UltraSimpleReader(log=record) as reader:
+        chunks = iter(reader)
+        next(chunks)
+        cpu0 = time.process_time() + process_cpu(reader.proc.pid)
+        wall0 = time.perf_counter()
+        for angle, distance, quality, start in chunks:
+            count += int(np.count_nonzero(distance > 0))
+            if time.perf_counter() - wall0 > seconds:
+                break
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() + process_cpu(reader.proc.pid) - cpu0
+    report("ultra_simple + chunk parser", count, wall, cpu)
+
+
+def compare_text_parsers(path: str):
+    """The per-line regex loop of the C1 scripts against the chunk parser, on one log."""
+    count = 0
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    with open(path) as f:
+        for line in f:
+            match = pattern.search(line)
+            if match:
+                angle = float(match.group(1))
+                if 0 < float(match.group(2)):
+                    count += 1
+    report("regex per line", count, time.perf_counter() - wall0, time.process_time() - cpu0)
+
+    count = 0
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    for angle, distance, quality, start in iter_log(path):
+        count += int(np.count_nonzero(distance > 0))
+    report("chunk parser", count, time.perf_counter() - wall0, time.process_time() - cpu0)
+
+
+def encode_nodes(angle: np.ndarray, distance: np.ndarray, quality: np.ndarray) -> bytes:
+    """Standard scan nodes as the lidar sends them."""
+    angle_q6 = np.round(angle * 64).astype(np.int64)
+    distance_q2 = np.round(distance * 4).astype(np.int64)
+    start = np.zeros(len(angle), dtype=np.int64)
+    start[np.flatnonzero(np.diff(angle) < 0) + 1] = 1
+    nodes = np.empty((len(angle), 5), dtype=np.uint8)
+    nodes[:, 0] = (quality << 2) | start | ((1 - start) << 1)
+    nodes[:, 1] = ((angle_q6 & 0x7F) << 1) | 1
+    nodes[:, 2] = angle_q6 >> 7
+    nodes[:, 3] = distance_q2 & 0xFF
+    nodes[:, 4] = distance_q2 >> 8
+    return nodes.tobytes()
+
+
+def run_synthetic(points: int):
+    """Parse the same measurements as ultra_simple text (both text parsers) and as raw nodes."""
+    rng = np.random.default_rng(0)
+    angle = (np.arange(points) * (360.0 / 500)) % 360
+    distance = rng.uniform(150, 6000, points).round(2)
+    quality = rng.integers(0, 64, points)
+    text = "".join("%s theta: %03.2f Dist: %08.2f Q: %d \n" % ("S " if a == 0 else "  ", a, d, q)
+                   for a, d, q in zip(angle, distance, quality))
+    raw = encode_nodes(angle, distance, quality)
+    print("Synthetic: %d points, %d bytes of text, %d bytes of nodes" % (points, len(text), len(raw)))
+
+    with tempfile.NamedTemporaryFile('w', suffix='.log') as log:
+        log.write(text)
+        log.flush()
+        compare_text_parsers(log.name)
+
+    chunk = 500
+    count = 0
+    buf = bytearray()
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    for i in range(0, len(raw), chunk):
+        buf += raw[i:i + chunk]
+        (angle_deg, dist, _, _), used = decode_nodes(buf)
+        del buf[:used]
+        count += int(np.count_nonzero(dist > 0))
+    report("decode_nodes, %d byte reads" % chunk, count, time.perf_counter() - wall0, time.process_time() - cpu0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lidar read benchmark, ultra_simple vs rplidar_driver")
+    parser.add_argument("--path", choices=["old", "chunked", "new", "all"], default="all",
+                        help="old: regex per line, chunked: chunk parser, new: rplidar_driver")
+    parser.add_argument("--seconds", type=float, default=10.0, help="measurement time per path")
+    parser.add_argument("--express", action="store_true", help="use the express scan for the new path")
+    parser.add_argument("--synthetic", type=int, nargs="?", const=500000, metavar="POINTS",
+                        help="only compare the parsers on generated data")
+    parser.add_argument("--log", help="only compare the text parsers on a captured ultra_simple log")
+    parser.add_argument("--record", help="save the ultra_simple output of the chunked run to this file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        run_synthetic(args.synthetic)
+        return
+    if args.log:
+        compare_text_parsers(args.log)
+        return
+    print("Reading LIDAR data as fast as possible (no plot). Ctrl+C to stop.")
+    try:
+        if args.path in ("old", "all"):
+            run_old(args.seconds)
+        if args.path in ("chunked", "all") or args.record:
+            run_chunked(args.seconds, args.record)
+        if args.path in ("new", "all"):
+            run_new(args.seconds, args.express)
+    except KeyboardInterrupt:
+        print("Stopped by user.")
 
-        if count % 500 == 0 and count > 0:
-            elapsed = time.time() - start_time
-            print(f"{count} points in {elapsed:.2f}s → {count/elapsed:.1f} pts/sec")
 
-except KeyboardInterrupt:
-    print("Stopped by user.")
-finally:
-    proc.terminate()
-    proc.wait()
-    print("✅ Done.")
+if __name__ == "__main__":
+    main()
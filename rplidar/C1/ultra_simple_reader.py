@@ -0,0 +1,161 @@
+"""
+Chunked reader of ./ultra_simple output.
+
+Instead of one regex search and two float() calls per line, stdout is read
+in binary mode in large chunks. Each chunk is turned into plain numeric
+columns with bytes.replace() and parsed by NumPy in one call:
+
+    with UltraSimpleReader() as lidar:
+        for angle, distance, quality, start in lidar:
+            ...    # NumPy arrays, one entry per measurement line
+
+ultra_simple prints one line per measurement,
+"S  theta: 123.45 Dist: 00456.78 Q: 47 " with "S" marking the first point
+of a revolution. Both numbers always have two decimals, so in a chunk of
+measurement lines every field sits at a fixed offset from the decimal
+points and all of them are read with a few gathers. Chunks that also hold
+other text (start-up banner, errors) take a slower path that drops the
+non-measurement lines.
+"""
+
+import os
+import warnings
+import subprocess
+import numpy as np
+
+ULTRA_SIMPLE_PATH = './ultra_simple'
+PORT = '/dev/ttyUSB0'
+BAUD = '460800'
+
+# Line prefixes become the start flag column, field labels are dropped
+_START = (b'S  theta:', b' 1 ')
+_NO_START = (b'   theta:', b' 0 ')
+_LABELS = (b'Dist:', b'Q:')
+
+# Offsets of the angle/distance digits from their decimal point, and their weights
+_ANGLE_OFFSETS = np.array([-3, -2, -1, 1, 2])
+_ANGLE_WEIGHTS = np.array([100, 10, 1, 0.1, 0.01])
+_DIST_OFFSETS = np.array([-5, -4, -3, -2, -1, 1, 2])
+_DIST_WEIGHTS = np.array([10000, 1000, 100, 10, 1, 0.1, 0.01])
+# Quality digits start 7 bytes after the distance's decimal point (".dd Q: q")
+_QUALITY_OFFSETS = np.array([7, 8, 9])
+
+EMPTY = (np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=bool))
+
+
+def _fixed_columns(lines: bytes, count: int):
+    """Parse `count` well-formed measurement lines; None if the layout doesn't match."""
+    arr = np.frombuffer(lines, dtype=np.uint8)
+    dots = np.flatnonzero(arr == 46)
+    if len(dots) != 2 * count:
+        return None
+    p, q = dots[0::2], dots[1::2]
+    if not ((arr[q - 7] == 58) & (arr[q + 4] == 81)).all():  # "Dist:" and "Q" in place
+        return None
+    # Digits as values, anything else (the space before a short angle) as 0
+    angle_digits = arr[p[:, None] + _ANGLE_OFFSETS] - np.uint8(48)
+    angle_digits[angle_digits > 9] = 0
+    dist_digits = arr[q[:, None] + _DIST_OFFSETS] - np.uint8(48)
+    quality_digits = (arr[q[:, None] + _QUALITY_OFFSETS] - np.uint8(48)).astype(np.int64)
+    two = quality_digits[:, 1] < 10
+    three = two & (quality_digits[:, 2] < 10)
+    quality = np.where(three, quality_digits[:, 0] * 100 + quality_digits[:, 1] * 10 + quality_digits[:, 2],
+                       np.where(two, quality_digits[:, 0] * 10 + quality_digits[:, 1], quality_digits[:, 0]))
+    line_starts = np.flatnonzero(arr == 10)[:-1] + 1
+    start = arr[np.concatenate(([0], line_starts))] == 83  # "S"
+    return angle_digits @ _ANGLE_WEIGHTS, dist_digits @ _DIST_WEIGHTS, quality.astype(np.uint8), start
+
+
+def _columns(lines: bytes) -> np.ndarray:
+    """Parse measurement-only lines into an (n, 4) array: start, angle, distance, quality."""
+    text = lines.replace(*_START).replace(*_NO_START)
+    for label in _LABELS:
+        text = text.replace(label, b'')
+    with warnings.catch_warnings():
+        # Unparsable text only shortens the result, which the caller checks
+        warnings.simplefilter('ignore', DeprecationWarning)
+        return np.fromstring(text, sep=' ')
+
+
+def parse_chunk(data: bytes) -> tuple:
+    """
+    Parse every complete line at the start of data.
+    :return: ((angle, distance, quality, start), bytes consumed); the
+             bytes after the last newline are left for the next chunk.
+    """
+    end = data.rfind(b'\n') + 1
+    if not end:
+        return EMPTY, 0
+    lines = data[:end]
+    count = lines.count(b'theta:')
+    if count == lines.count(b'\n'):
+        # Fast path: nothing but measurement lines
+        points = _fixed_columns(lines, count)
+        if points is not None:
+            return points, end
+    # Mixed with other text: keep the measurement lines only
+    kept = b'\n'.join(line for line in lines.split(b'\n') if b'theta:' in line)
+    values = _columns(kept) if kept else np.zeros(0)
+    values = values[:values.size - values.size % 4].reshape(-1, 4)
+    return (values[:, 1], values[:, 2], values[:, 3].astype(np.uint8), values[:, 0] > 0), end
+
+
+class UltraSimpleReader:
+    """Run ./ultra_simple and iterate over its measurements in chunks."""
+
+    def __init__(self, path: str = ULTRA_SIMPLE_PATH, port: str = PORT, baud: str = BAUD,
+                 chunk_size: int = 65536, log: str = None):
+        """
+        :param chunk_size: Largest read from stdout; smaller reads return as soon as data is available.
+        :param log: Optional file that receives a copy of the raw output, for offline benchmarks.
+        """
+        self.proc = subprocess.Popen(
+            [path, '--channel', '--serial', port, str(baud)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=0
+        )
+        self.chunk_size = chunk_size
+        self.log = open(log, 'wb') if log else None
+
+    def __iter__(self):
+        fd = self.proc.stdout.fileno()
+        buf = b''
+        while True:
+            data = os.read(fd, self.chunk_size)
+            if not data:
+                return
+            if self.log:
+                self.log.write(data)
+            buf += data
+            points, used = parse_chunk(buf)
+            buf = buf[used:]
+            if len(points[0]):
+                yield points
+
+    def close(self):
+        self.proc.terminate()
+        self.proc.wait()
+        if self.log:
+            self.log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_log(path: str, chunk_size: int = 65536):
+    """Parse a captured ultra_simple output file chunk by chunk, like the live reader."""
+    buf = b''
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return
+            buf += data
+            points, used = parse_chunk(buf)
+            buf = buf[used:]
+            if len(points[0]):
+                yield points
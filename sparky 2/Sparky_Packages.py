@@ -4,54 +4,111 @@
 import struct
 import time
 import serial
+import numpy as np
+import atexit
+import asyncio
+import weakref
+import functools
 import threading
-
-class Sparky:
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from sparky_capture import SerialCapture, RX, TX
+from sparky_protocol import SparkyProtocol, FrameParser, report_record, HEAD, DEVICE_ID, COMPLEMENT
+
+# Record layout of each report kind kept by Sparky.history(); t is the
+# estimated arrival time in time.monotonic_ns() units
+REPORT_DTYPES = {
+    'speed': np.dtype([('t', 'i8'), ('vx', 'f8'), ('vy', 'f8'), ('vz', 'f8'), ('battery', 'f8')]),
+    'imu_raw': np.dtype([('t', 'i8'), ('gx', 'f8'), ('gy', 'f8'), ('gz', 'f8'),
+                         ('ax', 'f8'), ('ay', 'f8'), ('az', 'f8'),
+                         ('mx', 'f8'), ('my', 'f8'), ('mz', 'f8')]),
+    'imu_att': np.dtype([('t', 'i8'), ('roll', 'f8'), ('pitch', 'f8'), ('yaw', 'f8')]),
+    'encoder': np.dtype([('t', 'i8'), ('m1', 'i8'), ('m2', 'i8'), ('m3', 'i8'), ('m4', 'i8')]),
+}
+
+
+# atexit hook of a Sparky, a no-op once the instance is gone
+def _flush_at_exit(ref, timeout):
+    bot = ref()
+    if bot is not None:
+        bot.flush(timeout)
+
+
+# Preallocated ring buffer of timestamped report records
+class ReportHistory:
+    # Every record is stored twice, capacity slots apart, so the newest n
+    # records are always one contiguous slice and can be returned as a view.
+    # Views are overwritten as new reports arrive; copy them to keep them.
+    def __init__(self, dtype, capacity):
+        self.capacity = int(capacity)
+        self.data = np.zeros(2 * self.capacity, dtype=dtype)
+        self.count = 0
+
+    def push(self, record):
+        i = self.count % self.capacity
+        self.data[i] = self.data[i + self.capacity] = record
+        self.count += 1
+        return self.data[i]
+
+    # Append an array of records in at most two slice assignments
+    def extend(self, records):
+        n = len(records)
+        if n > self.capacity:
+            self.count += n - self.capacity
+            records = records[n - self.capacity:]
+            n = self.capacity
+        i = self.count % self.capacity
+        first = min(n, self.capacity - i)
+        self.data[i:i + first] = self.data[i + self.capacity:i + self.capacity + first] = records[:first]
+        if n > first:
+            self.data[:n - first] = self.data[self.capacity:self.capacity + n - first] = records[first:]
+        self.count += n
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    # Newest records, oldest first: all of them, the last `count`, and/or
+    # only those with t > since (pass the last t seen to get new records only)
+    def view(self, since=None, count=None):
+        total = self.count
+        if not total:
+            return self.data[:0]
+        n = min(total, self.capacity)
+        end = (total - 1) % self.capacity + self.capacity + 1
+        records = self.data[end - n:end]
+        if since is not None:
+            records = records[np.searchsorted(records['t'], since, side='right'):]
+        if count is not None:
+            records = records[max(0, len(records) - int(count)):]
+        return records
+
+
+class Sparky(SparkyProtocol):
     __uart_state = 0
 
-    def __init__(self, car_type=1, com="/dev/myserial", delay=0.002, debug=False):
-        self.ser = serial.Serial(com, 115200)
+    # delay: gap between serial writes, so the MCU can absorb each batch.
+    # queue_size: max frames waiting to be sent before setters block.
+    # batch_size: max frames concatenated into one serial write.
+    # history_size: reports of each kind kept for history().
+    # com=None opens no port, data is then only parsed through feed().
+    # capture: path of a log that every byte read and written is appended to
+    #          (see sparky_capture.py for the format and replay).
+    def __init__(self, car_type=1, com="/dev/myserial", delay=0.002, debug=False, queue_size=64, batch_size=8,
+                 history_size=4096, capture=None):
+        self.ser = serial.Serial(com, 115200) if com is not None else None
+        self.__capture = None
+        if capture is not None:
+            self.__capture = SerialCapture(capture)
         self.__delay_time = delay
         self.__debug = debug
 
-        self.__HEAD = 0xFF
-        self.__DEVICE_ID = 0xFC
-        self.__COMPLEMENT = 257 - self.__DEVICE_ID
+        self.__HEAD = HEAD
+        self.__DEVICE_ID = DEVICE_ID
+        self.__COMPLEMENT = COMPLEMENT
         self.__CAR_TYPE = car_type
         self.__CAR_ADJUST = 0x80
 
-        self.FUNC_AUTO_REPORT = 0x01
-        self.FUNC_BEEP = 0x02
-        self.FUNC_PWM_SERVO = 0x03
-        self.FUNC_PWM_SERVO_ALL = 0x04
-        self.FUNC_RGB = 0x05
-        self.FUNC_RGB_EFFECT = 0x06
-        self.FUNC_REPORT_SPEED = 0x0A
-        self.FUNC_REPORT_IMU_RAW = 0x0B
-        self.FUNC_REPORT_IMU_ATT = 0x0C
-        self.FUNC_REPORT_ENCODER = 0x0D
-        self.FUNC_MOTOR = 0x10
-        self.FUNC_CAR_RUN = 0x11
-        self.FUNC_MOTION = 0x12
-        self.FUNC_SET_MOTOR_PID = 0x13
-        self.FUNC_SET_YAW_PID = 0x14
-        self.FUNC_SET_CAR_TYPE = 0x15
-        self.FUNC_UART_SERVO = 0x20
-        self.FUNC_UART_SERVO_ID = 0x21
-        self.FUNC_UART_SERVO_TORQUE = 0x22
-        self.FUNC_ARM_CTRL = 0x23
-        self.FUNC_ARM_OFFSET = 0x24
-        self.FUNC_AKM_DEF_ANGLE = 0x30
-        self.FUNC_AKM_STEER_ANGLE = 0x31
-        self.FUNC_REQUEST_DATA = 0x50
-        self.FUNC_VERSION = 0x51
-        self.FUNC_RESET_FLASH = 0xA0
-
-        self.CARTYPE_X3 = 0x01
-        self.CARTYPE_X3_PLUS = 0x02
-        self.CARTYPE_X1 = 0x04
-        self.CARTYPE_R2 = 0x05
-
         self.__ax = self.__ay = self.__az = 0
         self.__gx = self.__gy = self.__gz = 0
         self.__mx = self.__my = self.__mz = 0
@@ -70,9 +127,38 @@ class Sparky:
         self.__akm_readed_angle = False
         self.__AKM_SERVO_ID = 0x01
 
+        # Every speed/IMU/encoder report with its arrival time, plus callbacks
+        self.__history = {kind: ReportHistory(dtype, history_size) for kind, dtype in REPORT_DTYPES.items()}
+        self.__subscribers = {kind: [] for kind in REPORT_DTYPES}
+        self.__parser = FrameParser(self.__parse_data, debug)
+
+        # Requests waiting for a reply, keyed by (function, id)
+        self.__reply_lock = threading.Lock()
+        self.__replies = {}
+
+        # Frames waiting for the writer thread. A setter whose key matches a
+        # frame not yet sent (same function and target) replaces that frame.
+        self.__tx_cond = threading.Condition()
+        self.__tx_pending = OrderedDict()
+        self.__tx_seq = 0
+        self.__tx_busy = False
+        self.__tx_limit = queue_size
+        self.__tx_batch = batch_size
+        self.__tx_stats = {'queued': 0, 'coalesced': 0, 'frames': 0, 'writes': 0, 'bytes': 0}
+        # The writer thread and the exit hook only hold weak references, so the
+        # instance can still be collected (and __del__ close the port)
+        task_send = threading.Thread(target=Sparky.__send_data, args=(weakref.ref(self), self.__tx_cond),
+                                     name="task_serial_send", daemon=True)
+        task_send.start()
+        # Don't lose a final command (e.g. motor stop) queued just before exit
+        self.__exit_hook = functools.partial(_flush_at_exit, weakref.ref(self), 1.0)
+        atexit.register(self.__exit_hook)
+
         if self.__debug:
             print(f"cmd_delay={self.__delay_time}s")
-        if self.ser.isOpen():
+        if self.ser is None:
+            print("Sparky offline, no serial port")
+        elif self.ser.isOpen():
             print("Sparky Serial Opened! Baudrate=115200")
         else:
             print("Serial Open Failed!")
@@ -80,122 +166,294 @@ class Sparky:
 
     def __del__(self):
         try:
+            atexit.unregister(self.__exit_hook)
+        except Exception:
+            pass
+        try:
+            if self.__capture is not None:
+                self.__capture.close()
             self.ser.close()
             self.__uart_state = 0
             print("serial Close!")
         except Exception:
             pass
 
-    def __parse_data(self, ext_type, ext_data):
-        if ext_type == self.FUNC_REPORT_SPEED:
-            self.__vx = int(struct.unpack('h', bytearray(ext_data[0:2]))[0]) / 1000.0
-            self.__vy = int(struct.unpack('h', bytearray(ext_data[2:4]))[0]) / 1000.0
-            self.__vz = int(struct.unpack('h', bytearray(ext_data[4:6]))[0]) / 1000.0
-            self.__battery_voltage = struct.unpack('B', bytearray(ext_data[6:7]))[0]
-        elif ext_type == self.FUNC_REPORT_IMU_RAW:
-            gyro_ratio = 1 / 3754.9
-            self.__gx = struct.unpack('h', bytearray(ext_data[0:2]))[0] * gyro_ratio
-            self.__gy = struct.unpack('h', bytearray(ext_data[2:4]))[0] * -gyro_ratio
-            self.__gz = struct.unpack('h', bytearray(ext_data[4:6]))[0] * -gyro_ratio
-            accel_ratio = 1 / 1671.84
-            self.__ax = struct.unpack('h', bytearray(ext_data[6:8]))[0] * accel_ratio
-            self.__ay = struct.unpack('h', bytearray(ext_data[8:10]))[0] * accel_ratio
-            self.__az = struct.unpack('h', bytearray(ext_data[10:12]))[0] * accel_ratio
-            mag_ratio = 1
-            self.__mx = struct.unpack('h', bytearray(ext_data[12:14]))[0] * mag_ratio
-            self.__my = struct.unpack('h', bytearray(ext_data[14:16]))[0] * mag_ratio
-            self.__mz = struct.unpack('h', bytearray(ext_data[16:18]))[0] * mag_ratio
-        elif ext_type == self.FUNC_REPORT_IMU_ATT:
-            self.__roll = struct.unpack('h', bytearray(ext_data[0:2]))[0] / 10000.0
-            self.__pitch = struct.unpack('h', bytearray(ext_data[2:4]))[0] / 10000.0
-            self.__yaw = struct.unpack('h', bytearray(ext_data[4:6]))[0] / 10000.0
-        elif ext_type == self.FUNC_REPORT_ENCODER:
-            self.__encoder_m1 = struct.unpack('i', bytearray(ext_data[0:4]))[0]
-            self.__encoder_m2 = struct.unpack('i', bytearray(ext_data[4:8]))[0]
-            self.__encoder_m3 = struct.unpack('i', bytearray(ext_data[8:12]))[0]
-            self.__encoder_m4 = struct.unpack('i', bytearray(ext_data[12:16]))[0]
+    def __record(self, kind, record):
+        record = self.__history[kind].push(record)
+        for callback in self.__subscribers[kind]:
+            try:
+                callback(record)
+            except Exception as e:
+                print(f'---{kind} callback error: {e}---')
+
+    # Called by the parser with the unpacked payload of every valid frame
+    def __parse_data(self, ext_type, values, t_ns=0):
+        report = report_record(ext_type, values, t_ns)
+        if report is not None:
+            kind, record = report
+            if kind == 'speed':
+                _, self.__vx, self.__vy, self.__vz, _ = record
+                self.__battery_voltage = values[3]
+            elif kind == 'imu_raw':
+                _, self.__gx, self.__gy, self.__gz, self.__ax, self.__ay, self.__az, \
+                    self.__mx, self.__my, self.__mz = record
+            elif kind == 'imu_att':
+                _, self.__roll, self.__pitch, self.__yaw = record
+            else:
+                self.__encoder_m1, self.__encoder_m2, self.__encoder_m3, self.__encoder_m4 = values
+            self.__record(kind, record)
         elif ext_type == self.FUNC_UART_SERVO:
-            self.__read_id = struct.unpack('B', bytearray(ext_data[0:1]))[0]
-            self.__read_val = struct.unpack('h', bytearray(ext_data[1:3]))[0]
+            self.__read_id, self.__read_val = values
             if self.__debug:
                 print("FUNC_UART_SERVO:", self.__read_id, self.__read_val)
+            self.__complete_reply(ext_type, self.__read_id, (self.__read_id, self.__read_val))
         elif ext_type == self.FUNC_ARM_CTRL:
-            for i in range(6):
-                self.__read_arm[i] = struct.unpack('h', bytearray(ext_data[i*2:(i+1)*2]))[0]
+            self.__read_arm = list(values)
             self.__read_arm_ok = 1
             if self.__debug:
                 print("FUNC_ARM_CTRL:", self.__read_arm)
+            self.__complete_reply(ext_type, None, list(values))
         elif ext_type == self.FUNC_VERSION:
-            self.__version_H = struct.unpack('B', bytearray(ext_data[0:1]))[0]
-            self.__version_L = struct.unpack('B', bytearray(ext_data[1:2]))[0]
+            self.__version_H, self.__version_L = values
+            self.__version = self.__version_H * 1.0 + self.__version_L / 10.0
             if self.__debug:
                 print("FUNC_VERSION:", self.__version_H, self.__version_L)
+            self.__complete_reply(ext_type, None, self.__version)
         elif ext_type == self.FUNC_SET_MOTOR_PID:
-            self.__pid_index = struct.unpack('B', bytearray(ext_data[0:1]))[0]
-            self.__kp1 = struct.unpack('h', bytearray(ext_data[1:3]))[0]
-            self.__ki1 = struct.unpack('h', bytearray(ext_data[3:5]))[0]
-            self.__kd1 = struct.unpack('h', bytearray(ext_data[5:7]))[0]
+            self.__pid_index, self.__kp1, self.__ki1, self.__kd1 = values
             if self.__debug:
                 print("FUNC_SET_MOTOR_PID:", self.__pid_index, [self.__kp1, self.__ki1, self.__kd1])
         elif ext_type == self.FUNC_SET_YAW_PID:
-            self.__pid_index = struct.unpack('B', bytearray(ext_data[0:1]))[0]
-            self.__kp1 = struct.unpack('h', bytearray(ext_data[1:3]))[0]
-            self.__ki1 = struct.unpack('h', bytearray(ext_data[3:5]))[0]
-            self.__kd1 = struct.unpack('h', bytearray(ext_data[5:7]))[0]
+            self.__pid_index, self.__kp1, self.__ki1, self.__kd1 = values
             if self.__debug:
                 print("FUNC_SET_YAW_PID:", self.__pid_index, [self.__kp1, self.__ki1, self.__kd1])
         elif ext_type == self.FUNC_ARM_OFFSET:
-            self.__arm_offset_id = struct.unpack('B', bytearray(ext_data[0:1]))[0]
-            self.__arm_offset_state = struct.unpack('B', bytearray(ext_data[1:2]))[0]
+            self.__arm_offset_id, self.__arm_offset_state = values
             if self.__debug:
                 print("FUNC_ARM_OFFSET:", self.__arm_offset_id, self.__arm_offset_state)
+            self.__complete_reply(ext_type, self.__arm_offset_id, self.__arm_offset_state)
         elif ext_type == self.FUNC_AKM_DEF_ANGLE:
-            _id = struct.unpack('B', bytearray(ext_data[0:1]))[0]
-            self.__akm_def_angle = struct.unpack('B', bytearray(ext_data[1:2]))[0]
+            _id, self.__akm_def_angle = values
             self.__akm_readed_angle = True
             if self.__debug:
                 print("FUNC_AKM_DEF_ANGLE:", _id, self.__akm_def_angle)
 
     def __receive_data(self):
         while True:
-            head1 = bytearray(self.ser.read())[0]
-            if head1 == self.__HEAD:
-                head2 = bytearray(self.ser.read())[0]
-                if head2 == self.__DEVICE_ID - 1:
-                    ext_len = bytearray(self.ser.read())[0]
-                    ext_type = bytearray(self.ser.read())[0]
-                    ext_data = []
-                    check_sum = ext_len + ext_type
-                    data_len = ext_len - 2
-                    rx_check_num = 0
-                    while len(ext_data) < data_len:
-                        value = bytearray(self.ser.read())[0]
-                        ext_data.append(value)
-                        if len(ext_data) == data_len:
-                            rx_check_num = value
-                        else:
-                            check_sum += value
-                    if check_sum % 256 == rx_check_num:
-                        self.__parse_data(ext_type, ext_data)
-                    elif self.__debug:
-                        print("check sum error:", ext_len, ext_type, ext_data)
+            # Block for the first byte, then take everything already buffered
+            try:
+                waiting = self.ser.in_waiting
+                data = self.ser.read(waiting if waiting > 0 else 1)
+            except (serial.SerialException, OSError) as e:
+                print('---serial receive error: %s---' % e)
+                self.__uart_state = 0
+                return
+            t_ns = time.monotonic_ns()
+            if self.__capture is not None:
+                self.__capture.write(RX, data, t_ns)
+            self.feed(data, t_ns)
+
+    # Queue a frame for the writer thread and return immediately.
+    # key=None frames are always sent; keyed frames replace an unsent one.
+    def __send(self, cmd, key=None):
+        with self.__tx_cond:
+            if key is not None and key in self.__tx_pending:
+                # Superseded: drop the old frame and send the new one in order
+                del self.__tx_pending[key]
+                self.__tx_stats['coalesced'] += 1
+            else:
+                while len(self.__tx_pending) >= self.__tx_limit:
+                    self.__tx_cond.wait()
+                if key is None:
+                    self.__tx_seq += 1
+                    key = self.__tx_seq
+            self.__tx_pending[key] = cmd
+            self.__tx_stats['queued'] += 1
+            self.__tx_cond.notify_all()
+
+    # Writer thread: holds the instance only while it sends, and ends once it is gone
+    @staticmethod
+    def __send_data(ref, cond):
+        while True:
+            with cond:
+                while True:
+                    self = ref()
+                    if self is None:
+                        return
+                    if self.__tx_pending:
+                        break
+                    self = None
+                    cond.wait(1.0)
+                self.__tx_busy = True
+                data = bytearray()
+                frames = 0
+                while self.__tx_pending and frames < self.__tx_batch:
+                    data += bytes(self.__tx_pending.popitem(last=False)[1])
+                    frames += 1
+                self.__tx_cond.notify_all()
+            try:
+                if self.ser is not None:
+                    self.ser.write(data)
+                if self.__capture is not None:
+                    self.__capture.write(TX, data)
+            except Exception:
+                print('---serial write error!---')
+            with self.__tx_cond:
+                self.__tx_stats['frames'] += frames
+                self.__tx_stats['writes'] += 1
+                self.__tx_stats['bytes'] += len(data)
+                self.__tx_busy = False
+                self.__tx_cond.notify_all()
+            # Pace the MCU; setters called meanwhile coalesce in the queue
+            delay = self.__delay_time
+            self = None
+            time.sleep(delay)
 
     def __request_data(self, function, param=0):
         cmd = [self.__HEAD, self.__DEVICE_ID, 0x05, self.FUNC_REQUEST_DATA, int(function) & 0xff, int(param) & 0xff]
         checksum = sum(cmd, self.__COMPLEMENT) & 0xff
         cmd.append(checksum)
-        self.ser.write(cmd)
+        self.__send(cmd)
         if self.__debug:
             print("request:", cmd)
-        time.sleep(self.__delay_time)
+
+    # Register a future for the reply (function, key) before sending the request
+    def __expect_reply(self, function, key=None):
+        future = Future()
+        future.reply_key = (function, key)
+        with self.__reply_lock:
+            self.__replies.setdefault(future.reply_key, []).append(future)
+        return future
+
+    # Called by the receive thread for every decoded reply
+    def __complete_reply(self, function, key, value):
+        with self.__reply_lock:
+            futures = self.__replies.pop((function, key), ())
+        for future in futures:
+            if future.set_running_or_notify_cancel():
+                future.set_result(value)
+
+    def __forget_reply(self, future):
+        with self.__reply_lock:
+            futures = self.__replies.get(future.reply_key)
+            if futures and future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self.__replies[future.reply_key]
+
+    # Block until the reply arrives; None after timeout seconds
+    def __wait_reply(self, future, timeout):
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            self.__forget_reply(future)
+            return None
+
+    async def __await_reply(self, future, timeout):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self.__forget_reply(future)
+            return None
+
+    def __request_uart_servo_value(self, servo_id):
+        future = self.__expect_reply(self.FUNC_UART_SERVO, int(servo_id) & 0xff)
+        self.__request_data(self.FUNC_UART_SERVO, int(servo_id) & 0xff)
+        return future
+
+    def __request_uart_servo_angle_array(self):
+        self.__read_arm = [-1] * 6
+        self.__read_arm_ok = 0
+        future = self.__expect_reply(self.FUNC_ARM_CTRL)
+        self.__request_data(self.FUNC_ARM_CTRL, 1)
+        return future
+
+    def __request_uart_servo_offset(self, servo_id):
+        self.__arm_offset_id = 0xff
+        self.__arm_offset_state = 0
+        s_id = int(servo_id) & 0xff
+        future = self.__expect_reply(self.FUNC_ARM_OFFSET, s_id)
+        cmd = [self.__HEAD, self.__DEVICE_ID, 0, self.FUNC_ARM_OFFSET, s_id]
+        cmd[2] = len(cmd) - 1
+        checksum = sum(cmd, self.__COMPLEMENT) & 0xff
+        cmd.append(checksum)
+        self.__send(cmd)
+        if self.__debug:
+            print("uartServo_offset:", cmd)
+        return future
+
+    def __request_version(self):
+        future = self.__expect_reply(self.FUNC_VERSION)
+        self.__request_data(self.FUNC_VERSION)
+        return future
+
+    def __uart_servo_angle(self, s_id, read_id, value):
+        valid = [
+            (s_id == 1 and read_id == 1 and 0 <= self.__arm_convert_angle(s_id, value) <= 180),
+            (s_id == 2 and read_id == 2 and 0 <= self.__arm_convert_angle(s_id, value) <= 180),
+            (s_id == 3 and read_id == 3 and 0 <= self.__arm_convert_angle(s_id, value) <= 180),
+            (s_id == 4 and read_id == 4 and 0 <= self.__arm_convert_angle(s_id, value) <= 180),
+            (s_id == 5 and read_id == 5 and 0 <= self.__arm_convert_angle(s_id, value) <= 270),
+            (s_id == 6 and read_id == 6 and 0 <= self.__arm_convert_angle(s_id, value) <= 180)
+        ]
+        if any(valid):
+            angle = self.__arm_convert_angle(s_id, value)
+        else:
+            if self.__debug:
+                print(f"read servo:{s_id} error or out of range!")
+            angle = -1
+        if self.__debug:
+            print(f"request angle {s_id}: {read_id}, {value}")
+        return angle
+
+    def __uart_servo_angle_array(self, read_arm):
+        angle = [-1] * 6
+        if read_arm is not None:
+            for i in range(6):
+                if read_arm[i] > 0:
+                    angle[i] = self.__arm_convert_angle(i+1, read_arm[i])
+            if self.__debug:
+                print("angle_array:", angle)
+        return angle
 
     def __limit_motor_value(self, value):
         if value == 127:
             return 127
         return max(-100, min(100, int(value)))
 
+    # Block until every queued command has been written to the serial port
+    def flush(self, timeout=None):
+        with self.__tx_cond:
+            return self.__tx_cond.wait_for(lambda: not self.__tx_pending and not self.__tx_busy, timeout)
+
+    # Counters of the command writer: frames queued/coalesced/sent, serial writes and bytes
+    def get_writer_stats(self):
+        with self.__tx_cond:
+            stats = dict(self.__tx_stats)
+            stats['pending'] = len(self.__tx_pending)
+        return stats
+
+    # Counters of the receive thread: bytes, valid frames, checksum errors,
+    # short frames, and the number of reports of each kind recorded so far
+    def get_receive_stats(self):
+        stats = dict(self.__parser.stats)
+        for kind, history in self.__history.items():
+            stats[kind] = history.count
+        return stats
+
+    # Parse bytes as if they were read from the serial port at t_ns
+    # (time.monotonic_ns(), now by default). Used by the receive thread and
+    # to replay captured data; only one thread may feed at a time.
+    def feed(self, data, t_ns=None):
+        if t_ns is None:
+            t_ns = time.monotonic_ns()
+        self.__parser.feed(data, t_ns)
+
     def create_receive_threading(self):
         try:
+            if self.ser is None:
+                print("Sparky offline, no receive thread")
+                return
             if self.__uart_state == 0:
                 task_receive = threading.Thread(target=self.__receive_data, name="task_serial_receive", daemon=True)
                 task_receive.start()
@@ -211,10 +469,9 @@ class Sparky:
             cmd = [self.__HEAD, self.__DEVICE_ID, 0x05, self.FUNC_AUTO_REPORT, state1, state2]
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            self.__send(cmd, (self.FUNC_AUTO_REPORT,))
             if self.__debug:
                 print("report:", cmd)
-            time.sleep(self.__delay_time)
         except Exception:
             print('---set_auto_report_state error!---')
 
@@ -227,10 +484,9 @@ class Sparky:
             cmd = [self.__HEAD, self.__DEVICE_ID, 0x05, self.FUNC_BEEP, value[0], value[1]]
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            self.__send(cmd)
             if self.__debug:
                 print("beep:", cmd)
-            time.sleep(self.__delay_time)
         except Exception:
             print('---set_beep error!---')
 
@@ -245,10 +501,9 @@ class Sparky:
             cmd[2] = len(cmd) - 1
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            self.__send(cmd, (self.FUNC_PWM_SERVO, int(servo_id)))
             if self.__debug:
                 print("pwmServo:", cmd)
-            time.sleep(self.__delay_time)
         except Exception:
             print('---set_pwm_servo error!---')
 
@@ -262,10 +517,10 @@ class Sparky:
             cmd[2] = len(cmd) - 1
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            # 255 leaves a servo unchanged, so only a full update supersedes
+            self.__send(cmd, None if 255 in angles else (self.FUNC_PWM_SERVO_ALL,))
             if self.__debug:
                 print("all Servo:", cmd)
-            time.sleep(self.__delay_time)
         except Exception:
             print('---set_pwm_servo_all error!---')
 
@@ -279,10 +534,9 @@ class Sparky:
             cmd[2] = len(cmd) - 1
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            self.__send(cmd, (self.FUNC_RGB, int(led_id) & 0xff))
             if self.__debug:
                 print("LED:", cmd)
-            time.sleep(self.__delay_time)
         except Exception:
             print('---set_led error!---')
 
@@ -298,10 +552,9 @@ class Sparky:
             cmd[2] = len(cmd) - 1
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            self.__send(cmd, (self.FUNC_RGB_EFFECT,))
             if self.__debug:
                 print("LED_pattern:", cmd)
-            time.sleep(self.__delay_time)
         except Exception:
             print('---set_led_pattern error!---')
 
@@ -318,10 +571,9 @@ class Sparky:
             cmd[2] = len(cmd) - 1
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            self.__send(cmd, (self.FUNC_MOTOR,))
             if self.__debug:
                 print("motor:", cmd)
-            time.sleep(self.__delay_time)
         except Exception:
             print('---set_motor error!---')
 
@@ -344,10 +596,9 @@ class Sparky:
             cmd[2] = len(cmd) - 1
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            self.__send(cmd, (self.FUNC_UART_SERVO, s_id))
             if self.__debug:
                 print("uartServo:", servo_id, int(pulse_value), cmd)
-            time.sleep(self.__delay_time)
         except Exception:
             print('---set_uart_servo error!---')
 
@@ -377,10 +628,9 @@ class Sparky:
             cmd = [self.__HEAD, self.__DEVICE_ID, 0x04, self.FUNC_UART_SERVO_ID, int(servo_id)]
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            self.__send(cmd)
             if self.__debug:
                 print("uartServo_id:", cmd)
-            time.sleep(self.__delay_time)
         except Exception:
             print('---set_uart_servo_id error!---')
 
@@ -390,10 +640,9 @@ class Sparky:
             cmd = [self.__HEAD, self.__DEVICE_ID, 0x04, self.FUNC_UART_SERVO_TORQUE, on]
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            self.__send(cmd, (self.FUNC_UART_SERVO_TORQUE,))
             if self.__debug:
                 print("uartServo_torque:", cmd)
-            time.sleep(self.__delay_time)
         except Exception:
             print('---set_uart_servo_torque error!---')
 
@@ -418,51 +667,42 @@ class Sparky:
                 cmd[2] = len(cmd) - 1
                 checksum = sum(cmd, self.__COMPLEMENT) & 0xff
                 cmd.append(checksum)
-                self.ser.write(cmd)
+                self.__send(cmd, (self.FUNC_ARM_CTRL,))
                 if self.__debug:
                     print("arm:", cmd)
                     print("value:", temp_val)
-                time.sleep(self.__delay_time)
             else:
                 print("angle_s input error!")
         except Exception:
             print('---set_uart_servo_angle_array error!---')
 
-    def set_uart_servo_offset(self, servo_id):
+    def set_uart_servo_offset(self, servo_id, timeout=0.25):
         try:
-            self.__arm_offset_id = 0xff
-            self.__arm_offset_state = 0
-            s_id = int(servo_id) & 0xff
-            cmd = [self.__HEAD, self.__DEVICE_ID, 0, self.FUNC_ARM_OFFSET, s_id]
-            cmd[2] = len(cmd) - 1
-            checksum = sum(cmd, self.__COMPLEMENT) & 0xff
-            cmd.append(checksum)
-            self.ser.write(cmd)
+            state = self.__wait_reply(self.__request_uart_servo_offset(servo_id), timeout)
+            if state is None:
+                return self.__arm_offset_state
             if self.__debug:
-                print("uartServo_offset:", cmd)
-            time.sleep(self.__delay_time)
-            for _ in range(200):
-                if self.__arm_offset_id == servo_id:
-                    if self.__debug:
-                        if self.__arm_offset_id == 0:
-                            print("Arm Reset Offset Value")
-                        else:
-                            print("Arm Offset State:", self.__arm_offset_id, self.__arm_offset_state, _)
-                    return self.__arm_offset_state
-                time.sleep(.001)
-            return self.__arm_offset_state
+                if servo_id == 0:
+                    print("Arm Reset Offset Value")
+                else:
+                    print("Arm Offset State:", servo_id, state)
+            return state
         except Exception:
             print('---set_uart_servo_offset error!---')
 
+    async def set_uart_servo_offset_async(self, servo_id, timeout=0.25):
+        state = await self.__await_reply(self.__request_uart_servo_offset(servo_id), timeout)
+        return self.__arm_offset_state if state is None else state
+
     def reset_flash_value(self):
         try:
             cmd = [self.__HEAD, self.__DEVICE_ID, 0x04, self.FUNC_RESET_FLASH, 0x5F]
             checksum = sum(cmd, self.__COMPLEMENT) & 0xff
             cmd.append(checksum)
-            self.ser.write(cmd)
+            self.__send(cmd)
             if self.__debug:
                 print("flash:", cmd)
-            time.sleep(self.__delay_time)
+            self.flush()
             time.sleep(.1)
         except Exception:
             print('---reset_flash_value error!---')
@@ -475,72 +715,58 @@ class Sparky:
         self.__mx, self.__my, self.__mz = 0, 0, 0
         self.__yaw, self.__roll, self.__pitch = 0, 0, 0
 
-    def get_uart_servo_value(self, servo_id):
+    # The request/reply getters below block only until the reply arrives or
+    # timeout seconds pass, and may be called from several threads at once.
+    # Each one has an asyncio variant (..._async) for use in an event loop;
+    # the receive thread must be running (create_receive_threading).
+    def get_uart_servo_value(self, servo_id, timeout=0.05):
         try:
             if servo_id < 1 or servo_id > 250:
                 print("get servo id input error!")
                 return
-            self.__read_id = 0
-            self.__read_val = 0
-            self.__request_data(self.FUNC_UART_SERVO, int(servo_id) & 0xff)
-            timeout = 30
-            while timeout > 0:
-                if self.__read_id > 0:
-                    return self.__read_id, self.__read_val
-                timeout -= 1
-                time.sleep(.001)
-            return -1, -1
+            reply = self.__wait_reply(self.__request_uart_servo_value(servo_id), timeout)
+            if reply is None:
+                return -1, -1
+            return reply
         except Exception:
             print('---get_uart_servo_value error!---')
             return -2, -2
 
-    def get_uart_servo_angle(self, s_id):
+    async def get_uart_servo_value_async(self, servo_id, timeout=0.05):
+        if servo_id < 1 or servo_id > 250:
+            print("get servo id input error!")
+            return
+        reply = await self.__await_reply(self.__request_uart_servo_value(servo_id), timeout)
+        if reply is None:
+            return -1, -1
+        return reply
+
+    def get_uart_servo_angle(self, s_id, timeout=0.05):
         try:
-            angle = -1
-            read_id, value = self.get_uart_servo_value(s_id)
-            valid = [
-                (s_id == 1 and read_id == 1 and 0 <= self.__arm_convert_angle(s_id, value) <= 180),
-                (s_id == 2 and read_id == 2 and 0 <= self.__arm_convert_angle(s_id, value) <= 180),
-                (s_id == 3 and read_id == 3 and 0 <= self.__arm_convert_angle(s_id, value) <= 180),
-                (s_id == 4 and read_id == 4 and 0 <= self.__arm_convert_angle(s_id, value) <= 180),
-                (s_id == 5 and read_id == 5 and 0 <= self.__arm_convert_angle(s_id, value) <= 270),
-                (s_id == 6 and read_id == 6 and 0 <= self.__arm_convert_angle(s_id, value) <= 180)
-            ]
-            if any(valid):
-                angle = self.__arm_convert_angle(s_id, value)
-            else:
-                if self.__debug:
-                    print(f"read servo:{s_id} error or out of range!")
-                angle = -1
-            if self.__debug:
-                print(f"request angle {s_id}: {read_id}, {value}")
-            return angle
+            read_id, value = self.get_uart_servo_value(s_id, timeout)
+            return self.__uart_servo_angle(s_id, read_id, value)
         except Exception:
             print('---get_uart_servo_angle error!---')
             return -2
 
-    def get_uart_servo_angle_array(self):
+    async def get_uart_servo_angle_async(self, s_id, timeout=0.05):
+        reply = await self.get_uart_servo_value_async(s_id, timeout)
+        if reply is None:
+            return -2
+        return self.__uart_servo_angle(s_id, *reply)
+
+    def get_uart_servo_angle_array(self, timeout=0.05):
         try:
-            angle = [-1] * 6
-            self.__read_arm = [-1] * 6
-            self.__read_arm_ok = 0
-            self.__request_data(self.FUNC_ARM_CTRL, 1)
-            timeout = 30
-            while timeout > 0:
-                if self.__read_arm_ok == 1:
-                    for i in range(6):
-                        if self.__read_arm[i] > 0:
-                            angle[i] = self.__arm_convert_angle(i+1, self.__read_arm[i])
-                    if self.__debug:
-                        print("angle_array:", 30-timeout, angle)
-                    break
-                timeout -= 1
-                time.sleep(.001)
-            return angle
+            read_arm = self.__wait_reply(self.__request_uart_servo_angle_array(), timeout)
+            return self.__uart_servo_angle_array(read_arm)
         except Exception:
             print('---get_uart_servo_angle_array error!---')
             return [-2] * 6
 
+    async def get_uart_servo_angle_array_async(self, timeout=0.05):
+        read_arm = await self.__await_reply(self.__request_uart_servo_angle_array(), timeout)
+        return self.__uart_servo_angle_array(read_arm)
+
     def get_yaw_roll_pitch(self, ToAngle=True):
         if ToAngle:
             RtA = 57.2957795
@@ -559,17 +785,36 @@ class Sparky:
         m1, m2, m3, m4 = self.__encoder_m1, self.__encoder_m2, self.__encoder_m3, self.__encoder_m4
         return m1, m2, m3, m4
 
-    def get_version(self):
+    # Recorded reports of one kind ('speed', 'imu_raw', 'imu_att', 'encoder')
+    # as a NumPy structured array view, oldest first. Fields are listed in
+    # REPORT_DTYPES; t is time.monotonic_ns() at arrival. since returns
+    # only records with t > since, count limits to the newest records.
+    # The view is overwritten as reports arrive, copy it to keep it.
+    def history(self, kind, since=None, count=None):
+        return self.__history[kind].view(since, count)
+
+    # Call callback(record) from the receive thread for every new report of
+    # a kind; record is a view, copy it before keeping it
+    def subscribe(self, kind, callback):
+        self.__subscribers[kind] = self.__subscribers[kind] + [callback]
+        return callback
+
+    def unsubscribe(self, kind, callback):
+        self.__subscribers[kind] = [c for c in self.__subscribers[kind] if c is not callback]
+
+    def get_version(self, timeout=0.05):
         if self.__version_H == 0:
-            self.__request_data(self.FUNC_VERSION)
-            for _ in range(20):
-                if self.__version_H != 0:
-                    val = self.__version_H * 1.0
-                    self.__version = val + self.__version_L / 10.0
-                    if self.__debug:
-                        print(f"get_version:V{self.__version}, i:{_}")
-                    return self.__version
-                time.sleep(.001)
+            version = self.__wait_reply(self.__request_version(), timeout)
+            if version is None:
+                return -1
+            if self.__debug:
+                print(f"get_version:V{version}")
+            return version
         else:
             return self.__version
-        return -1
\ No newline at end of file
+
+    async def get_version_async(self, timeout=0.05):
+        if self.__version_H == 0:
+            version = await self.__await_reply(self.__request_version(), timeout)
+            return -1 if version is None else version
+        return self.__version
\ No newline at end of file
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+# coding: utf-8
+'''
+asyncio-native Sparky client.
+
+AsyncSparky speaks the same serial protocol as Sparky but runs entirely in
+the event loop: the port is read with loop.add_reader() and written without
+blocking, commands are queued, coalesced and paced by a writer task, and
+replies resolve loop futures. No threads or locks are involved, so motors,
+sensors and e.g. a web UI can share one thread.
+
+    async def main():
+        async with AsyncSparky(com="/dev/ttyUSB0") as bot:
+            await bot.set_auto_report_state(True)
+            print(await bot.get_version())
+            await bot.set_motor(30, 30, 30, 30)
+            async for imu in bot.imu():
+                print(imu['t'], imu['gz'])
+
+    asyncio.run(main())
+
+Setters are coroutines that return once the command is queued; they only
+wait when queue_size commands are already pending, and give up after
+send_timeout seconds. Getters that query the MCU take a timeout (seconds)
+and return the same values as the Sparky getters when it passes.
+
+Report streams (speed(), imu(), attitude(), encoder()) yield copies of the
+REPORT_DTYPES records. Every stream has its own queue of stream_size
+records; when a consumer falls behind, its oldest records are dropped.
+
+The servo angle helpers of Sparky (set_uart_servo_angle and friends) are
+not included since the pulse/angle conversion they rely on is not defined;
+use the pulse-based set_uart_servo()/get_uart_servo_value().
+'''
+
+import os
+import time
+import struct
+import asyncio
+from collections import OrderedDict
+
+import serial
+
+from Sparky_Packages import REPORT_DTYPES, ReportHistory
+from sparky_capture import SerialCapture, RX, TX
+from sparky_protocol import SparkyProtocol, FrameParser, report_record, command_frame
+
+
+class AsyncSparky(SparkyProtocol):
+    # com: serial port, None to only parse data passed to feed().
+    # delay: gap between serial writes, so the MCU can absorb each batch.
+    # queue_size / batch_size: as for Sparky's writer thread.
+    # send_timeout: seconds a setter may wait for room in a full queue.
+    # history_size: reports of each kind kept for history().
+    # stream_size: records buffered per report stream before dropping the oldest.
+    # capture: path of a sparky_capture log to append the raw traffic to.
+    def __init__(self, car_type=1, com="/dev/myserial", delay=0.002, debug=False, queue_size=64, batch_size=8,
+                 send_timeout=1.0, history_size=4096, stream_size=64, capture=None):
+        self.com = com
+        self.ser = None
+        self.__CAR_TYPE = car_type
+        self.__delay_time = delay
+        self.__debug = debug
+        self.__capture = None
+        if capture is not None:
+            self.__capture = SerialCapture(capture)
+
+        self.__history = {kind: ReportHistory(dtype, history_size) for kind, dtype in REPORT_DTYPES.items()}
+        self.__streams = {kind: [] for kind in REPORT_DTYPES}
+        self.__stream_size = stream_size
+        self.__parser = FrameParser(self.__parse_data, debug)
+        self.__dropped = 0
+        # Set once the port closed, until the next open()
+        self.__closed = False
+
+        self.__roll = self.__pitch = self.__yaw = 0
+        self.__encoder = (0, 0, 0, 0)
+        self.__battery_voltage = 0
+        self.__version = None
+        self.__arm_ctrl_enable = True
+
+        # Requests waiting for a reply, keyed by (function, id)
+        self.__replies = {}
+
+        # Commands waiting for the writer task; a keyed command replaces an unsent one
+        self.__tx_pending = OrderedDict()
+        self.__tx_seq = 0
+        self.__tx_busy = False
+        self.__tx_limit = queue_size
+        self.__tx_batch = batch_size
+        self.__send_timeout = send_timeout
+        self.__tx_stats = {'queued': 0, 'coalesced': 0, 'frames': 0, 'writes': 0, 'bytes': 0}
+        self.__tx_changed = None
+        self.__writer = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # Open the port and start reading and writing in the running loop
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.__tx_changed = asyncio.Event()
+        self.__closed = False
+        if self.com is not None:
+            # pyserial opens the port with O_NONBLOCK; timeout=0 keeps read() from waiting
+            self.ser = serial.Serial(self.com, 115200, timeout=0, write_timeout=0)
+            loop.add_reader(self.ser.fileno(), self.__on_readable)
+            print("AsyncSparky Serial Opened! Baudrate=115200")
+        self.__writer = loop.create_task(self.__send_data())
+        return self
+
+    # Send what is queued (up to timeout seconds), then close the port and end all streams
+    async def close(self, timeout=1.0):
+        if self.__writer is None:
+            return
+        await self.flush(timeout)
+        self.__writer.cancel()
+        self.__writer = None
+        self.__disconnect()
+
+    def __disconnect(self):
+        self.__closed = True
+        if self.ser is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self.ser.fileno())
+            except Exception:
+                pass
+            self.ser.close()
+            self.ser = None
+        if self.__capture is not None:
+            self.__capture.close()
+            self.__capture = None
+        # Requests still waiting get None, which the getters turn into their timeout value
+        for futures in self.__replies.values():
+            for future in futures:
+                if not future.done():
+                    future.set_result(None)
+        self.__replies.clear()
+        for streams in self.__streams.values():
+            for queue in streams:
+                self.__put_record(queue, None)
+
+    def __on_readable(self):
+        try:
+            data = os.read(self.ser.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print('---serial receive error: %s---' % e)
+            self.__disconnect()
+            return
+        if not data:
+            print('---serial receive error: port closed---')
+            self.__disconnect()
+            return
+        t_ns = time.monotonic_ns()
+        if self.__capture is not None:
+            self.__capture.write(RX, data, t_ns)
+        self.feed(data, t_ns)
+
+    # Parse bytes as if they were read from the serial port at t_ns
+    # (time.monotonic_ns(), now by default), e.g. to replay a capture
+    def feed(self, data, t_ns=None):
+        if t_ns is None:
+            t_ns = time.monotonic_ns()
+        self.__parser.feed(data, t_ns)
+
+    # Called by the parser with the unpacked payload of every valid frame
+    def __parse_data(self, ext_type, values, t_ns):
+        report = report_record(ext_type, values, t_ns)
+        if report is not None:
+            kind, record = report
+            if kind == 'speed':
+                self.__battery_voltage = values[3]
+            elif kind == 'imu_att':
+                self.__roll, self.__pitch, self.__yaw = record[1:]
+            elif kind == 'encoder':
+                self.__encoder = values
+            self.__record(kind, record)
+            return
+        if self.__debug:
+            print("reply:", hex(ext_type), values)
+        if ext_type == self.FUNC_UART_SERVO:
+            self.__complete_reply(ext_type, values[0], values)
+        elif ext_type == self.FUNC_ARM_CTRL:
+            self.__complete_reply(ext_type, None, list(values))
+        elif ext_type == self.FUNC_VERSION:
+            self.__version = values[0] * 1.0 + values[1] / 10.0
+            self.__complete_reply(ext_type, None, self.__version)
+        elif ext_type == self.FUNC_ARM_OFFSET:
+            self.__complete_reply(ext_type, values[0], values[1])
+
+    def __record(self, kind, record):
+        record = self.__history[kind].push(record)
+        for queue in self.__streams[kind]:
+            self.__put_record(queue, record.copy())
+
+    def __put_record(self, queue, record):
+        if queue.full():
+            # Slow consumer: drop its oldest record rather than stall the reader
+            queue.get_nowait()
+            self.__dropped += 1
+        queue.put_nowait(record)
+
+    def __complete_reply(self, function, key, value):
+        for future in self.__replies.pop((function, key), ()):
+            if not future.done():
+                future.set_result(value)
+
+    # Queue a request and wait for its reply; None after timeout seconds
+    async def __request(self, cmd, function, key=None, timeout=0.05):
+        future = asyncio.get_running_loop().create_future()
+        self.__replies.setdefault((function, key), []).append(future)
+        try:
+            await self.__send(cmd)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            futures = self.__replies.get((function, key))
+            if futures and future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self.__replies[(function, key)]
+
+    def __frame(self, function, data):
+        cmd = command_frame(function, data)
+        if self.__debug:
+            print("cmd:", list(cmd))
+        return cmd
+
+    # Queue a frame for the writer task, waiting for room if the queue is full.
+    # key=None frames are always sent; keyed frames replace an unsent one.
+    async def __send(self, cmd, key=None):
+        if key is not None and key in self.__tx_pending:
+            del self.__tx_pending[key]
+            self.__tx_stats['coalesced'] += 1
+        else:
+            if len(self.__tx_pending) >= self.__tx_limit:
+                await asyncio.wait_for(self.__wait_tx(lambda: len(self.__tx_pending) < self.__tx_limit),
+                                       self.__send_timeout)
+            if key is None:
+                self.__tx_seq += 1
+                key = self.__tx_seq
+        self.__tx_pending[key] = cmd
+        self.__tx_stats['queued'] += 1
+        self.__tx_changed.set()
+
+    async def __wait_tx(self, predicate):
+        while not predicate():
+            self.__tx_changed.clear()
+            await self.__tx_changed.wait()
+
+    async def __send_data(self):
+        while True:
+            await self.__wait_tx(lambda: self.__tx_pending)
+            self.__tx_busy = True
+            data = bytearray()
+            frames = 0
+            while self.__tx_pending and frames < self.__tx_batch:
+                data += self.__tx_pending.popitem(last=False)[1]
+                frames += 1
+            self.__tx_changed.set()
+            try:
+                await self.__write(data)
+            except OSError as e:
+                print('---serial write error: %s---' % e)
+            self.__tx_stats['frames'] += frames
+            self.__tx_stats['writes'] += 1
+            self.__tx_stats['bytes'] += len(data)
+            self.__tx_busy = False
+            self.__tx_changed.set()
+            # Pace the MCU; setters called meanwhile coalesce in the queue
+            await asyncio.sleep(self.__delay_time)
+
+    # Non-blocking write of the whole buffer, waiting for the port to drain if needed
+    async def __write(self, data):
+        if self.ser is None:
+            return
+        if self.__capture is not None:
+            self.__capture.write(TX, data)
+        loop = asyncio.get_running_loop()
+        fd = self.ser.fd
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(fd, view):]
+            except BlockingIOError:
+                writable = loop.create_future()
+                loop.add_writer(fd, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    loop.remove_writer(fd)
+
+    # Wait until every queued command has been written; False on timeout
+    async def flush(self, timeout=None):
+        try:
+            await asyncio.wait_for(self.__wait_tx(lambda: not self.__tx_pending and not self.__tx_busy), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def get_writer_stats(self):
+        stats = dict(self.__tx_stats)
+        stats['pending'] = len(self.__tx_pending)
+        return stats
+
+    # Receive counters, 'dropped' counts records discarded by full streams
+    def get_receive_stats(self):
+        stats = dict(self.__parser.stats)
+        stats['dropped'] = self.__dropped
+        for kind, history in self.__history.items():
+            stats[kind] = history.count
+        return stats
+
+    # Report streams: async iterators over new records of one kind, each a
+    # copy of a REPORT_DTYPES record. The iterator ends when the port closes,
+    # and right away if the port is not open.
+    async def reports(self, kind, maxsize=None):
+        if self.__closed or (self.com is not None and self.ser is None):
+            return
+        queue = asyncio.Queue(maxsize or self.__stream_size)
+        self.__streams[kind].append(queue)
+        try:
+            while True:
+                record = await queue.get()
+                if record is None:
+                    return
+                yield record
+        finally:
+            self.__streams[kind].remove(queue)
+
+    def speed(self, maxsize=None):
+        return self.reports('speed', maxsize)
+
+    def imu(self, maxsize=None):
+        return self.reports('imu_raw', maxsize)
+
+    def attitude(self, maxsize=None):
+        return self.reports('imu_att', maxsize)
+
+    def encoder(self, maxsize=None):
+        return self.reports('encoder', maxsize)
+
+    # Same as Sparky.history(): a view of the newest records of one kind
+    def history(self, kind, since=None, count=None):
+        return self.__history[kind].view(since, count)
+
+    async def set_auto_report_state(self, enable, forever=False):
+        try:
+            cmd = self.__frame(self.FUNC_AUTO_REPORT, [1 if enable else 0, 0x5F if forever else 0])
+            await self.__send(cmd, (self.FUNC_AUTO_REPORT,))
+        except Exception:
+            print('---set_auto_report_state error!---')
+
+    async def set_beep(self, on_time):
+        try:
+            if on_time < 0:
+                print("beep input error!")
+                return
+            await self.__send(self.__frame(self.FUNC_BEEP, struct.pack('<h', int(on_time))))
+        except Exception:
+            print('---set_beep error!---')
+
+    async def set_pwm_servo(self, servo_id, angle):
+        try:
+            if not (1 <= servo_id <= 4):
+                if self.__debug:
+                    print("set_pwm_servo input invalid")
+                return
+            angle = max(0, min(180, int(angle)))
+            cmd = self.__frame(self.FUNC_PWM_SERVO, [int(servo_id), angle])
+            await self.__send(cmd, (self.FUNC_PWM_SERVO, int(servo_id)))
+        except Exception:
+            print('---set_pwm_servo error!---')
+
+    async def set_pwm_servo_all(self, angle_s1, angle_s2, angle_s3, angle_s4):
+        try:
+            angles = [int(a) if 0 <= a <= 180 else 255 for a in (angle_s1, angle_s2, angle_s3, angle_s4)]
+            cmd = self.__frame(self.FUNC_PWM_SERVO_ALL, angles)
+            # 255 leaves a servo unchanged, so only a full update supersedes
+            await self.__send(cmd, None if 255 in angles else (self.FUNC_PWM_SERVO_ALL,))
+        except Exception:
+            print('---set_pwm_servo_all error!---')
+
+    # led_id = [0, 13] sets one RGB light, 0xFF sets all of them
+    async def set_led(self, led_id, red, green, blue):
+        try:
+            led_id = int(led_id) & 0xff
+            cmd = self.__frame(self.FUNC_RGB, [led_id, int(red) & 0xff, int(green) & 0xff, int(blue) & 0xff])
+            await self.__send(cmd, (self.FUNC_RGB, led_id))
+        except Exception:
+            print('---set_led error!---')
+
+    # Effect, speed and parm as for Sparky.set_led_pattern()
+    async def set_led_pattern(self, effect, speed=255, parm=255):
+        try:
+            cmd = self.__frame(self.FUNC_RGB_EFFECT, [int(effect) & 0xff, int(speed) & 0xff, int(parm) & 0xff])
+            await self.__send(cmd, (self.FUNC_RGB_EFFECT,))
+        except Exception:
+            print('---set_led_pattern error!---')
+
+    async def set_motor(self, speed_1, speed_2, speed_3, speed_4):
+        try:
+            # 127 keeps a motor's current speed, everything else is limited to [-100, 100]
+            vals = [127 if v == 127 else max(-100, min(100, int(v))) for v in (speed_1, speed_2, speed_3, speed_4)]
+            await self.__send(self.__frame(self.FUNC_MOTOR, struct.pack('<4b', *vals)), (self.FUNC_MOTOR,))
+        except Exception:
+            print('---set_motor error!---')
+
+    async def set_uart_servo(self, servo_id, pulse_value, run_time=500):
+        try:
+            if not self.__arm_ctrl_enable:
+                return
+            if servo_id < 1 or pulse_value < 96 or pulse_value > 4000 or run_time < 0:
+                print("set uart servo input error")
+                return
+            s_id = int(servo_id) & 0xff
+            data = struct.pack('<Bhh', s_id, int(pulse_value), min(int(run_time), 2000))
+            await self.__send(self.__frame(self.FUNC_UART_SERVO, data), (self.FUNC_UART_SERVO, s_id))
+        except Exception:
+            print('---set_uart_servo error!---')
+
+    async def set_uart_servo_id(self, servo_id):
+        try:
+            if servo_id < 1 or servo_id > 250:
+                print("servo id input error!")
+                return
+            await self.__send(self.__frame(self.FUNC_UART_SERVO_ID, [int(servo_id)]))
+        except Exception:
+            print('---set_uart_servo_id error!---')
+
+    async def set_uart_servo_torque(self, enable):
+        try:
+            cmd = self.__frame(self.FUNC_UART_SERVO_TORQUE, [1 if enable else 0])
+            await self.__send(cmd, (self.FUNC_UART_SERVO_TORQUE,))
+        except Exception:
+            print('---set_uart_servo_torque error!---')
+
+    def set_uart_servo_ctrl_enable(self, enable):
+        self.__arm_ctrl_enable = bool(enable)
+
+    # Returns the MCU's state for servo_id, -1 without a reply before timeout
+    async def set_uart_servo_offset(self, servo_id, timeout=0.25):
+        s_id = int(servo_id) & 0xff
+        state = await self.__request(self.__frame(self.FUNC_ARM_OFFSET, [s_id]), self.FUNC_ARM_OFFSET, s_id,
+                                     timeout)
+        return -1 if state is None else state
+
+    async def reset_flash_value(self):
+        try:
+            await self.__send(self.__frame(self.FUNC_RESET_FLASH, [0x5F]))
+            await self.flush()
+            await asyncio.sleep(.1)
+        except Exception:
+            print('---reset_flash_value error!---')
+
+    def __request_frame(self, function, param=0):
+        return self.__frame(self.FUNC_REQUEST_DATA, [int(function) & 0xff, int(param) & 0xff])
+
+    # (servo_id, pulse), or (-1, -1) without a reply before timeout
+    async def get_uart_servo_value(self, servo_id, timeout=0.05):
+        if servo_id < 1 or servo_id > 250:
+            print("get servo id input error!")
+            return
+        s_id = int(servo_id) & 0xff
+        reply = await self.__request(self.__request_frame(self.FUNC_UART_SERVO, s_id), self.FUNC_UART_SERVO, s_id,
+                                     timeout)
+        return (-1, -1) if reply is None else reply
+
+    # Pulses of servos 1..6, -1 each without a reply before timeout
+    async def get_uart_servo_value_array(self, timeout=0.05):
+        reply = await self.__request(self.__request_frame(self.FUNC_ARM_CTRL, 1), self.FUNC_ARM_CTRL, None,
+                                     timeout)
+        return [-1] * 6 if reply is None else reply
+
+    # -1 without a reply before timeout
+    async def get_version(self, timeout=0.05):
+        if self.__version is None:
+            version = await self.__request(self.__request_frame(self.FUNC_VERSION), self.FUNC_VERSION, None, timeout)
+            return -1 if version is None else version
+        return self.__version
+
+    def get_yaw_roll_pitch(self, ToAngle=True):
+        if ToAngle:
+            RtA = 57.2957795
+            return self.__roll * RtA, self.__pitch * RtA, self.__yaw * RtA
+        return self.__roll, self.__pitch, self.__yaw
+
+    def get_battery_voltage(self):
+        return self.__battery_voltage / 10.0
+
+    def get_motor_encoder(self):
+        return self.__encoder
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# coding: utf-8
+'''
+Sparky link benchmark against the PTY emulator (no hardware needed).
+
+Starts sparky_emulator.py in a separate process, connects Sparky to its
+port and reports:
+- receive path: frames/s decoded, CPU used by this process per frame and
+  in total, and reports lost (sent by the emulator but never decoded),
+- query latency: get_uart_servo_value() round trips (median / p99),
+- command path: setter call time, frames coalesced and serial writes.
+
+Usage:
+    python3 bench_sparky.py
+    python3 bench_sparky.py --seconds 10 --encoder 200 --imu-raw 200 --corrupt 0.01
+    python3 bench_sparky.py --baud 0     (unpaced emulator, parser stress test)
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from Sparky_Packages import Sparky
+from sparky_emulator import REPORT_RATES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sparky link benchmark against the PTY emulator")
+    parser.add_argument("--seconds", type=float, default=5.0, help="receive measurement length")
+    parser.add_argument("--queries", type=int, default=200, help="servo queries for the latency test")
+    parser.add_argument("--commands", type=int, default=1000, help="control ticks for the command test")
+    for kind in REPORT_RATES:
+        parser.add_argument("--" + kind.replace("_", "-"), type=float, default=REPORT_RATES[kind],
+                            help="%s report rate in Hz" % kind)
+    parser.add_argument("--baud", type=int, default=115200, help="emulator output pacing, 0 = unpaced")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="fraction of corrupted report frames")
+    args = parser.parse_args()
+
+    emulator_args = [sys.executable, os.path.join(HERE, "sparky_emulator.py"), "--baud", str(args.baud),
+                     "--corrupt", str(args.corrupt), "--seed", "1", "--silent"]
+    for kind in REPORT_RATES:
+        emulator_args += ["--" + kind.replace("_", "-"), str(getattr(args, kind))]
+    emulator = subprocess.Popen(emulator_args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    port = emulator.stdout.readline().split()[-1]
+
+    bot = Sparky(com=port)
+    bot.create_receive_threading()
+    # The emulator stays silent until asked, so every report it sends can be decoded
+    bot.set_auto_report_state(True)
+    time.sleep(0.5)
+
+    # Receive path
+    start_stats = bot.get_receive_stats()
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    time.sleep(args.seconds)
+    cpu = time.process_time() - cpu0
+    wall = time.perf_counter() - wall0
+    stats = bot.get_receive_stats()
+    frames = stats['frames'] - start_stats['frames']
+    print("Receive: %d frames in %.1f s (%.0f frames/s, %.0f bytes/s)" % (
+        frames, wall, frames / wall, (stats['bytes'] - start_stats['bytes']) / wall))
+    print("  CPU: %.1f%% of one core, %.1f us per frame" % (100.0 * cpu / wall, 1e6 * cpu / max(frames, 1)))
+
+    # Query latency
+    latency = []
+    timeouts = 0
+    for i in range(args.queries):
+        t0 = time.perf_counter()
+        read_id, _ = bot.get_uart_servo_value(1 + i % 6)
+        latency.append((time.perf_counter() - t0) * 1e3)
+        if read_id < 0:
+            timeouts += 1
+    latency.sort()
+    print("Query round trip: median %.2f ms, p99 %.2f ms, %d timeouts of %d" % (
+        statistics.median(latency), latency[int(0.99 * (len(latency) - 1))], timeouts, len(latency)))
+
+    # Command path
+    writer0 = bot.get_writer_stats()
+    t0 = time.perf_counter()
+    for i in range(args.commands):
+        bot.set_motor(i % 100, i % 100, i % 100, i % 100)
+        bot.set_pwm_servo(1, i % 180)
+        bot.set_led(0xFF, i % 256, 0, 0)
+    call = time.perf_counter() - t0
+    bot.flush()
+    bot.set_motor(0, 0, 0, 0)
+    bot.flush()
+    writer = bot.get_writer_stats()
+    print("Commands: %d setter calls in %.1f ms (%.1f us each), %d coalesced, %d frames in %d writes" % (
+        3 * args.commands, call * 1e3, call * 1e6 / (3 * args.commands),
+        writer['coalesced'] - writer0['coalesced'], writer['frames'] - writer0['frames'],
+        writer['writes'] - writer0['writes']))
+
+    # Loss: reports the emulator sent that were never decoded.
+    # Stop the stream first so nothing is still in flight when counting.
+    bot.set_auto_report_state(False)
+    bot.flush()
+    time.sleep(0.2)
+    stats = bot.get_receive_stats()
+    emulator.stdin.close()
+    sent = json.loads(emulator.stdout.readlines()[-1])
+    emulator.wait()
+    print("Reports sent / decoded / lost (emulator corrupted %d):" % sent['corrupted'])
+    for kind in REPORT_RATES:
+        lost = sent['sent'][kind] - stats[kind]
+        print("  %-8s %7d %7d %7d (%.2f%%)" % (kind, sent['sent'][kind], stats[kind], lost,
+                                             100.0 * lost / max(sent['sent'][kind], 1)))
+    print("  checksum errors: %d, short frames: %d" % (stats['checksum_errors'], stats['short_frames']))
+
+
+if __name__ == "__main__":
+    main()
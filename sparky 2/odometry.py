@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# coding: utf-8
+'''
+Wheel odometry from Sparky encoder reports.
+
+Every encoder report recorded by Sparky.history('encoder') becomes a pose
+(t, x, y, theta, v, omega) with the report's timestamp. update() integrates
+all reports received since the previous call in one vectorized pass, so it
+can be called at any rate without losing samples.
+
+    bot = Sparky(com="/dev/ttyUSB0")
+    bot.create_receive_threading()
+    bot.set_auto_report_state(True)
+    odom = WheelOdometry(bot, kinematics='mecanum', imu_weight=0.9)
+    while True:
+        odom.update()
+        print(odom.pose())
+
+Units are meters, seconds and radians; theta is counter-clockwise from the
+start heading. Wheel order follows the motor numbering:
+m1 front left, m2 rear left, m3 front right, m4 rear right.
+'''
+
+import math
+import numpy as np
+
+from Sparky_Packages import ReportHistory
+
+POSE_DTYPE = np.dtype([('t', 'i8'), ('x', 'f8'), ('y', 'f8'), ('theta', 'f8'), ('v', 'f8'), ('vy', 'f8'),
+                       ('omega', 'f8')])
+
+# Ticks per meter measured with encoder_calibration.py
+TICKS_PER_METER = 3190
+
+
+class WheelOdometry:
+    # bot: Sparky instance to read reports from (None to feed integrate() directly).
+    # kinematics: 'diff' (skid steer / differential) or 'mecanum'.
+    # ticks_per_meter: one value or one per wheel (m1..m4).
+    # wheel_signs: +1/-1 per wheel so that driving forward counts up.
+    # track_width: distance between left and right wheels in meters.
+    # wheel_base: distance between front and rear axles (mecanum only).
+    # imu_weight: 0 uses encoders only; closer to 1 trusts the IMU yaw
+    #             (FUNC_REPORT_IMU_ATT) more for heading changes.
+    # imu_timeout: with imu_weight > 0, update() holds back encoder reports newer
+    #              than the last IMU report, for at most this many seconds.
+    def __init__(self, bot=None, kinematics='diff', ticks_per_meter=TICKS_PER_METER, wheel_signs=(1, 1, 1, 1),
+                 track_width=0.17, wheel_base=0.16, imu_weight=0.0, imu_timeout=0.1, history_size=4096):
+        if kinematics not in ('diff', 'mecanum'):
+            raise ValueError("kinematics must be 'diff' or 'mecanum'")
+        self.bot = bot
+        self.kinematics = kinematics
+        self.meters_per_tick = np.asarray(wheel_signs, dtype=np.float64) / np.broadcast_to(
+            np.asarray(ticks_per_meter, dtype=np.float64), (4,))
+        self.track_width = float(track_width)
+        self.wheel_base = float(wheel_base)
+        self.imu_weight = float(imu_weight)
+        self.imu_timeout_ns = int(imu_timeout * 1e9)
+        self.poses = ReportHistory(POSE_DTYPE, history_size)
+        self.reset()
+
+    # Start again from (x, y, theta); the next encoder report is the reference
+    def reset(self, x=0.0, y=0.0, theta=0.0):
+        self.x = float(x)
+        self.y = float(y)
+        self.theta = float(theta)
+        self.last_t = None
+        self.last_ticks = None
+        self.last_yaw = None
+        self.encoder_since = None
+        self.imu_since = None
+
+    # Latest (t, x, y, theta, v, omega), None before the first pose
+    def pose(self):
+        if not len(self.poses):
+            return None
+        p = self.poses.view(count=1)[0]
+        return int(p['t']), float(p['x']), float(p['y']), float(p['theta']), float(p['v']), float(p['omega'])
+
+    # Poses with t > since (all kept poses by default), as a structured array view
+    def history(self, since=None, count=None):
+        return self.poses.view(since, count)
+
+    # Integrate every report received since the last call; returns the new poses
+    def update(self):
+        encoder = self.bot.history('encoder', since=self.encoder_since)
+        if not len(encoder):
+            return self.poses.view(count=0)
+        yaw_t = yaw = None
+        if self.imu_weight > 0:
+            att = self.bot.history('imu_att', since=self.imu_since)
+            # Encoder reports past the last IMU report wait for the IMU to cover
+            # them, unless it has been silent for imu_timeout
+            end = int(encoder['t'][-1]) - self.imu_timeout_ns
+            if len(att):
+                end = max(end, int(att['t'][-1]))
+            elif self.imu_since is not None:
+                end = max(end, self.imu_since)
+            encoder = encoder[:np.searchsorted(encoder['t'], end, side='right')]
+            if not len(encoder):
+                return self.poses.view(count=0)
+            if len(att):
+                self.imu_since = int(att['t'][-1])
+            yaw_t, yaw = att['t'], att['yaw']
+        self.encoder_since = int(encoder['t'][-1])
+        ticks = np.stack([encoder['m1'], encoder['m2'], encoder['m3'], encoder['m4']], axis=1)
+        return self.integrate(encoder['t'], ticks, yaw_t, yaw)
+
+    # Vectorized integration of n encoder samples.
+    # t: (n,) monotonic ns; ticks: (n, 4) cumulative counts m1..m4;
+    # yaw_t/yaw: optional IMU yaw samples (radians) to fuse.
+    def integrate(self, t, ticks, yaw_t=None, yaw=None):
+        t = np.asarray(t, dtype=np.int64)
+        ticks = np.asarray(ticks, dtype=np.int64)
+        if yaw is not None:
+            self.__push_yaw(np.asarray(yaw_t, dtype=np.int64), np.asarray(yaw, dtype=np.float64))
+        if self.last_ticks is None:
+            # First sample only sets the reference
+            self.last_t, self.last_ticks = int(t[0]), ticks[0].copy()
+            t, ticks = t[1:], ticks[1:]
+            if not len(t):
+                return self.poses.view(count=0)
+        prev_t = np.concatenate(([self.last_t], t[:-1]))
+        prev_ticks = np.vstack((self.last_ticks, ticks[:-1]))
+        # 32-bit MCU counters: take the difference modulo 2**32
+        dticks = (ticks - prev_ticks + 2 ** 31) % 2 ** 32 - 2 ** 31
+        d = dticks * self.meters_per_tick
+        fl, rl, fr, rr = d[:, 0], d[:, 1], d[:, 2], d[:, 3]
+
+        if self.kinematics == 'mecanum':
+            dx = (fl + fr + rl + rr) / 4.0
+            dy = (-fl + fr + rl - rr) / 4.0
+            dtheta = (-fl + fr - rl + rr) / (2.0 * (self.track_width + self.wheel_base))
+        else:
+            left = (fl + rl) / 2.0
+            right = (fr + rr) / 2.0
+            dx = (left + right) / 2.0
+            dy = np.zeros_like(dx)
+            dtheta = (right - left) / self.track_width
+
+        if self.last_yaw is not None:
+            dtheta = self.__fuse_yaw(t, prev_t, dtheta)
+
+        # Midpoint heading for each step, then accumulate in the world frame
+        theta = self.theta + np.cumsum(dtheta)
+        mid = theta - dtheta / 2.0
+        cos, sin = np.cos(mid), np.sin(mid)
+        x = self.x + np.cumsum(dx * cos - dy * sin)
+        y = self.y + np.cumsum(dx * sin + dy * cos)
+        dt = np.maximum(t - prev_t, 1) / 1e9
+
+        poses = np.empty(len(t), dtype=POSE_DTYPE)
+        poses['t'] = t
+        poses['x'] = x
+        poses['y'] = y
+        poses['theta'] = (theta + math.pi) % (2 * math.pi) - math.pi
+        poses['v'] = dx / dt
+        poses['vy'] = dy / dt
+        poses['omega'] = dtheta / dt
+        self.poses.extend(poses)
+
+        self.x, self.y, self.theta = float(x[-1]), float(y[-1]), float(theta[-1])
+        self.last_t, self.last_ticks = int(t[-1]), ticks[-1].copy()
+        return poses
+
+    # Append IMU yaw samples to the unwrapped ones kept from earlier batches
+    def __push_yaw(self, yaw_t, yaw):
+        if not len(yaw):
+            return
+        yaw = np.unwrap(yaw)
+        if self.last_yaw is not None:
+            # Continue the unwrapped sequence
+            yaw += np.round((self.last_yaw[1][-1] - yaw[0]) / (2 * math.pi)) * 2 * math.pi
+            yaw_t = np.concatenate((self.last_yaw[0], yaw_t))
+            yaw = np.concatenate((self.last_yaw[1], yaw))
+        else:
+            # May be a view of the report history, which gets overwritten
+            yaw_t = yaw_t.copy()
+        self.last_yaw = (yaw_t, yaw)
+
+    # Blend encoder and IMU heading changes over each encoder interval
+    def __fuse_yaw(self, t, prev_t, dtheta):
+        yaw_t, yaw = self.last_yaw
+        # Keep the samples from the last one at or before this batch's end,
+        # so the next batch's first interval is covered too
+        keep = max(int(np.searchsorted(yaw_t, t[-1], side='right')) - 1, 0)
+        self.last_yaw = (yaw_t[keep:], yaw[keep:])
+        if len(yaw) < 2:
+            return dtheta
+        # Only intervals covered by IMU samples are fused
+        covered = (prev_t >= yaw_t[0]) & (t <= yaw_t[-1])
+        imu_dtheta = np.interp(t, yaw_t, yaw) - np.interp(prev_t, yaw_t, yaw)
+        w = self.imu_weight
+        return np.where(covered, (1 - w) * dtheta + w * imu_dtheta, dtheta)
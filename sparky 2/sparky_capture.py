@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# coding: utf-8
+'''
+Raw capture and replay of the Sparky serial link.
+
+Sparky(capture="run.spkcap") appends every chunk read from and written to
+the serial port to a binary log, each with the time.monotonic_ns() of the
+read/write. A log can then be fed back through the same parser without
+hardware, so a field run's odometry or IMU data can be reproduced exactly
+(the reports get their recorded timestamps):
+
+    bot = Sparky(com=None)                      # offline, no port opened
+    replay = CaptureReplay("run.spkcap")
+    replay.run(bot)                             # original speed
+    replay.run(bot, speed=None)                 # as fast as possible
+    for t_ns, direction, data in replay.steps(bot):
+        ...                                     # one chunk at a time
+
+Log format (little endian): the 8 byte magic b'SPKYCAP1', then records of
+t_ns (int64), direction (uint8), length (uint16) and the data. Each time a
+log is opened a SESSION record is appended whose data is the wall clock
+time (float64), since monotonic times of different sessions don't compare.
+
+Usage:
+    python3 sparky_capture.py run.spkcap                 (summary)
+    python3 sparky_capture.py run.spkcap --replay --max  (replay benchmark)
+'''
+
+import os
+import sys
+import time
+import struct
+import argparse
+import threading
+
+MAGIC = b'SPKYCAP1'
+RECORD = struct.Struct('<qBH')
+WALL_TIME = struct.Struct('<d')
+
+RX = 0
+TX = 1
+SESSION = 2
+
+
+# Append-only writer of the capture log, shared by the receive and writer threads
+class SerialCapture:
+    # flush_interval: seconds between flushes to disk, a crash loses at most this much
+    def __init__(self, path, flush_interval=0.5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.__last_flush = time.monotonic()
+        self.write(SESSION, WALL_TIME.pack(time.time()))
+
+    def write(self, direction, data, t_ns=None):
+        if t_ns is None:
+            t_ns = time.monotonic_ns()
+        with self.lock:
+            if self.file is None:
+                return
+            # Chunks longer than a record can hold are split
+            for i in range(0, max(len(data), 1), 0xFFFF):
+                part = data[i:i + 0xFFFF]
+                self.file.write(RECORD.pack(t_ns, direction, len(part)))
+                self.file.write(part)
+            now = time.monotonic()
+            if now - self.__last_flush >= self.flush_interval:
+                self.file.flush()
+                self.__last_flush = now
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+# Yield (t_ns, direction, data) for every record of a capture log.
+# A record cut short (process killed while writing) ends the log.
+def read_capture(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("%s is not a Sparky capture log" % path)
+    pos = len(MAGIC)
+    end = len(data)
+    while pos + RECORD.size <= end:
+        t_ns, direction, length = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        if pos + length > end:
+            break
+        yield t_ns, direction, data[pos:pos + length]
+        pos += length
+
+
+# Feeds one session of a capture log back into Sparky.feed()
+class CaptureReplay:
+    # session: index of the session to replay, -1 for the last one
+    def __init__(self, path, session=-1):
+        sessions = []
+        for record in read_capture(path):
+            if record[1] == SESSION:
+                sessions.append([])
+            elif sessions:
+                sessions[-1].append(record)
+        if not sessions:
+            raise ValueError("%s holds no session" % path)
+        self.path = path
+        self.session_count = len(sessions)
+        self.records = sessions[session]
+
+    def __len__(self):
+        return len(self.records)
+
+    # Duration of the session in seconds
+    def duration(self):
+        if not self.records:
+            return 0.0
+        return (self.records[-1][0] - self.records[0][0]) / 1e9
+
+    # Feed the received chunks to bot one at a time and yield every record
+    # (t_ns, direction, data) after it was handled; TX records are only
+    # yielded, so the commands sent at the time can be inspected
+    def steps(self, bot):
+        for record in self.records:
+            if record[1] == RX:
+                bot.feed(record[2], record[0])
+            yield record
+
+    # Replay the whole session. speed scales the original timing (2.0 is
+    # twice as fast); None feeds the chunks as fast as possible.
+    # Returns the number of received bytes fed.
+    def run(self, bot, speed=1.0):
+        fed = 0
+        start_wall = time.monotonic()
+        start_t = self.records[0][0] if self.records else 0
+        for t_ns, direction, data in self.records:
+            if direction != RX:
+                continue
+            if speed:
+                delay = (t_ns - start_t) / 1e9 / speed - (time.monotonic() - start_wall)
+                if delay > 0:
+                    time.sleep(delay)
+            bot.feed(data, t_ns)
+            fed += len(data)
+        return fed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize or replay a Sparky capture log")
+    parser.add_argument("path")
+    parser.add_argument("--session", type=int, default=-1, help="session index, -1 for the last one")
+    parser.add_argument("--replay", action="store_true", help="replay the session through Sparky's parser")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    parser.add_argument("--max", action="store_true", help="replay as fast as possible")
+    args = parser.parse_args()
+
+    replay = CaptureReplay(args.path, args.session)
+    rx = [r for r in replay.records if r[1] == RX]
+    tx = [r for r in replay.records if r[1] == TX]
+    print("%s: %d bytes, %d sessions" % (args.path, os.path.getsize(args.path), replay.session_count))
+    print("session %d: %.1f s, rx %d chunks / %d bytes, tx %d chunks / %d bytes" % (
+        args.session, replay.duration(), len(rx), sum(len(r[2]) for r in rx),
+        len(tx), sum(len(r[2]) for r in tx)))
+    if not args.replay:
+        return
+
+    from Sparky_Packages import Sparky
+    bot = Sparky(com=None)
+    t0 = time.perf_counter()
+    fed = replay.run(bot, speed=None if args.max else args.speed)
+    elapsed = time.perf_counter() - t0
+    stats = bot.get_receive_stats()
+    print("replayed %d bytes in %.3f s: %d frames (%.0f frames/s), %d checksum errors, %d short frames" % (
+        fed, elapsed, stats['frames'], stats['frames'] / max(elapsed, 1e-9), stats['checksum_errors'],
+        stats['short_frames']))
+    print("reports: " + ", ".join("%s %d" % (kind, stats[kind]) for kind in ('speed', 'imu_raw', 'imu_att',
+                                                                            'encoder')))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# coding: utf-8
+'''
+Sparky MCU emulator on a pseudo-terminal.
+
+Opens a PTY pair and behaves like the Sparky board on the slave end, so
+Sparky(com=emulator.port) works without hardware:
+
+- parses 0xFF 0xFC command frames and checks their checksums,
+- answers FUNC_REQUEST_DATA for the version, UART servo values, arm
+  angles, motor/yaw PID and the Ackermann default angle, and
+  FUNC_ARM_OFFSET,
+- streams FUNC_REPORT_SPEED / IMU_RAW / IMU_ATT / ENCODER frames
+  (0xFF 0xFB) at configurable rates, paced to the serial baud rate, with
+  encoders and yaw following the last FUNC_MOTOR command,
+- optionally corrupts a fraction of the report frames.
+
+Run standalone (prints the port, Ctrl+C or closing stdin stops it and
+prints the counters as JSON):
+    python3 sparky_emulator.py --encoder 100 --imu-raw 100 --corrupt 0.01
+'''
+
+import os
+import sys
+import tty
+import math
+import json
+import time
+import random
+import struct
+import select
+import argparse
+import threading
+
+HEAD = 0xFF
+DEVICE_ID = 0xFC
+COMPLEMENT = 257 - DEVICE_ID
+
+FUNC_AUTO_REPORT = 0x01
+FUNC_REPORT_SPEED = 0x0A
+FUNC_REPORT_IMU_RAW = 0x0B
+FUNC_REPORT_IMU_ATT = 0x0C
+FUNC_REPORT_ENCODER = 0x0D
+FUNC_MOTOR = 0x10
+FUNC_SET_MOTOR_PID = 0x13
+FUNC_SET_YAW_PID = 0x14
+FUNC_UART_SERVO = 0x20
+FUNC_ARM_CTRL = 0x23
+FUNC_ARM_OFFSET = 0x24
+FUNC_AKM_DEF_ANGLE = 0x30
+FUNC_REQUEST_DATA = 0x50
+FUNC_VERSION = 0x51
+
+# Default auto-report rates in Hz
+REPORT_RATES = {'speed': 25, 'imu_raw': 100, 'imu_att': 100, 'encoder': 100}
+
+
+# Build a report/reply frame: 0xFF 0xFB len type data checksum
+def report_frame(ext_type, data):
+    ext_len = len(data) + 3
+    return bytes([HEAD, DEVICE_ID - 1, ext_len, ext_type]) + bytes(data) + \
+        bytes([(ext_len + ext_type + sum(data)) & 0xFF])
+
+
+class SparkyEmulator:
+    # rates: auto-report rates in Hz per kind ('speed', 'imu_raw', 'imu_att', 'encoder').
+    # baudrate: output is paced to this many bits/s (8N1); None sends as fast as possible.
+    # corrupt: fraction of report frames sent with one byte flipped or dropped.
+    # reporting: stream reports from the start, as the board does after power-up.
+    # ticks_per_second: encoder rate of a wheel at motor speed 100.
+    def __init__(self, rates=None, baudrate=115200, corrupt=0.0, reporting=True, ticks_per_second=3000,
+                 track_width=0.17, ticks_per_meter=3190, version=(1, 3), seed=None):
+        self.rates = dict(REPORT_RATES if rates is None else rates)
+        self.baudrate = baudrate
+        self.corrupt = corrupt
+        self.reporting = reporting
+        self.ticks_per_second = ticks_per_second
+        self.track_width = track_width
+        self.ticks_per_meter = ticks_per_meter
+        self.version = version
+        self.rng = random.Random(seed)
+
+        self.motor = [0, 0, 0, 0]
+        self.encoder = [0.0, 0.0, 0.0, 0.0]
+        self.yaw = 0.0
+        self.servo_pulse = {i: 2000 for i in range(1, 7)}
+        self.pid = {FUNC_SET_MOTOR_PID: (0, 800, 60, 20), FUNC_SET_YAW_PID: (0, 500, 0, 10)}
+        self.akm_def_angle = 90
+        self.battery = 120
+
+        self.stats = {'sent': {kind: 0 for kind in self.rates}, 'corrupted': 0, 'replies': 0,
+                      'commands': {}, 'bad_commands': 0, 'bytes_out': 0, 'bytes_in': 0}
+        self.lock = threading.Lock()
+        self.motion_lock = threading.Lock()
+        self.running = False
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.__next_free = 0.0
+
+    def start(self):
+        self.running = True
+        self.__last_motion = time.monotonic()
+        self.threads = [
+            threading.Thread(target=self.__read_commands, name="emulator_rx", daemon=True),
+            threading.Thread(target=self.__stream_reports, name="emulator_tx", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join(0.5)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    # Write to the PTY, waiting as long as the bytes would take on the wire
+    def __send(self, data):
+        with self.lock:
+            if self.baudrate:
+                now = time.monotonic()
+                start = max(now, self.__next_free)
+                self.__next_free = start + len(data) * 10.0 / self.baudrate
+                if start > now:
+                    time.sleep(start - now)
+            try:
+                os.write(self.master, data)
+            except OSError:
+                return
+            self.stats['bytes_out'] += len(data)
+
+    # Advance encoders and yaw from the last motor command
+    def __integrate_motion(self, motor=None):
+        with self.motion_lock:
+            now = time.monotonic()
+            dt = now - self.__last_motion
+            self.__last_motion = now
+            for i in range(4):
+                self.encoder[i] += self.motor[i] / 100.0 * self.ticks_per_second * dt
+            left = (self.motor[0] + self.motor[1]) / 200.0 * self.ticks_per_second / self.ticks_per_meter
+            right = (self.motor[2] + self.motor[3]) / 200.0 * self.ticks_per_second / self.ticks_per_meter
+            self.yaw = (self.yaw + (right - left) / self.track_width * dt + math.pi) % (2 * math.pi) - math.pi
+            if motor is not None:
+                self.motor = motor
+
+    def __report(self, kind):
+        self.__integrate_motion()
+        if kind == 'speed':
+            v = (sum(self.motor) / 400.0) * self.ticks_per_second / self.ticks_per_meter
+            frame = report_frame(FUNC_REPORT_SPEED, struct.pack('<hhhB', int(v * 1000), 0, 0, self.battery))
+        elif kind == 'imu_raw':
+            noise = [self.rng.randint(-20, 20) for _ in range(9)]
+            raw = [noise[0], noise[1], noise[2], noise[3], noise[4], 16384 + noise[5], 300, -200, 500]
+            frame = report_frame(FUNC_REPORT_IMU_RAW, struct.pack('<9h', *raw))
+        elif kind == 'imu_att':
+            frame = report_frame(FUNC_REPORT_IMU_ATT, struct.pack('<3h', 0, 0, int(self.yaw * 10000)))
+        else:
+            ticks = [int(e) & 0xFFFFFFFF for e in self.encoder]
+            frame = report_frame(FUNC_REPORT_ENCODER, struct.pack('<4I', *ticks))
+        self.stats['sent'][kind] += 1
+        if self.corrupt and self.rng.random() < self.corrupt:
+            self.stats['corrupted'] += 1
+            frame = bytearray(frame)
+            i = self.rng.randrange(2, len(frame))
+            if self.rng.random() < 0.5:
+                frame[i] ^= 1 << self.rng.randrange(8)
+            else:
+                del frame[i]
+            frame = bytes(frame)
+        self.__send(frame)
+
+    def __stream_reports(self):
+        now = time.monotonic()
+        deadlines = {kind: now for kind, rate in self.rates.items() if rate > 0}
+        while self.running:
+            now = time.monotonic()
+            kind = min(deadlines, key=deadlines.get) if deadlines else None
+            if kind is None:
+                time.sleep(0.1)
+                continue
+            if deadlines[kind] > now:
+                time.sleep(min(deadlines[kind] - now, 0.1))
+                continue
+            deadlines[kind] += 1.0 / self.rates[kind]
+            if deadlines[kind] < now:
+                # Fell behind (link saturated): skip missed slots
+                deadlines[kind] = now + 1.0 / self.rates[kind]
+            if self.reporting:
+                self.__report(kind)
+
+    def __read_commands(self):
+        buf = bytearray()
+        while self.running:
+            try:
+                if not select.select([self.master], [], [], 0.1)[0]:
+                    continue
+                data = os.read(self.master, 4096)
+            except (OSError, ValueError):
+                return
+            if not data:
+                return
+            self.stats['bytes_in'] += len(data)
+            buf += data
+            while True:
+                start = buf.find(bytes([HEAD, DEVICE_ID]))
+                if start < 0:
+                    del buf[:max(0, len(buf) - 1)]
+                    break
+                if len(buf) - start < 3:
+                    del buf[:start]
+                    break
+                end = start + buf[start + 2] + 2
+                if len(buf) < end:
+                    del buf[:start]
+                    break
+                cmd = bytes(buf[start:end])
+                if (sum(cmd[:-1]) + COMPLEMENT) & 0xFF == cmd[-1]:
+                    self.__handle(cmd[3], cmd[4:-1])
+                    del buf[:end]
+                else:
+                    self.stats['bad_commands'] += 1
+                    del buf[:start + 1]
+
+    def __reply(self, ext_type, data):
+        self.stats['replies'] += 1
+        self.__send(report_frame(ext_type, data))
+
+    def __handle(self, func, data):
+        commands = self.stats['commands']
+        commands[func] = commands.get(func, 0) + 1
+        if func == FUNC_AUTO_REPORT:
+            self.reporting = bool(data[0])
+        elif func == FUNC_MOTOR:
+            self.__integrate_motion([0 if v == 127 else v for v in struct.unpack('<4b', data[:4])])
+        elif func == FUNC_UART_SERVO:
+            servo_id, pulse, _ = struct.unpack('<Bhh', data[:5])
+            self.servo_pulse[servo_id] = pulse
+        elif func == FUNC_ARM_CTRL:
+            for i, pulse in enumerate(struct.unpack('<6h', data[:12])):
+                self.servo_pulse[i + 1] = pulse
+        elif func in (FUNC_SET_MOTOR_PID, FUNC_SET_YAW_PID) and len(data) >= 7:
+            self.pid[func] = struct.unpack('<Bhhh', data[:7])
+        elif func == FUNC_ARM_OFFSET:
+            self.__reply(FUNC_ARM_OFFSET, [data[0], 1])
+        elif func == FUNC_REQUEST_DATA:
+            what, param = data[0], data[1]
+            if what == FUNC_VERSION:
+                self.__reply(FUNC_VERSION, list(self.version))
+            elif what == FUNC_UART_SERVO and param in self.servo_pulse:
+                self.__reply(FUNC_UART_SERVO, struct.pack('<Bh', param, self.servo_pulse[param]))
+            elif what == FUNC_ARM_CTRL:
+                self.__reply(FUNC_ARM_CTRL, struct.pack('<6h', *[self.servo_pulse[i] for i in range(1, 7)]))
+            elif what in self.pid:
+                self.__reply(what, struct.pack('<Bhhh', *self.pid[what]))
+            elif what == FUNC_AKM_DEF_ANGLE:
+                self.__reply(FUNC_AKM_DEF_ANGLE, [1, self.akm_def_angle])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sparky MCU emulator on a pseudo-terminal")
+    for kind in REPORT_RATES:
+        parser.add_argument("--" + kind.replace("_", "-"), type=float, default=REPORT_RATES[kind],
+                            help="%s report rate in Hz (default %g)" % (kind, REPORT_RATES[kind]))
+    parser.add_argument("--baud", type=int, default=115200, help="pace output to this baud rate, 0 = unpaced")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="fraction of report frames to corrupt")
+    parser.add_argument("--silent", action="store_true", help="wait for FUNC_AUTO_REPORT before streaming")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    rates = {kind: getattr(args, kind) for kind in REPORT_RATES}
+    emulator = SparkyEmulator(rates, baudrate=args.baud or None, corrupt=args.corrupt,
+                              reporting=not args.silent, seed=args.seed).start()
+    print("port:", emulator.port, flush=True)
+    try:
+        # Run until stdin is closed (benchmark parent) or Ctrl+C
+        while sys.stdin.read(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    emulator.stop()
+    print(json.dumps(emulator.stats), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# coding: utf-8
+'''
+Serial protocol of the Sparky MCU, shared by Sparky (Sparky_Packages.py)
+and AsyncSparky (async_sparky.py): function codes, frame constants, the
+payload layout of every report and reply, and the receive-side frame
+parser.
+
+Frames sent to the MCU: 0xFF 0xFC len function data... checksum.
+Frames sent by the MCU: 0xFF 0xFB len type data... checksum, where len
+counts the bytes after itself plus one and checksum = (len + type +
+sum(data)) & 0xFF.
+'''
+
+import struct
+
+
+# Function codes and car types; the clients inherit them as attributes
+class SparkyProtocol:
+    FUNC_AUTO_REPORT = 0x01
+    FUNC_BEEP = 0x02
+    FUNC_PWM_SERVO = 0x03
+    FUNC_PWM_SERVO_ALL = 0x04
+    FUNC_RGB = 0x05
+    FUNC_RGB_EFFECT = 0x06
+    FUNC_REPORT_SPEED = 0x0A
+    FUNC_REPORT_IMU_RAW = 0x0B
+    FUNC_REPORT_IMU_ATT = 0x0C
+    FUNC_REPORT_ENCODER = 0x0D
+    FUNC_MOTOR = 0x10
+    FUNC_CAR_RUN = 0x11
+    FUNC_MOTION = 0x12
+    FUNC_SET_MOTOR_PID = 0x13
+    FUNC_SET_YAW_PID = 0x14
+    FUNC_SET_CAR_TYPE = 0x15
+    FUNC_UART_SERVO = 0x20
+    FUNC_UART_SERVO_ID = 0x21
+    FUNC_UART_SERVO_TORQUE = 0x22
+    FUNC_ARM_CTRL = 0x23
+    FUNC_ARM_OFFSET = 0x24
+    FUNC_AKM_DEF_ANGLE = 0x30
+    FUNC_AKM_STEER_ANGLE = 0x31
+    FUNC_REQUEST_DATA = 0x50
+    FUNC_VERSION = 0x51
+    FUNC_RESET_FLASH = 0xA0
+
+    CARTYPE_X3 = 0x01
+    CARTYPE_X3_PLUS = 0x02
+    CARTYPE_X1 = 0x04
+    CARTYPE_R2 = 0x05
+
+
+HEAD = 0xFF
+DEVICE_ID = 0xFC
+COMPLEMENT = 257 - DEVICE_ID
+# Header of the frames sent by the MCU
+RX_HEAD = bytes([HEAD, DEVICE_ID - 1])
+# Time of one byte on the wire at 115200 baud, 8N1
+BYTE_NS = 10 * 1000000000 // 115200
+
+# Payload layout of each reply/report type (little endian)
+FRAME_LAYOUT = {
+    SparkyProtocol.FUNC_REPORT_SPEED: struct.Struct('<hhhB'),
+    SparkyProtocol.FUNC_REPORT_IMU_RAW: struct.Struct('<9h'),
+    SparkyProtocol.FUNC_REPORT_IMU_ATT: struct.Struct('<3h'),
+    SparkyProtocol.FUNC_REPORT_ENCODER: struct.Struct('<4i'),
+    SparkyProtocol.FUNC_UART_SERVO: struct.Struct('<Bh'),
+    SparkyProtocol.FUNC_ARM_CTRL: struct.Struct('<6h'),
+    SparkyProtocol.FUNC_VERSION: struct.Struct('<BB'),
+    SparkyProtocol.FUNC_SET_MOTOR_PID: struct.Struct('<Bhhh'),
+    SparkyProtocol.FUNC_SET_YAW_PID: struct.Struct('<Bhhh'),
+    SparkyProtocol.FUNC_ARM_OFFSET: struct.Struct('<BB'),
+    SparkyProtocol.FUNC_AKM_DEF_ANGLE: struct.Struct('<BB'),
+}
+
+GYRO_RATIO = 1 / 3754.9
+ACCEL_RATIO = 1 / 1671.84
+
+
+# (history kind, record) of a report in the layout of REPORT_DTYPES, None for replies
+def report_record(ext_type, values, t_ns):
+    if ext_type == SparkyProtocol.FUNC_REPORT_SPEED:
+        return 'speed', (t_ns, values[0] / 1000.0, values[1] / 1000.0, values[2] / 1000.0, values[3] / 10.0)
+    if ext_type == SparkyProtocol.FUNC_REPORT_IMU_RAW:
+        return 'imu_raw', (t_ns, values[0] * GYRO_RATIO, values[1] * -GYRO_RATIO, values[2] * -GYRO_RATIO,
+                           values[3] * ACCEL_RATIO, values[4] * ACCEL_RATIO, values[5] * ACCEL_RATIO,
+                           values[6], values[7], values[8])
+    if ext_type == SparkyProtocol.FUNC_REPORT_IMU_ATT:
+        return 'imu_att', (t_ns, values[0] / 10000.0, values[1] / 10000.0, values[2] / 10000.0)
+    if ext_type == SparkyProtocol.FUNC_REPORT_ENCODER:
+        return 'encoder', (t_ns,) + values
+    return None
+
+
+# Build a command frame: head, device id, length, function, data..., checksum
+def command_frame(function, data):
+    cmd = [HEAD, DEVICE_ID, len(data) + 3, function, *data]
+    cmd.append(sum(cmd, COMPLEMENT) & 0xff)
+    return bytes(cmd)
+
+
+# Splits the received byte stream into frames and hands each decoded one to
+# on_frame(ext_type, values, t_ns), values unpacked with FRAME_LAYOUT.
+# Not thread safe: only one thread may feed at a time.
+class FrameParser:
+    def __init__(self, on_frame, debug=False):
+        self.on_frame = on_frame
+        self.debug = debug
+        self.stats = {'bytes': 0, 'frames': 0, 'checksum_errors': 0, 'short_frames': 0}
+        self.__buf = bytearray()
+        self.__last_rx_ns = 0
+
+    # Parse bytes read from the serial port at t_ns (time.monotonic_ns())
+    def feed(self, data, t_ns):
+        self.stats['bytes'] += len(data)
+        buf = self.__buf
+        buf += data
+        used = self.__parse_frames(buf, t_ns)
+        if used:
+            del buf[:used]
+
+    # Decode every complete frame in buf and return how many bytes were used.
+    # t_ns is when the end of buf was read; each frame is timestamped by
+    # backing off the wire time of the bytes that followed it.
+    def __parse_frames(self, buf, t_ns):
+        end = len(buf)
+        pos = 0
+        with memoryview(buf) as view:
+            while True:
+                start = buf.find(RX_HEAD, pos)
+                if start < 0:
+                    # Keep a trailing 0xFF, it may be the first half of a header
+                    return end - 1 if end > pos and buf[end - 1] == HEAD else end
+                if end - start < 4:
+                    return start
+                frame_end = start + 2 + buf[start + 2]
+                if frame_end < start + 5:
+                    pos = start + 1
+                    continue
+                if frame_end > end:
+                    return start
+                if sum(view[start + 2:frame_end - 1]) & 0xFF == buf[frame_end - 1]:
+                    frame_ns = max(t_ns - (end - frame_end) * BYTE_NS, self.__last_rx_ns + 1)
+                    self.__last_rx_ns = frame_ns
+                    self.stats['frames'] += 1
+                    self.__parse_data(buf[start + 3], view[start + 4:frame_end - 1], frame_ns)
+                    pos = frame_end
+                else:
+                    self.stats['checksum_errors'] += 1
+                    if self.debug:
+                        print("check sum error:", bytes(view[start:frame_end]))
+                    pos = start + 1
+
+    def __parse_data(self, ext_type, ext_data, t_ns):
+        layout = FRAME_LAYOUT.get(ext_type)
+        if layout is None:
+            return
+        if len(ext_data) < layout.size:
+            self.stats['short_frames'] += 1
+            if self.debug:
+                print("short frame:", ext_type, bytes(ext_data))
+            return
+        self.on_frame(ext_type, layout.unpack_from(ext_data), t_ns)